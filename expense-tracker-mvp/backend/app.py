@@ -3,34 +3,288 @@ Main Flask application for expense tracker backend.
 Provides REST API endpoints for receipt upload, listing, and statistics.
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, send_file
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
+import click
+import hashlib
 import os
 import json
+import threading
+import time
 import uuid
+import base64
 from datetime import datetime
-from werkzeug.utils import secure_filename
-from services.ocr_service import OCRService
+from services.ocr_service import OCRService, OCRBusyError, OCRTimeoutError
 from services.ai_parser import AIParser
+from services.llm_parser import LLMParser
+from services.item_classifier import ItemClassifier, LearnedCategorizer, load_corrections, training_set
+from services.storage import create_storage, SUMMARY_FIELDS
+from services.aggregates import summarize_month, currency_breakdown, iter_months
+from services.job_queue import JobQueue, JobWorkerPool
+from services.pipeline import process_image, build_receipt, public_receipt
+from services.models import MAX_CENTS, format_cents, parse_cents
+from services.result_cache import PipelineResultCache
+from services.image_store import ImageStore
+from services.ocr_store import OCRTextStore, migrate_inline_ocr_text
+from services.analytics import AnalyticsSnapshot, GRANULARITIES
+from services.search_index import SearchIndex
+from services.change_log import ChangeLog
+from services.fx_rates import FXRates, reconvert_receipts
+from services.file_lock import FileLock
+from services.metrics import REGISTRY, timer
+from services.profiler import SamplingProfiler
+from services.compression import ResponseCompressor
+from services import json_codec
+from concurrent.futures import ThreadPoolExecutor
 
 app = Flask(__name__)
-CORS(app)  # Enable CORS for Flutter Web
+CORS(app, expose_headers=['ETag', 'X-Change-Seq'])  # Enable CORS for Flutter Web
 
 # Configuration
 UPLOAD_FOLDER = 'uploads'
 DATA_FILE = 'data/receipts.json'
+DATABASE_FILE = 'data/receipts.db'
+LOG_FILE = 'data/receipts.jsonl'
+OCR_TEXT_FILE = 'data/ocr_text.db'  # Compressed raw OCR text, kept apart from receipts
+ANALYTICS_DIR = 'data/analytics'  # Columnar snapshot for /stats/by-* queries
+SEARCH_INDEX_FILE = 'data/search.db'  # Full-text index for /search
+CHANGE_LOG_FILE = 'data/changes.db'  # Change sequence for /receipts/changes and ETags
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'sqlite')  # 'sqlite', 'jsonl' or 'json'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+MAX_PAGE_SIZE = 200  # Upper bound for ?limit= on GET /receipts and /search
+SEARCH_PAGE_SIZE = 20  # Default ?limit= on GET /search
+CHANGES_PAGE_SIZE = 1000  # Default and maximum ?limit= on GET /receipts/changes
+MAX_STATS_MONTHS = 120  # Upper bound for the /stats/months range
+
+# Multi-currency: receipts are converted to BASE_CURRENCY when stored, using
+# daily rates from a local CSV (date,currency,rate; rate = units of currency
+# per one FX_QUOTE_CURRENCY, as published by the ECB). Stats report converted
+# totals unless ?currency= asks for one currency's original amounts
+BASE_CURRENCY = os.environ.get('BASE_CURRENCY', 'USD')
+FX_RATES_FILE = os.environ.get('FX_RATES_FILE', 'data/fx_rates.csv')
+FX_QUOTE_CURRENCY = os.environ.get('FX_QUOTE_CURRENCY', 'EUR')
+FX_STATE_FILE = 'data/fx_state.json'  # Rates/base currency used for stored conversions
+
+# Background processing: in 'async' mode uploads return 202 with a job id
+# and OCR/parsing runs in a worker pool
+PROCESSING_MODE = os.environ.get('PROCESSING_MODE', 'sync')  # 'sync' or 'async'
+JOB_DATABASE_FILE = 'data/jobs.db'
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+# With several server processes (see gunicorn.conf.py) set a lease: a job
+# still processing after this many seconds is assumed lost and retried
+JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', 0)) or None
+
+# OCR engine: 'mock' or 'tesseract'. With OCR_WORKERS > 0 OCR runs in a
+# process pool; at most OCR_MAX_PENDING images are in progress at once
+# (uploads beyond that get 429) and each one is limited to OCR_TIMEOUT seconds
+OCR_BACKEND = os.environ.get('OCR_BACKEND', 'mock')
+OCR_WORKERS = int(os.environ.get('OCR_WORKERS', 0))
+OCR_MAX_PENDING = int(os.environ.get('OCR_MAX_PENDING', 0)) or None
+OCR_TIMEOUT = 30
+OCR_TARGET_DPI = 300
+
+# Item categories come from the model trained by `flask --app app
+# train-categorizer` once it exists (loaded on first use), and from the
+# keyword rules in services/category_rules.cfg before that and whenever the
+# model is less confident than CATEGORY_MIN_CONFIDENCE. Corrections are
+# `name,category` rows in CATEGORY_CORRECTIONS_FILE
+CATEGORY_MODEL_FILE = 'data/category_model.npz'
+CATEGORY_CORRECTIONS_FILE = 'data/category_corrections.csv'
+CATEGORY_MIN_CONFIDENCE = 0.6
+CATEGORY_CACHE_SIZE = 50000  # Normalized item names with a cached category
+
+# Receipt parsing: 'rules' (AIParser) or 'llm' (LLMParser: an OpenAI-compatible
+# chat completions API at LLM_API_URL, with the rules as fallback). Receipts
+# parsed at the same time are sent LLM_BATCH_SIZE per request, at most
+# LLM_MAX_CONCURRENCY requests at once; a receipt without a result after
+# LLM_TIMEOUT seconds is parsed by the rules. `python -m services.mock_llm`
+# runs a local stand-in API
+PARSER_BACKEND = os.environ.get('PARSER_BACKEND', 'rules')
+LLM_API_URL = os.environ.get('LLM_API_URL', 'http://localhost:8089/v1')
+LLM_API_KEY = os.environ.get('LLM_API_KEY') or None
+LLM_MODEL = os.environ.get('LLM_MODEL', 'gpt-4o-mini')
+LLM_MAX_CONCURRENCY = int(os.environ.get('LLM_MAX_CONCURRENCY', 4))
+LLM_BATCH_SIZE = int(os.environ.get('LLM_BATCH_SIZE', 8))
+LLM_BATCH_WAIT = 0.05  # Seconds a batch waits for more receipts
+LLM_TIMEOUT = int(os.environ.get('LLM_TIMEOUT', 20))
+LLM_RETRIES = 2
+LLM_CACHE_SIZE = 10000  # Parse results cached by OCR text hash
+
+# Batch uploads: OCR/parsing fan-out pool size and files per request
+BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', 4))
+MAX_BATCH_FILES = 50
+
+# Uploads are streamed to disk in chunks and stored by content hash as a
+# downscaled working copy plus a thumbnail. Originals are kept in
+# ORIGINALS_FOLDER when set, otherwise discarded. OCR/parse results are
+# cached per image hash
+UPLOAD_CHUNK_SIZE = 64 * 1024
+MAX_IMAGE_BYTES = 16 * 1024 * 1024
+ORIGINALS_FOLDER = os.environ.get('ORIGINALS_FOLDER') or None
+WORKING_IMAGE_MAX_SIDE = 1600  # Shorter side of the working copy in pixels
+THUMBNAIL_SIZE = 320
+
+# Stored images never change (they are keyed by content hash), so clients may
+# cache them for a year. Set USE_X_SENDFILE=1 behind nginx/Apache to let the
+# web server send image files itself
+IMAGE_CACHE_MAX_AGE = 365 * 24 * 3600
+RESULT_CACHE_MAX_ENTRIES = 10000
+RESULT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# GET /metrics reports latency per route, time per processing stage and
+# payload sizes in Prometheus text format. Each server process counts its
+# own requests; with METRICS_DIR set (gunicorn.conf.py does) processes
+# share snapshots there so a scrape of any worker covers all of them
+METRICS_DIR = os.environ.get('METRICS_DIR') or None
+
+# Sampling profiler: with PROFILE_TOKEN set, a request sent with the header
+# "X-Profile: <token>" is profiled. Its collapsed stacks are written to
+# PROFILE_DIR and can be fetched from GET /debug/profiles/<X-Profile-Id>
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN') or None
+PROFILE_DIR = 'data/profiles'
+PROFILE_INTERVAL = 0.002  # Seconds between stack samples
+
+# JSON and text responses of at least COMPRESS_MIN_BYTES are compressed
+# with Brotli (if the brotli package is installed) or gzip, whichever the
+# client accepts. Set RESPONSE_COMPRESSION=0 when a reverse proxy compresses
+RESPONSE_COMPRESSION = os.environ.get('RESPONSE_COMPRESSION', '1') != '0'
+COMPRESS_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+
+# receipts.json (json and jsonl backends) is written compact; set
+# STORAGE_JSON_INDENT=1 to indent it for reading by hand
+STORAGE_JSON_INDENT = os.environ.get('STORAGE_JSON_INDENT') == '1'
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
-
-# Initialize services
-ocr_service = OCRService()
-ai_parser = AIParser()
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE') == '1'
 
 # Ensure required directories exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs('data', exist_ok=True)
+if PROFILE_TOKEN:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+if METRICS_DIR:
+    REGISTRY.share_directory(METRICS_DIR)
+
+# Initialize services
+ocr_service = OCRService(OCR_BACKEND, workers=OCR_WORKERS, timeout=OCR_TIMEOUT,
+                         max_pending=OCR_MAX_PENDING, target_dpi=OCR_TARGET_DPI)
+ai_parser = AIParser(LearnedCategorizer(CATEGORY_MODEL_FILE, min_confidence=CATEGORY_MIN_CONFIDENCE,
+                                         cache_size=CATEGORY_CACHE_SIZE))
+receipt_parser = ai_parser
+if PARSER_BACKEND == 'llm':
+    receipt_parser = LLMParser(LLM_API_URL, LLM_MODEL, ai_parser, api_key=LLM_API_KEY,
+                               max_concurrency=LLM_MAX_CONCURRENCY, batch_size=LLM_BATCH_SIZE,
+                               batch_wait=LLM_BATCH_WAIT, timeout=LLM_TIMEOUT, retries=LLM_RETRIES,
+                               cache_size=LLM_CACHE_SIZE)
+fx_rates = FXRates(FX_RATES_FILE, base_currency=BASE_CURRENCY, quote_currency=FX_QUOTE_CURRENCY)
+
+# Held (by every process) from the storage write of new receipts until their
+# analytics rows and search documents are added, so a startup check or
+# rebuild never sees one without the others
+store_lock = FileLock('data/store.lock')
+
+# Server workers start concurrently; run one-time data migrations in one
+# process at a time so the others find them already done
+with FileLock('data/startup.lock'):
+    storage = create_storage(STORAGE_BACKEND, json_path=DATA_FILE, db_path=DATABASE_FILE,
+                             log_path=LOG_FILE, indent=STORAGE_JSON_INDENT)
+    ocr_store = OCRTextStore(OCR_TEXT_FILE)
+    migrate_inline_ocr_text(storage, ocr_store)
+    reconverted = reconvert_receipts(storage, fx_rates, FX_STATE_FILE)
+    analytics = AnalyticsSnapshot(ANALYTICS_DIR)
+    search_index = SearchIndex(SEARCH_INDEX_FILE)
+    with store_lock:
+        # A receipt count that differs from storage means a crash cut
+        # store_receipts() short between the storage write and the
+        # analytics append or the indexing
+        receipt_count = storage.count()
+        if reconverted or not analytics.is_current(receipt_count):
+            analytics.rebuild(storage.load_all())
+        if not search_index.is_current(receipt_count):
+            search_index.rebuild(storage.load_all(), ocr_store.get_many)
+    change_log = ChangeLog(CHANGE_LOG_FILE)
+    if change_log.is_empty() and receipt_count:
+        # Existing receipts become the first changes, in upload order
+        change_log.record(storage.load_all())
+
+job_queue = JobQueue(JOB_DATABASE_FILE, lease_seconds=JOB_LEASE_SECONDS)
+batch_executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix='batch')
+result_cache = PipelineResultCache(RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_MAX_BYTES)
+image_store = ImageStore(UPLOAD_FOLDER, originals_dir=ORIGINALS_FOLDER, max_bytes=MAX_IMAGE_BYTES,
+                         chunk_size=UPLOAD_CHUNK_SIZE, working_max_side=WORKING_IMAGE_MAX_SIDE,
+                         thumb_size=THUMBNAIL_SIZE)
+compressor = ResponseCompressor(min_size=COMPRESS_MIN_BYTES, gzip_level=GZIP_LEVEL,
+                                brotli_quality=BROTLI_QUALITY)
+
+
+class FastJSONProvider(JSONProvider):
+    """
+    JSON provider backed by services/json_codec (orjson when installed).
+
+    Output is always compact and keeps dict order; keyword arguments to
+    dumps() are ignored. Responses are encoded straight to bytes, and
+    serialization time and output size are recorded.
+    """
+
+    mimetype = 'application/json'
+
+    def dumps(self, obj, **kwargs):
+        return json_codec.dumps(obj)
+
+    def loads(self, s, **kwargs):
+        return json_codec.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        with timer('json_serialize'):
+            data = json_codec.encode(obj)
+        REGISTRY.inc('json_serialized_bytes_total', len(data))
+        return self._app.response_class(data, mimetype=self.mimetype)
+
+
+app.json = FastJSONProvider(app)
+
+
+@app.before_request
+def start_request_metrics():
+    """Start timing the request and, if asked for, profiling it."""
+    g.request_start = time.perf_counter()
+    if (PROFILE_TOKEN and request.headers.get('X-Profile') == PROFILE_TOKEN
+            and request.endpoint != 'get_profile'):
+        g.profiler = SamplingProfiler(threading.get_ident(), interval=PROFILE_INTERVAL)
+        g.profiler.start()
+
+
+@app.after_request
+def record_request_metrics(response):
+    """Record latency and payload sizes per route and save a running profile."""
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    if 'request_start' in g:
+        REGISTRY.observe('http_request_duration_seconds', time.perf_counter() - g.request_start,
+                         route=route, method=request.method, status=str(response.status_code))
+    REGISTRY.inc('http_request_bytes_total', request.content_length or 0, route=route)
+    REGISTRY.inc('http_response_bytes_total', response.content_length or 0, route=route)
+
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.stop()
+        profile_id = uuid.uuid4().hex
+        profiler.write(os.path.join(PROFILE_DIR, f'{profile_id}.folded'))
+        response.headers['X-Profile-Id'] = profile_id
+        response.headers['X-Profile-Samples'] = str(profiler.samples)
+    return response
+
+
+@app.after_request
+def compress_response(response):
+    """Compress large JSON and text responses (runs before the metrics hook, so sizes are as sent)."""
+    if RESPONSE_COMPRESSION:
+        compressor.compress(response, request.accept_encodings)
+    return response
 
 
 def allowed_file(filename):
@@ -38,24 +292,243 @@ def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
-def load_receipts():
-    """Load receipts from JSON file."""
-    if not os.path.exists(DATA_FILE):
-        return []
-    with open(DATA_FILE, 'r') as f:
-        return json.load(f)
+def encode_cursor(key):
+    """Encode an (uploaded_at, id) pagination key as an opaque cursor string."""
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Decode a cursor string back into an (uploaded_at, id) key."""
+    try:
+        uploaded_at, receipt_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return (str(uploaded_at), str(receipt_id))
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+
+def parse_list_filters(args):
+    """
+    Parse GET /receipts filter query parameters.
+
+    Raises:
+        ValueError: If a date or amount parameter is malformed
+    """
+    filters = {}
+    for key in ('store', 'currency'):
+        if args.get(key):
+            filters[key] = args[key]
+    for key in ('date_from', 'date_to'):
+        if args.get(key):
+            # Validate format (YYYY-MM-DD) but keep the ISO string for comparison
+            datetime.strptime(args[key], '%Y-%m-%d')
+            filters[key] = args[key]
+    for key in ('min_total', 'max_total'):
+        if args.get(key):
+            # Compare exactly in integer cents, which must fit SQLite's INTEGER
+            try:
+                filters[key] = parse_cents(args[key])
+            except ValueError:
+                raise ValueError(f'{key} must be a finite number of at most '
+                                 f'{format_cents(MAX_CENTS)}') from None
+    return filters
+
+
+def parse_date_range(args):
+    """
+    Parse optional from/to query parameters (inclusive YYYY-MM-DD dates).
+
+    Raises:
+        ValueError: If a date is malformed or the range is reversed
+    """
+    date_from = args.get('from') or None
+    date_to = args.get('to') or None
+    for value in (date_from, date_to):
+        if value is not None:
+            datetime.strptime(value, '%Y-%m-%d')
+    if date_from and date_to and date_from > date_to:
+        raise ValueError("'from' must not be after 'to'")
+    return date_from, date_to
+
+
+def parse_year_month(value):
+    """
+    Parse a YYYY-MM string into a (year, month) tuple.
+
+    Raises:
+        ValueError: If the value is not a valid month
+    """
+    parsed = datetime.strptime(value, '%Y-%m')
+    return (parsed.year, parsed.month)
+
+
+def save_upload(file):
+    """
+    Validate an uploaded file and store it by content hash.
+
+    The upload is streamed to disk while its SHA-256 is computed and its
+    magic bytes are checked, then stored as uploads/<sha256>.jpg (a
+    downscaled working copy) plus a thumbnail. Identical images are
+    stored once.
+
+    Returns:
+        tuple: (content_hash, saved_filename, filepath)
+
+    Raises:
+        ValueError: If no file was selected, the type is not allowed or the
+            content is not a valid image
+    """
+    if file.filename == '':
+        raise ValueError('No file selected')
+
+    if not allowed_file(file.filename):
+        raise ValueError('Invalid file type. Allowed: png, jpg, jpeg, gif')
+
+    return image_store.save(file.stream)
 
 
-def save_receipts(receipts):
-    """Save receipts to JSON file."""
-    with open(DATA_FILE, 'w') as f:
-        json.dump(receipts, f, indent=2)
+def run_pipeline(filepath, content_hash=None, block=False):
+    """Run OCR and parsing for an image, reusing cached results by content hash."""
+    return process_image(filepath, ocr_service, receipt_parser, result_cache=result_cache,
+                         content_hash=content_hash, block=block)
+
+
+def store_receipts(receipts, ocr_texts):
+    """
+    Persist new receipts: OCR text, receipt records, analytics rows, the
+    search index and, last, the change log.
+
+    Receipts whose id is already stored are skipped by storage and by the
+    derived stores, so storing the same receipt twice is harmless. The OCR
+    text of receipts skipped as duplicates of a stored image is dropped.
+
+    Args:
+        receipts: Receipt dicts from build_receipt()
+        ocr_texts: (receipt_id, ocr_text) pairs
+
+    Returns:
+        list: The receipts that were added
+    """
+    # OCR text goes in first so that no stored receipt lacks it
+    with timer('ocr_store_write'):
+        ocr_store.put_many(ocr_texts)
+    with store_lock:
+        with timer('storage_write', backend=STORAGE_BACKEND):
+            receipts = storage.add_receipts(receipts)
+        added_ids = {r['id'] for r in receipts}
+        # Drop the text of duplicates that were skipped, unless their id
+        # was skipped because it is already stored
+        orphan_ids = [receipt_id for receipt_id, _ in ocr_texts
+                      if receipt_id not in added_ids and storage.get_receipt(receipt_id) is None]
+        if orphan_ids:
+            ocr_store.delete_many(orphan_ids)
+        if not receipts:
+            return receipts
+        with timer('analytics_append'):
+            analytics.append(receipts)
+        ocr_texts = [(receipt_id, text) for receipt_id, text in ocr_texts if receipt_id in added_ids]
+        with timer('search_index_write'):
+            search_index.add(receipts, ocr_texts)
+    with timer('change_log_write'):
+        change_log.record(receipts)
+    return receipts
+
+
+def json_with_etag(build, *key):
+    """
+    Respond with build()'s result as JSON, tagged with the data version.
+
+    The weak ETag combines the current change sequence with the request
+    path and query, the FX settings and any extra key values (such as a
+    defaulted month). The sequence is read before build() runs, so the
+    body is at least as new as its tag. A matching If-None-Match gets an
+    empty 304 without calling build().
+
+    Args:
+        build: Function returning the JSON-serializable response body
+        *key: Values the response depends on besides the query string
+    """
+    seq = change_log.current_seq()
+    params = [request.path, sorted(request.args.items(multi=True)), fx_rates.fingerprint(), *key]
+    digest = hashlib.sha1(json.dumps(params).encode()).hexdigest()[:16]
+    etag = f'{seq}-{digest}'
+
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag, weak=True)
+    response.headers['X-Change-Seq'] = str(seq)
+    # Cache, but check with the server before every reuse
+    response.cache_control.no_cache = True
+    return response
+
+
+def month_summary(year, month, currency=None):
+    """
+    Build the stats for one month from the materialized aggregates.
+
+    Without a currency, amounts are converted to BASE_CURRENCY and the
+    response lists each currency's original totals under by_currency;
+    unconverted_count counts receipts without an FX rate. With a
+    currency, only that currency's receipts are counted, unconverted.
+    """
+    totals, categories = storage.month_rows(year, month)
+    if currency:
+        return summarize_month(year, month, totals, categories, currency=currency)
+
+    converted_totals, converted_categories = storage.converted_month_rows(year, month)
+    summary = summarize_month(year, month, converted_totals, converted_categories,
+                              currency=fx_rates.base_currency)
+    summary['by_currency'] = currency_breakdown(totals)
+    summary['unconverted_count'] = sum(count for _, count, _ in totals) - summary['receipt_count']
+    return summary
+
+
+def busy_response():
+    """429 response for uploads rejected because OCR is at capacity."""
+    response = jsonify({'error': 'OCR service is busy, please retry shortly'})
+    response.headers['Retry-After'] = '5'
+    return response, 429
+
+
+def process_upload_job(payload):
+    """
+    Job handler: process an uploaded image and store the receipt.
+
+    Safe to re-run after a restart or a reclaimed lease: an already
+    stored receipt is not processed again, and one stored by another run
+    in the meantime is kept. If another upload of the same image was
+    stored first, the job finishes with that receipt.
+    """
+    receipt_id = payload['receipt_id']
+    content_hash = payload.get('content_hash')
+    existing = storage.get_receipt(receipt_id) or (content_hash and storage.find_by_hash(content_hash))
+    if not existing:
+        filepath = image_store.path(payload['filename'])
+        # Background jobs wait for OCR capacity instead of failing
+        ocr_text, parsed_data = run_pipeline(filepath, content_hash, block=True)
+        receipt = build_receipt(receipt_id, payload['filename'], parsed_data,
+                                uploaded_at=payload['uploaded_at'],
+                                content_hash=content_hash, fx_rates=fx_rates)
+        if store_receipts([receipt], [(receipt_id, ocr_text)]):
+            return {'receipt_id': receipt_id}
+        existing = storage.get_receipt(receipt_id) or storage.find_by_hash(content_hash)
+    return {'receipt_id': existing['id']}
 
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    """Health check endpoint."""
-    return jsonify({'status': 'healthy', 'service': 'expense-tracker-api'})
+    """Health check endpoint (includes receipt, OCR/parse, category cache, LLM and job counters)."""
+    response = {'status': 'healthy', 'service': 'expense-tracker-api'}
+    cache_stats = storage.cache_stats()
+    if cache_stats is not None:
+        response['cache'] = cache_stats
+    response['result_cache'] = result_cache.stats()
+    response['categorizer'] = ai_parser.categorizer.stats()
+    if receipt_parser is not ai_parser:
+        response['llm'] = receipt_parser.stats()
+    response['jobs'] = job_queue.counts()
+    return jsonify(response)
 
 
 @app.route('/receipt/upload', methods=['POST'])
@@ -63,95 +536,261 @@ def upload_receipt():
     """
     Upload a receipt image and process it.
 
-    Returns structured receipt data with OCR and AI parsing.
+    Returns structured receipt data with OCR and AI parsing (201), or in
+    async processing mode a job id to poll at GET /jobs/<id> (202). If the
+    same image was uploaded before, the existing receipt is returned (200)
+    without running OCR again.
     """
     if 'file' not in request.files:
         return jsonify({'error': 'No file provided'}), 400
 
     file = request.files['file']
 
-    if file.filename == '':
-        return jsonify({'error': 'No file selected'}), 400
-
-    if not allowed_file(file.filename):
-        return jsonify({'error': 'Invalid file type. Allowed: png, jpg, jpeg, gif'}), 400
+    try:
+        content_hash, saved_filename, filepath = save_upload(file)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
     try:
-        # Generate unique filename
+        # Duplicate upload: return the receipt already created for this image
+        existing = storage.find_by_hash(content_hash)
+        if existing:
+            return jsonify(public_receipt(existing)), 200
+
         receipt_id = str(uuid.uuid4())
-        filename = secure_filename(file.filename)
-        ext = filename.rsplit('.', 1)[1].lower()
-        saved_filename = f"{receipt_id}.{ext}"
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], saved_filename)
-
-        # Save file
-        file.save(filepath)
-
-        # Step 1: OCR - Extract text from image
-        ocr_text = ocr_service.extract_text(filepath)
-
-        # Step 2: AI Parsing - Convert text to structured data
-        parsed_data = ai_parser.parse_receipt(ocr_text)
-
-        # Create receipt record
-        receipt = {
-            'id': receipt_id,
-            'filename': saved_filename,
-            'uploaded_at': datetime.now().isoformat(),
-            'store': parsed_data['store'],
-            'date': parsed_data['date'],
-            'items': parsed_data['items'],
-            'total': parsed_data['total'],
-            'currency': parsed_data.get('currency', 'USD'),  # Store currency
-            'ocr_text': ocr_text  # Store raw OCR for debugging
-        }
 
-        # Save to database
-        receipts = load_receipts()
-        receipts.append(receipt)
-        save_receipts(receipts)
+        if PROCESSING_MODE == 'async':
+            # Queue OCR + parsing and let the client poll for the result
+            job_id = job_queue.enqueue('upload', {
+                'receipt_id': receipt_id,
+                'filename': saved_filename,
+                'content_hash': content_hash,
+                'uploaded_at': datetime.now().isoformat()
+            })
+            response = jsonify({'job_id': job_id, 'status': 'queued', 'status_url': f'/jobs/{job_id}'})
+            response.headers['Location'] = f'/jobs/{job_id}'
+            return response, 202
+
+        # OCR + AI parsing
+        ocr_text, parsed_data = run_pipeline(filepath, content_hash)
+
+        # Create receipt record and save to database
+        receipt = build_receipt(receipt_id, saved_filename, parsed_data, content_hash=content_hash,
+                                fx_rates=fx_rates)
+        if not store_receipts([receipt], [(receipt_id, ocr_text)]):
+            # A concurrent upload of the same image was stored first
+            return jsonify(public_receipt(storage.find_by_hash(content_hash))), 200
 
         # Return without OCR text in response (too verbose)
-        response = {k: v for k, v in receipt.items() if k != 'ocr_text'}
-        return jsonify(response), 201
+        return jsonify(public_receipt(receipt)), 201
+
+    except OCRBusyError:
+        return busy_response()
+
+    except OCRTimeoutError as e:
+        return jsonify({'error': f'Processing failed: {str(e)}'}), 504
 
     except Exception as e:
         return jsonify({'error': f'Processing failed: {str(e)}'}), 500
 
 
+@app.route('/receipts/batch', methods=['POST'])
+def upload_receipt_batch():
+    """
+    Upload and process many receipt images in one request.
+
+    Expects multipart field 'files' (repeated). OCR and parsing fan out
+    across a bounded worker pool, and all successful receipts are stored in
+    one storage write. Failures are reported per file without aborting
+    the batch. Images uploaded before (or twice in the batch) return the
+    existing receipt with status 200.
+
+    Returns per-file results in upload order (status 201 created, 200 duplicate,
+    400/500 failed):
+        {"results": [{"filename": str, "status": int, "receipt"|"error": ...}],
+         "created": int, "failed": int}
+    """
+    files = request.files.getlist('files')
+
+    if not files:
+        return jsonify({'error': 'No files provided'}), 400
+
+    if len(files) > MAX_BATCH_FILES:
+        return jsonify({'error': f'Too many files (max {MAX_BATCH_FILES})'}), 400
+
+    # Save files first (request data is only readable on this thread)
+    results = []
+    pending = []
+    duplicates = []
+    first_by_hash = {}
+    for file in files:
+        result = {'filename': file.filename}
+        results.append(result)
+        try:
+            content_hash, saved_filename, filepath = save_upload(file)
+            existing = storage.find_by_hash(content_hash)
+        except ValueError as e:
+            result.update(status=400, error=str(e))
+            continue
+        except Exception as e:
+            result.update(status=500, error=f'Processing failed: {str(e)}')
+            continue
+
+        if existing:
+            result.update(status=200, receipt=public_receipt(existing))
+        elif content_hash in first_by_hash:
+            duplicates.append((result, first_by_hash[content_hash]))
+        else:
+            first_by_hash[content_hash] = result
+            future = batch_executor.submit(run_pipeline, filepath, content_hash)
+            pending.append((result, content_hash, saved_filename, future))
+
+    # Collect OCR + parsing results
+    receipts = []
+    ocr_texts = []
+    for result, content_hash, saved_filename, future in pending:
+        try:
+            ocr_text, parsed_data = future.result()
+        except OCRBusyError:
+            result.update(status=429, error='OCR service is busy, please retry shortly')
+            continue
+        except OCRTimeoutError as e:
+            result.update(status=504, error=f'Processing failed: {str(e)}')
+            continue
+        except Exception as e:
+            result.update(status=500, error=f'Processing failed: {str(e)}')
+            continue
+        receipt = build_receipt(str(uuid.uuid4()), saved_filename, parsed_data,
+                                content_hash=content_hash, fx_rates=fx_rates)
+        receipts.append((result, receipt))
+        ocr_texts.append((receipt['id'], ocr_text))
+
+    # Commit all receipts in one write
+    try:
+        added = store_receipts([receipt for _, receipt in receipts], ocr_texts) if receipts else []
+    except Exception as e:
+        return jsonify({'error': f'Failed to save receipts: {str(e)}'}), 500
+
+    added_ids = {receipt['id'] for receipt in added}
+    for result, receipt in receipts:
+        if receipt['id'] in added_ids:
+            result.update(status=201, receipt=public_receipt(receipt))
+        else:
+            # A concurrent upload of the same image was stored first
+            existing = storage.find_by_hash(receipt['content_hash'])
+            result.update(status=200, receipt=public_receipt(existing))
+
+    # Repeats within the batch share the first copy's outcome
+    for result, first in duplicates:
+        if first['status'] < 400:
+            result.update(status=200, receipt=first['receipt'])
+        else:
+            result.update(status=first['status'], error=first['error'])
+
+    return jsonify({
+        'results': results,
+        'created': len(added),
+        'failed': sum(1 for r in results if r['status'] >= 400)
+    }), 200
+
+
 @app.route('/receipts', methods=['GET'])
 def get_receipts():
     """
-    Get all receipts with basic information.
+    Get receipts with basic information.
 
-    Returns list of receipts sorted by date (newest first).
+    Returns receipts sorted by upload date (newest first).
+
+    Query parameters (all optional):
+        limit: Page size (max MAX_PAGE_SIZE). When limit or cursor is given the
+            response is {"receipts": [...], "next_cursor": str|null} instead
+            of a plain list
+        cursor: next_cursor value from the previous page
+        fields: Comma-separated subset of summary fields to return
+        store, currency: Exact match (store is case-insensitive)
+        date_from, date_to: Inclusive receipt date range (YYYY-MM-DD)
+        min_total, max_total: Inclusive total range
+
+    Responses carry an ETag and answer a matching If-None-Match with 304.
     """
     try:
-        receipts = load_receipts()
+        paginated = 'limit' in request.args or 'cursor' in request.args
+        limit = None
+        cursor = None
+        fields = None
+        try:
+            filters = parse_list_filters(request.args)
+            if paginated:
+                limit = min(int(request.args.get('limit', MAX_PAGE_SIZE)), MAX_PAGE_SIZE)
+                if limit < 1:
+                    raise ValueError('limit must be positive')
+            if request.args.get('cursor'):
+                cursor = decode_cursor(request.args['cursor'])
+            if request.args.get('fields'):
+                fields = [f.strip() for f in request.args['fields'].split(',') if f.strip()]
+                unknown = [f for f in fields if f not in SUMMARY_FIELDS]
+                if unknown:
+                    raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        except ValueError as e:
+            return jsonify({'error': f'Invalid query: {str(e)}'}), 400
+
+        def build():
+            # Simplified list (without full items and OCR text)
+            simplified, next_key = storage.query_summaries(filters=filters, limit=limit, cursor=cursor)
+
+            if fields:
+                simplified = [{f: s[f] for f in fields} for s in simplified]
 
-        # Sort by upload date, newest first
-        receipts.sort(key=lambda x: x.get('uploaded_at', ''), reverse=True)
+            if not paginated:
+                return simplified
 
-        # Return simplified list (without full items and OCR text)
-        simplified = [
-            {
-                'id': r['id'],
-                'store': r['store'],
-                'date': r['date'],
-                'total': r['total'],
-                'currency': r.get('currency', 'USD'),
-                'uploaded_at': r['uploaded_at'],
-                'item_count': len(r.get('items', []))
+            return {
+                'receipts': simplified,
+                'next_cursor': encode_cursor(next_key) if next_key else None
             }
-            for r in receipts
-        ]
 
-        return jsonify(simplified), 200
+        return json_with_etag(build)
 
     except Exception as e:
         return jsonify({'error': f'Failed to load receipts: {str(e)}'}), 500
 
 
+@app.route('/receipts/changes', methods=['GET'])
+def get_receipt_changes():
+    """
+    Get receipts created, updated or deleted after a change sequence number.
+
+    Query parameters:
+        since: next_since from the previous call (default 0: every receipt)
+        limit: Maximum number of changes (default and max CHANGES_PAGE_SIZE)
+
+    Returns {"changes": [...], "next_since": int, "has_more": bool}, oldest
+    change first. Each change has seq, op ('created', 'updated' or
+    'deleted') and id, plus the receipt summary unless deleted. Call again
+    with next_since while has_more is true. A since ahead of the change
+    log (the server's data was reset) gets 410; sync again from 0.
+    """
+    try:
+        try:
+            since = int(request.args.get('since', 0))
+            limit = min(int(request.args.get('limit', CHANGES_PAGE_SIZE)), CHANGES_PAGE_SIZE)
+            if since < 0:
+                raise ValueError('since must not be negative')
+            if limit < 1:
+                raise ValueError('limit must be positive')
+        except ValueError as e:
+            return jsonify({'error': f'Invalid query: {str(e)}'}), 400
+
+        if since > change_log.current_seq():
+            return jsonify({'error': 'since is ahead of the change log, sync again from 0'}), 410
+
+        changes, next_since, has_more = change_log.changes(since, limit)
+        return jsonify({'changes': changes, 'next_since': next_since, 'has_more': has_more}), 200
+
+    except Exception as e:
+        return jsonify({'error': f'Failed to load changes: {str(e)}'}), 500
+
+
 @app.route('/receipts/<receipt_id>', methods=['GET'])
 def get_receipt_detail(receipt_id):
     """
@@ -160,80 +799,414 @@ def get_receipt_detail(receipt_id):
     Returns full receipt data including all items.
     """
     try:
-        receipts = load_receipts()
-
         # Find receipt by ID
-        receipt = next((r for r in receipts if r['id'] == receipt_id), None)
+        receipt = storage.get_receipt(receipt_id)
 
         if not receipt:
             return jsonify({'error': 'Receipt not found'}), 404
 
         # Return without OCR text
-        response = {k: v for k, v in receipt.items() if k != 'ocr_text'}
-        return jsonify(response), 200
+        return jsonify(public_receipt(receipt)), 200
 
     except Exception as e:
         return jsonify({'error': f'Failed to load receipt: {str(e)}'}), 500
 
 
+@app.route('/receipts/<receipt_id>/image', methods=['GET'])
+def get_receipt_image(receipt_id):
+    """
+    Get the stored image of a receipt.
+
+    Query parameters:
+        size: 'thumb' (list thumbnail) or 'full' (working copy, default)
+
+    Responses carry a strong ETag and long-lived Cache-Control, answer
+    If-None-Match with 304 and support byte ranges (206).
+    """
+    size = request.args.get('size', 'full')
+    if size not in ('thumb', 'full'):
+        return jsonify({'error': "Invalid query: size must be 'thumb' or 'full'"}), 400
+
+    try:
+        receipt = storage.get_receipt(receipt_id)
+
+        if not receipt:
+            return jsonify({'error': 'Receipt not found'}), 404
+
+        if size == 'thumb':
+            path = image_store.ensure_thumbnail(receipt['filename'])
+        else:
+            path = image_store.path(receipt['filename'])
+        if path is None or not os.path.exists(path):
+            return jsonify({'error': 'Image not found'}), 404
+
+        # Content-addressed files only change if regenerated, which
+        # also changes their mtime and usually their size
+        stat = os.stat(path)
+        etag = f"{receipt.get('content_hash') or receipt_id}-{size}-{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+        response = send_file(os.path.abspath(path), conditional=True, etag=etag,
+                              last_modified=stat.st_mtime)
+        response.cache_control.no_cache = None
+        response.cache_control.private = True
+        response.cache_control.max_age = IMAGE_CACHE_MAX_AGE
+        response.cache_control.immutable = True
+        return response
+
+    except Exception as e:
+        return jsonify({'error': f'Failed to load image: {str(e)}'}), 500
+
+
+@app.route('/receipts/<receipt_id>/ocr', methods=['GET'])
+def get_receipt_ocr(receipt_id):
+    """
+    Get the raw OCR text of a receipt (debugging aid).
+
+    OCR text is kept out of receipt records and only loaded here.
+    """
+    try:
+        if storage.get_receipt(receipt_id) is None:
+            return jsonify({'error': 'Receipt not found'}), 404
+
+        ocr_text = ocr_store.get(receipt_id)
+        if ocr_text is None:
+            return jsonify({'error': 'OCR text not found'}), 404
+
+        return jsonify({'id': receipt_id, 'ocr_text': ocr_text}), 200
+
+    except Exception as e:
+        return jsonify({'error': f'Failed to load OCR text: {str(e)}'}), 500
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    """
+    Get the status of an asynchronous upload job.
+
+    Returns status (queued, processing, done, failed), plus the receipt
+    once done or the error message if processing failed.
+    """
+    try:
+        job = job_queue.get(job_id)
+
+        if not job:
+            return jsonify({'error': 'Job not found'}), 404
+
+        response = {
+            'id': job['id'],
+            'status': job['status'],
+            'created_at': job['created_at'],
+            'updated_at': job['updated_at']
+        }
+        if job['status'] == 'done':
+            receipt = storage.get_receipt(job['result']['receipt_id'])
+            response['receipt'] = public_receipt(receipt) if receipt else None
+        elif job['status'] == 'failed':
+            response['error'] = job['error']
+
+        return jsonify(response), 200
+
+    except Exception as e:
+        return jsonify({'error': f'Failed to load job: {str(e)}'}), 500
+
+
 @app.route('/stats/month', methods=['GET'])
 def get_monthly_stats():
     """
-    Get spending statistics for the current month.
+    Get spending statistics for one month (current month by default).
 
-    Returns total spent and breakdown by category.
+    Query parameters (optional):
+        year, month: Month to report
+        currency: Report only receipts in this currency, in original amounts
+
+    Returns total spent and breakdown by category, converted to the base
+    currency unless a currency is given, served from the materialized
+    monthly aggregates. Responses carry an ETag (see json_with_etag).
     """
     try:
-        receipts = load_receipts()
-
-        # Get current month/year
         now = datetime.now()
-        current_month = now.month
-        current_year = now.year
+        try:
+            year = int(request.args.get('year', now.year))
+            month = int(request.args.get('month', now.month))
+            if not 1 <= month <= 12:
+                raise ValueError('month must be 1-12')
+        except ValueError as e:
+            return jsonify({'error': f'Invalid query: {str(e)}'}), 400
 
-        # Filter receipts from current month
-        month_receipts = []
-        for r in receipts:
-            try:
-                # Parse receipt date (format: YYYY-MM-DD)
-                receipt_date = datetime.fromisoformat(r['date'])
-                if receipt_date.month == current_month and receipt_date.year == current_year:
-                    month_receipts.append(r)
-            except (ValueError, KeyError):
-                # Skip receipts with invalid dates
-                continue
-
-        # Calculate total spent
-        total_spent = sum(float(r['total']) for r in month_receipts)
-
-        # Calculate category breakdown
-        category_totals = {}
-        for receipt in month_receipts:
-            for item in receipt.get('items', []):
-                category = item.get('category', 'other')
-                price = float(item.get('price', 0))
-                category_totals[category] = category_totals.get(category, 0) + price
-
-        # Format category breakdown for response
-        categories = [
-            {'category': cat, 'amount': amount}
-            for cat, amount in category_totals.items()
-        ]
-        categories.sort(key=lambda x: x['amount'], reverse=True)
-
-        return jsonify({
-            'month': current_month,
-            'year': current_year,
-            'total_spent': round(total_spent, 2),
-            'receipt_count': len(month_receipts),
-            'categories': categories
-        }), 200
+        return json_with_etag(lambda: month_summary(year, month, request.args.get('currency')), year, month)
 
     except Exception as e:
         return jsonify({'error': f'Failed to calculate stats: {str(e)}'}), 500
 
 
+@app.route('/stats/months', methods=['GET'])
+def get_monthly_trend():
+    """
+    Get spending statistics for a range of months.
+
+    Query parameters:
+        from: First month, YYYY-MM (required)
+        to: Last month, YYYY-MM (default: current month)
+        currency: Optional, as for /stats/month
+
+    Returns one /stats/month entry per month, oldest first, with an ETag.
+    """
+    try:
+        try:
+            if 'from' not in request.args:
+                raise ValueError("'from' is required")
+            start = parse_year_month(request.args['from'])
+            end = parse_year_month(request.args.get('to', datetime.now().strftime('%Y-%m')))
+            months = list(iter_months(start, end))
+            if not months:
+                raise ValueError("'from' must not be after 'to'")
+            if len(months) > MAX_STATS_MONTHS:
+                raise ValueError(f'range exceeds {MAX_STATS_MONTHS} months')
+        except ValueError as e:
+            return jsonify({'error': f'Invalid query: {str(e)}'}), 400
+
+        currency = request.args.get('currency')
+        return json_with_etag(lambda: {'months': [month_summary(year, month, currency) for year, month in months]},
+                              start, end)
+
+    except Exception as e:
+        return jsonify({'error': f'Failed to calculate stats: {str(e)}'}), 500
+
+
+@app.route('/stats/by-store', methods=['GET'])
+def get_stats_by_store():
+    """
+    Get total spend and receipt count per store.
+
+    Query parameters (all optional):
+        from, to: Inclusive receipt date range (YYYY-MM-DD)
+        currency: Only receipts in this currency, in original amounts
+            (default: all receipts converted to the base currency)
+
+    Served from the columnar analytics snapshot, with an ETag.
+    """
+    try:
+        try:
+            date_from, date_to = parse_date_range(request.args)
+        except ValueError as e:
+            return jsonify({'error': f'Invalid query: {str(e)}'}), 400
+
+        currency = request.args.get('currency')
+
+        def build():
+            stores = analytics.spend_by_store(date_from, date_to, currency=currency,
+                                              base_currency=fx_rates.base_currency)
+            return {'from': date_from, 'to': date_to, 'currency': currency or fx_rates.base_currency,
+                    'stores': stores}
+
+        return json_with_etag(build)
+
+    except Exception as e:
+        return jsonify({'error': f'Failed to calculate stats: {str(e)}'}), 500
+
+
+@app.route('/stats/by-category', methods=['GET'])
+def get_stats_by_category():
+    """
+    Get item spend per category, optionally broken down over time.
+
+    Query parameters (all optional):
+        from, to: Inclusive receipt date range (YYYY-MM-DD)
+        granularity: 'day', 'week', 'month' or 'all' (default)
+        currency: Only receipts in this currency, in original amounts
+            (default: all receipts converted to the base currency)
+
+    Returns one entry per period that has spending, oldest first. Served
+    from the columnar analytics snapshot, with an ETag.
+    """
+    try:
+        try:
+            date_from, date_to = parse_date_range(request.args)
+            granularity = request.args.get('granularity', 'all')
+            if granularity not in GRANULARITIES:
+                raise ValueError(f"granularity must be one of: {', '.join(GRANULARITIES)}")
+        except ValueError as e:
+            return jsonify({'error': f'Invalid query: {str(e)}'}), 400
+
+        currency = request.args.get('currency')
+
+        def build():
+            periods = analytics.spend_by_category(date_from, date_to, granularity=granularity,
+                                                  currency=currency, base_currency=fx_rates.base_currency)
+            return {'from': date_from, 'to': date_to, 'granularity': granularity,
+                    'currency': currency or fx_rates.base_currency, 'periods': periods}
+
+        return json_with_etag(build)
+
+    except Exception as e:
+        return jsonify({'error': f'Failed to calculate stats: {str(e)}'}), 500
+
+
+@app.route('/search', methods=['GET'])
+def search_receipts():
+    """
+    Full-text search over store names, item names and OCR text.
+
+    Query parameters:
+        q: Search words; all must match (the last one as a prefix, e.g.
+            "organic mil"; other words too when they end in *)
+        category: Only receipts with an item in this category (q optional)
+        from, to: Inclusive receipt date range (YYYY-MM-DD)
+        limit: Page size (default SEARCH_PAGE_SIZE, max MAX_PAGE_SIZE)
+        cursor: next_cursor value from the previous page
+
+    Returns {"query": str, "results": [...], "next_cursor": str|null},
+    newest upload first. Each result is a receipt summary plus
+    matched_items (items matching a search word, or in the category)
+    and an OCR text snippet with matches in [brackets].
+    """
+    try:
+        query = request.args.get('q', '')
+        try:
+            date_from, date_to = parse_date_range(request.args)
+            limit = min(int(request.args.get('limit', SEARCH_PAGE_SIZE)), MAX_PAGE_SIZE)
+            if limit < 1:
+                raise ValueError('limit must be positive')
+            results, next_cursor = search_index.search(
+                query, category=request.args.get('category') or None, date_from=date_from,
+                date_to=date_to, limit=limit, cursor=request.args.get('cursor') or None)
+        except ValueError as e:
+            return jsonify({'error': f'Invalid query: {str(e)}'}), 400
+
+        return jsonify({'query': query, 'results': results, 'next_cursor': next_cursor}), 200
+
+    except Exception as e:
+        return jsonify({'error': f'Search failed: {str(e)}'}), 500
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Metrics in Prometheus text format.
+
+    Request latency histograms per route, method and status; time per
+    processing stage (image_spool, image_resize, ocr, parse, storage_write,
+    ocr_store_write, analytics_append, search_index_write, change_log_write,
+    json_serialize, ...); request, response, upload and OCR text byte
+    counters.
+    """
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/debug/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """
+    Get a request profile in collapsed-stack format (flamegraph.pl, speedscope).
+
+    Requires the same X-Profile header as the profiled request.
+    """
+    try:
+        if not PROFILE_TOKEN or request.headers.get('X-Profile') != PROFILE_TOKEN:
+            raise ValueError('profiling is disabled')
+        path = os.path.join(PROFILE_DIR, f'{uuid.UUID(hex=profile_id).hex}.folded')
+    except ValueError:
+        return jsonify({'error': 'Profile not found'}), 404
+    if not os.path.exists(path):
+        return jsonify({'error': 'Profile not found'}), 404
+    return send_file(os.path.abspath(path), mimetype='text/plain')
+
+
+@app.cli.command('reparse-receipts')
+@click.option('--workers', default=os.cpu_count() or 1, show_default=True,
+              help='Parser worker processes')
+def reparse_receipts(workers):
+    """
+    Re-parse every stored receipt's OCR text with the current parser.
+
+    Rewrites items (including categories) and totals in place with one
+    bulk storage write. Store, date and currency are left unchanged.
+    Usage: flask --app app reparse-receipts --workers 8
+    """
+    receipts = storage.load_all()
+    ocr_texts = ocr_store.get_many(r['id'] for r in receipts)
+    receipts = [r for r in receipts if ocr_texts.get(r['id'])]
+    parsed_results = receipt_parser.parse_many((ocr_texts[r['id']] for r in receipts), workers=workers)
+
+    updated = []
+    for receipt, parsed in zip(receipts, parsed_results):
+        items = [item.to_record() for item in parsed.items]
+        reparsed = fx_rates.convert_receipt(dict(receipt, items=items, total_cents=parsed.total_cents))
+        if reparsed != receipt:
+            updated.append(reparsed)
+
+    if updated:
+        storage.update_receipts(updated)
+        with store_lock:
+            analytics.rebuild(storage.load_all())
+        search_index.update(updated)
+        change_log.record(updated)
+    click.echo(f"Re-parsed {len(receipts)} receipts, updated {len(updated)}")
+
+
+@app.cli.command('train-categorizer')
+@click.option('--corrections', default=CATEGORY_CORRECTIONS_FILE, show_default=True,
+              help='CSV of corrected item categories (name,category)')
+@click.option('--epochs', default=100, show_default=True, help='Training passes')
+def train_categorizer(corrections, epochs):
+    """
+    Train the item categorizer from stored receipts and corrections.
+
+    Running servers pick up the new model on their next upload. Run
+    reparse-receipts afterwards to re-categorize stored items.
+    Usage: flask --app app train-categorizer --corrections data/category_corrections.csv
+    """
+    names, labels, weights, overrides = training_set(storage.load_all(), load_corrections(corrections),
+                                                     rules=ai_parser.categorizer.fallback)
+    if not names:
+        click.echo('No categorized items or corrections to train on')
+        return
+
+    start = time.perf_counter()
+    model = ItemClassifier.train(names, labels, sample_weights=weights, overrides=overrides,
+                                 epochs=epochs)
+    elapsed = time.perf_counter() - start
+    predicted, _ = model.predict(names)
+    accuracy = sum(p == label for p, label in zip(predicted, labels)) / len(labels)
+    model.save(CATEGORY_MODEL_FILE)
+    click.echo(f"Trained on {len(names)} item names ({len(overrides)} corrected) in {elapsed:.2f}s: "
+               f"{accuracy:.1%} training accuracy, categories {', '.join(model.categories)}")
+
+
+@app.cli.command('rebuild-analytics')
+def rebuild_analytics():
+    """
+    Rebuild the columnar analytics snapshot from stored receipts.
+
+    Usage: flask --app app rebuild-analytics
+    """
+    with store_lock:
+        analytics.rebuild(storage.load_all())
+    rows = analytics.stats()
+    click.echo(f"Rebuilt analytics: {rows['receipts']} receipts, {rows['items']} items")
+
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index():
+    """
+    Rebuild the full-text search index from stored receipts and OCR text.
+
+    Usage: flask --app app rebuild-search-index
+    """
+    with store_lock:
+        search_index.rebuild(storage.load_all(), ocr_store.get_many)
+
+
+def start_job_workers():
+    """Start the background job workers (async processing mode only)."""
+    JobWorkerPool(job_queue, {'upload': process_upload_job}, workers=JOB_WORKERS).start()
+
+
+if PROCESSING_MODE == 'async':
+    start_job_workers()
+
+
 if __name__ == '__main__':
+    # Development server; in production run `gunicorn -c gunicorn.conf.py wsgi:app`
     print("Starting Expense Tracker API...")
     print("Server running on http://localhost:5001")
     app.run(debug=True, host='0.0.0.0', port=5001)
@@ -0,0 +1,4 @@
+"""
+Benchmark suite: seeded synthetic datasets (dataset.py), the benchmark
+runner (run.py) and a result comparison tool (compare.py).
+"""
@@ -0,0 +1,109 @@
+"""
+Compare two benchmark result files.
+
+    python -m benchmarks.compare baseline.json candidate.json --threshold 10
+
+Prints throughput, mean/p50/p95 latency, response size, rebuild time and
+peak memory side by side with their change, and exits with status 1 if
+any got worse by more than threshold percent (throughput lower; latency,
+size, duration or memory higher). p99/max latencies are left out as too noisy at the default
+request counts, and latency changes below --min-delta-ms are ignored.
+"""
+
+import argparse
+import json
+import sys
+
+
+# Settings that must match for the numbers to be comparable
+COMPARABLE_META = ('size', 'storage_backend', 'seed', 'uploads', 'requests_per_scenario')
+
+
+def flatten(results, prefix=''):
+    """Yield (dotted key, value) for every number in a result dict."""
+    for key, value in results.items():
+        if key == 'meta':
+            continue
+        path = f'{prefix}{key}'
+        if isinstance(value, dict):
+            yield from flatten(value, path + '.')
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield path, value
+
+
+COMPARED = ('per_second', 'mean_ms', 'p50_ms', 'p95_ms', 'mean_bytes', 'analytics_rebuild_seconds',
+            'search_rebuild_seconds', 'train_seconds')
+
+
+def is_compared(key):
+    """True for the throughput, timing and memory figures that are compared."""
+    return key.rsplit('.', 1)[-1] in COMPARED or key.startswith('peak_rss_mb.')
+
+
+def change_percent(key, baseline, candidate):
+    """Change from baseline to candidate in percent; positive means worse."""
+    if baseline == 0:
+        return 0.0
+    change = (candidate - baseline) / baseline * 100
+    return -change if key.endswith('per_second') else change
+
+
+def compare(baseline, candidate, threshold, min_delta_ms=0.0):
+    """
+    Compare two result dicts.
+
+    Args:
+        baseline: Results of the reference run
+        candidate: Results of the run being checked
+        threshold: Percent by which a figure may get worse
+        min_delta_ms: Latency changes smaller than this never count as regressions
+
+    Returns:
+        list: (key, baseline value, candidate value, percent worse, regressed) tuples
+    """
+    base_values = dict(flatten(baseline))
+    rows = []
+    for key, value in flatten(candidate):
+        if not is_compared(key) or key not in base_values:
+            continue
+        worse = change_percent(key, base_values[key], value)
+        regressed = worse > threshold
+        if key.endswith('_ms') and value - base_values[key] < min_delta_ms:
+            regressed = False
+        rows.append((key, base_values[key], value, worse, regressed))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare two benchmark result files.')
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='Percent a figure may get worse before it counts as a regression')
+    parser.add_argument('--min-delta-ms', type=float, default=0.25,
+                        help='Ignore latency changes smaller than this many milliseconds')
+    args = parser.parse_args(argv)
+
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(args.candidate, 'r', encoding='utf-8') as f:
+        candidate = json.load(f)
+
+    for key in COMPARABLE_META:
+        if baseline['meta'].get(key) != candidate['meta'].get(key):
+            print(f"Warning: {key} differs ({baseline['meta'].get(key)} vs {candidate['meta'].get(key)})")
+
+    rows = compare(baseline, candidate, args.threshold, args.min_delta_ms)
+    width = max((len(row[0]) for row in rows), default=10)
+    print(f"{'metric':<{width}}  {'baseline':>12}  {'candidate':>12}  {'worse %':>8}")
+    for key, base_value, value, worse, regressed in rows:
+        flag = '  REGRESSION' if regressed else ''
+        print(f'{key:<{width}}  {base_value:>12g}  {value:>12g}  {worse:>+8.1f}{flag}')
+
+    regressions = sum(1 for row in rows if row[4])
+    print(f'{regressions} regression(s) above {args.threshold:g}%')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
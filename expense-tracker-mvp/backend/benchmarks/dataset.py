@@ -0,0 +1,117 @@
+"""
+Seeded synthetic receipt datasets.
+
+Receipt text comes from the mock OCR generator (mock_receipt_text) driven
+by a seeded random.Random, so a given (seed, count) always produces the
+same texts, receipts, ids and images. Receipts are spread over
+DATE_SPAN_DAYS ending at END_DATE so stats queries cover many months.
+"""
+
+import io
+import random
+import uuid
+from datetime import datetime, timedelta
+
+from PIL import Image, ImageDraw
+
+from services.ocr_service import SAMPLE_ITEMS, mock_receipt_text
+from services.pipeline import build_receipt
+
+
+SIZES = {'1k': 1_000, '100k': 100_000, '1m': 1_000_000}
+
+END_DATE = datetime(2026, 1, 1)
+DATE_SPAN_DAYS = 2 * 365
+UPLOADED_AT_START = datetime(2024, 1, 1)
+
+
+def parse_size(value):
+    """Parse a dataset size ('1k', '100k', '1m' or a plain number)."""
+    if value.lower() in SIZES:
+        return SIZES[value.lower()]
+    count = int(value)
+    if count < 1:
+        raise ValueError('size must be positive')
+    return count
+
+
+def generate_texts(count, seed):
+    """
+    Yield count receipt texts.
+
+    Args:
+        count: Number of texts
+        seed: Random seed
+
+    Yields:
+        str: Receipt text in the mock OCR format
+    """
+    rng = random.Random(f'{seed}-texts')
+    for _ in range(count):
+        today = END_DATE - timedelta(days=rng.randint(0, DATE_SPAN_DAYS))
+        yield mock_receipt_text(rng, today)
+
+
+def generate_item_names(count, seed):
+    """
+    Yield count item names: the mock OCR items with random brand words in front.
+
+    Args:
+        count: Number of names (nearly all distinct)
+        seed: Random seed
+
+    Yields:
+        str: Item name such as 'Kovalu Organic Milk 1gal'
+    """
+    rng = random.Random(f'{seed}-items')
+    for _ in range(count):
+        brand = ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(3, 8)))
+        yield f'{brand.capitalize()} {rng.choice(SAMPLE_ITEMS)[0]}'
+
+
+def generate_receipts(count, seed, parser, fx_rates=None):
+    """
+    Yield stored receipt records with their OCR text.
+
+    Args:
+        count: Number of receipts
+        seed: Random seed
+        parser: AIParser used to turn the texts into receipts
+        fx_rates: Optional FXRates for base-currency amounts
+
+    Yields:
+        tuple: (receipt dict, ocr_text)
+    """
+    rng = random.Random(f'{seed}-ids')
+    for i, text in enumerate(generate_texts(count, seed)):
+        receipt_id = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+        uploaded_at = (UPLOADED_AT_START + timedelta(seconds=i)).isoformat()
+        receipt = build_receipt(receipt_id, f'{receipt_id}.jpg', parser.parse_receipt(text),
+                                uploaded_at=uploaded_at, fx_rates=fx_rates)
+        yield receipt, text
+
+
+def generate_images(count, seed, size=(1200, 1600)):
+    """
+    Yield distinct receipt-like JPEG images.
+
+    Args:
+        count: Number of images
+        seed: Random seed
+        size: (width, height) in pixels
+
+    Yields:
+        bytes: JPEG file content
+    """
+    rng = random.Random(f'{seed}-images')
+    width, height = size
+    for i in range(count):
+        image = Image.new('RGB', size, (250, 250, 245))
+        draw = ImageDraw.Draw(image)
+        for row in range(40):
+            y = 60 + row * (height - 120) // 40
+            draw.rectangle((60, y, 60 + rng.randint(width // 4, width - 120), y + 12), fill=(40, 40, 40))
+        draw.text((60, 20), f'Receipt {seed}-{i}', fill=(0, 0, 0))
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=90)
+        yield buffer.getvalue()
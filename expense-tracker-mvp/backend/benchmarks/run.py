@@ -0,0 +1,501 @@
+"""
+Backend benchmark runner.
+
+Run from the backend directory:
+
+    python -m benchmarks.run --size 1k
+    python -m benchmarks.run --size 100k --backend jsonl
+    python -m benchmarks.compare benchmarks/results/a.json benchmarks/results/b.json
+
+Builds a seeded synthetic dataset of --size receipts in a fresh temporary
+data directory and drives the Flask app through its test client (no
+network or server process). --uploads receipts are uploaded as images
+(full upload path: streaming, resizing, OCR, parsing, storage); the rest
+are generated and bulk-stored. Then every read endpoint is timed.
+
+Results (parser, item categorizer and mock LLM parsing throughput, upload
+throughput and latency, per-stage upload timings, read latency
+percentiles, peak RSS per phase) are written as JSON to --output, by
+default benchmarks/results/<time>-<size>-<backend>.json.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.dataset import (DATE_SPAN_DAYS, END_DATE, generate_images, generate_item_names,
+                                generate_receipts, generate_texts, parse_size)
+from services.ai_parser import AIParser
+from services.categorizer import KeywordCategorizer
+from services.item_classifier import ItemClassifier, LearnedCategorizer, normalize_name
+from services.llm_parser import LLMParser
+from services.mock_llm import MockLLMServer
+from services.metrics import REGISTRY
+from services.ocr_service import SAMPLE_ITEMS, SAMPLE_STORES
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+RESULTS_DIR = os.path.join(BACKEND_DIR, 'benchmarks', 'results')
+FORMAT = 1  # Bump when the result layout changes
+PARSER_SAMPLE = 50_000  # Texts parsed for the parser benchmark (at most)
+CATEGORIZER_SAMPLE = 20_000  # Distinct item names to train and categorize (at most)
+ITEMS_PER_RECEIPT = 8  # Names per categorize_many() call
+LLM_SAMPLE = 128  # Texts parsed through the mock LLM API per scenario (at most)
+LLM_LATENCY = 0.1  # Mock LLM seconds per request
+LLM_RECEIPT_LATENCY = 0.01  # Mock LLM extra seconds per receipt in a request
+LOAD_CHUNK = 10_000  # Receipts per bulk storage write
+WARMUP_REQUESTS = 5  # Untimed requests before each read scenario
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200  # app.MAX_PAGE_SIZE
+# Sent with every read, as browsers do, so response sizes are what goes over the wire
+READ_HEADERS = {'Accept-Encoding': 'gzip, deflate, br'}
+
+
+def peak_rss_mb():
+    """Return the peak resident set size of this process in MB (None on Windows)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def latency_summary(samples):
+    """
+    Summarize request latencies.
+
+    Args:
+        samples: Latencies in seconds
+
+    Returns:
+        dict: count, mean and percentiles in milliseconds
+    """
+    ordered = sorted(samples)
+
+    def percentile(p):
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000, 3)
+
+    return {
+        'count': len(ordered),
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 3),
+        'p50_ms': percentile(0.50),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+        'max_ms': round(ordered[-1] * 1000, 3)
+    }
+
+
+def stage_totals():
+    """Return {stage: (count, seconds)} from the metrics registry."""
+    totals = {}
+    for name, labels, series in REGISTRY.snapshot()['histograms']:
+        if name == 'stage_duration_seconds':
+            labels = dict(labels)
+            stage = labels.pop('stage')
+            if labels:
+                stage += f"[{','.join(labels.values())}]"
+            totals[stage] = (series[-1], series[-2])
+    return totals
+
+
+def stage_breakdown(before, after):
+    """Mean time per stage between two stage_totals() snapshots."""
+    breakdown = {}
+    for stage, (count, seconds) in sorted(after.items()):
+        count -= before.get(stage, (0, 0))[0]
+        seconds -= before.get(stage, (0, 0))[1]
+        if count:
+            breakdown[stage] = {'count': count, 'mean_ms': round(seconds / count * 1000, 3)}
+    return breakdown
+
+
+def bench_parser(count, seed):
+    """Time AIParser.parse_receipt over up to PARSER_SAMPLE generated texts."""
+    texts = list(generate_texts(min(count, PARSER_SAMPLE), seed))
+    parser = AIParser()
+    start = time.perf_counter()
+    for text in texts:
+        parser.parse_receipt(text)
+    elapsed = time.perf_counter() - start
+    return {'receipts': len(texts), 'seconds': round(elapsed, 3),
+            'per_second': round(len(texts) / elapsed, 1)}
+
+
+def bench_categorizer(count, seed):
+    """
+    Train the learned item categorizer on generated item names and time it.
+
+    Half of the names (labelled by the keyword rules) train the model. The
+    other half are categorized in receipt-sized batches twice: first
+    unseen (every name is scored), then again (every name is cached).
+    Parsing is then timed with the learned categorizer.
+    """
+    names = list(generate_item_names(min(count, CATEGORIZER_SAMPLE), seed))
+    rules = KeywordCategorizer()
+    train_names, test_names = names[::2], names[1::2]
+    keys = [normalize_name(name) for name in train_names]
+
+    start = time.perf_counter()
+    model = ItemClassifier.train(keys, [rules.categorize(key) for key in keys])
+    results = {'train': {'names': len(keys), 'train_seconds': round(time.perf_counter() - start, 3)}}
+
+    with tempfile.TemporaryDirectory() as directory:
+        model_path = os.path.join(directory, 'category_model.npz')
+        model.save(model_path)
+        categorizer = LearnedCategorizer(model_path)
+        categorizer.categorize('')  # Load the model outside the timed passes
+
+        for name in ('uncached', 'cached'):
+            start = time.perf_counter()
+            for i in range(0, len(test_names), ITEMS_PER_RECEIPT):
+                categorizer.categorize_many(test_names[i:i + ITEMS_PER_RECEIPT])
+            elapsed = time.perf_counter() - start
+            results[name] = {'names': len(test_names), 'seconds': round(elapsed, 3),
+                             'per_second': round(len(test_names) / elapsed, 1)}
+
+        texts = list(generate_texts(min(count, PARSER_SAMPLE), seed))
+        parser = AIParser(categorizer)
+        start = time.perf_counter()
+        for text in texts:
+            parser.parse_receipt(text)
+        elapsed = time.perf_counter() - start
+        results['parser'] = {'receipts': len(texts), 'seconds': round(elapsed, 3),
+                             'per_second': round(len(texts) / elapsed, 1)}
+    return results
+
+
+def bench_llm(count, seed):
+    """
+    Time LLMParser against the local mock LLM API.
+
+    The same texts are parsed one receipt per request, then in batches of
+    8 (both with at most 4 requests in flight), then again from the cache.
+    """
+    texts = list(generate_texts(min(count, LLM_SAMPLE), seed))
+    server = MockLLMServer(latency=LLM_LATENCY, per_receipt_latency=LLM_RECEIPT_LATENCY)
+    url = server.start()
+    results = {}
+    try:
+        for name, batch_size in (('unbatched', 1), ('batched', 8)):
+            parser = LLMParser(url, 'mock', AIParser(), max_concurrency=4, batch_size=batch_size)
+            start = time.perf_counter()
+            list(parser.parse_many(texts))
+            elapsed = time.perf_counter() - start
+            stats = parser.stats()
+            results[name] = {'receipts': len(texts), 'requests': stats['requests'],
+                             'fallbacks': stats['fallback'], 'seconds': round(elapsed, 3),
+                             'per_second': round(len(texts) / elapsed, 1)}
+
+        start = time.perf_counter()
+        list(parser.parse_many(texts))
+        elapsed = time.perf_counter() - start
+        results['cached'] = {'receipts': len(texts), 'seconds': round(elapsed, 3),
+                             'per_second': round(len(texts) / elapsed, 1)}
+    finally:
+        server.stop()
+    return results
+
+
+def load_app(backend, seed):
+    """
+    Import the app for the current working directory.
+
+    Configuration is read at import time, so this must run after
+    changing into the benchmark data directory.
+    """
+    os.environ['STORAGE_BACKEND'] = backend
+    os.environ['PROCESSING_MODE'] = 'sync'
+    import app as app_module
+    from services.ocr_service import OCRService
+
+    # Seeded mock OCR, so uploads create the same receipts on every run
+    app_module.ocr_service = OCRService('mock', seed=f'{seed}-ocr')
+    return app_module
+
+
+def bench_uploads(client, count, seed):
+    """Upload count generated images one at a time through POST /receipt/upload."""
+    images = list(generate_images(count, seed))
+    before = stage_totals()
+    samples = []
+    start = time.perf_counter()
+    # The mock OCR backend prints a line per image
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for data in images:
+            request_start = time.perf_counter()
+            response = client.post('/receipt/upload', data={'file': (io.BytesIO(data), 'receipt.jpg')},
+                                   content_type='multipart/form-data')
+            samples.append(time.perf_counter() - request_start)
+            if response.status_code != 201:
+                raise RuntimeError(f'Upload returned {response.status_code}: {response.get_data(as_text=True)}')
+    elapsed = time.perf_counter() - start
+    return {'uploads': count, 'seconds': round(elapsed, 3), 'per_second': round(count / elapsed, 2),
+            'latency': latency_summary(samples), 'stages': stage_breakdown(before, stage_totals())}
+
+
+def data_file_sizes(directory):
+    """Return the size in MB of each data file (SQLite WAL files counted with their database)."""
+    sizes = {}
+    for entry in os.scandir(directory):
+        if not entry.is_file() or entry.name.endswith(('-shm', '.lock')):
+            continue
+        name = entry.name[:-len('-wal')] if entry.name.endswith('-wal') else entry.name
+        sizes[name] = sizes.get(name, 0) + entry.stat().st_size
+    return {name: round(size / 2**20, 2) for name, size in sorted(sizes.items())}
+
+
+def bench_bulk_load(app_module, count, seed, sample_ids=1000):
+    """
+    Generate count receipts and store them in chunks, then time full
+    rebuilds of the analytics snapshot and search index.
+
+    Returns:
+        tuple: (result dict, sample of stored receipt ids)
+    """
+    ids = []
+    step = max(1, count // sample_ids)
+    receipts = []
+    texts = []
+    start = time.perf_counter()
+    for i, (receipt, text) in enumerate(generate_receipts(count, seed, app_module.ai_parser,
+                                                          fx_rates=app_module.fx_rates)):
+        receipts.append(receipt)
+        texts.append((receipt['id'], text))
+        if i % step == 0:
+            ids.append(receipt['id'])
+        if len(receipts) == LOAD_CHUNK:
+            app_module.store_receipts(receipts, texts)
+            receipts, texts = [], []
+    if receipts:
+        app_module.store_receipts(receipts, texts)
+    elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    app_module.analytics.rebuild(app_module.storage.load_all())
+    analytics_rebuild = time.perf_counter() - start
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        app_module.search_index.rebuild(app_module.storage.load_all(), app_module.ocr_store.get_many)
+    search_rebuild = time.perf_counter() - start
+    return {'receipts': count, 'seconds': round(elapsed, 3),
+            'per_second': round(count / elapsed, 1) if count else None,
+            'analytics_rebuild_seconds': round(analytics_rebuild, 3),
+            'search_rebuild_seconds': round(search_rebuild, 3),
+            'data_mb': data_file_sizes('data')}, ids
+
+
+def collect_cursors(client, count):
+    """Walk the receipt list with cursors and return up to count page cursors."""
+    cursors = []
+    path = f'/receipts?limit={PAGE_SIZE}'
+    while len(cursors) < count:
+        next_cursor = client.get(path).get_json()['next_cursor']
+        if not next_cursor:
+            break
+        cursors.append(next_cursor)
+        path = f'/receipts?limit={PAGE_SIZE}&cursor={next_cursor}'
+    return cursors
+
+
+def read_scenarios(client, ids, count, seed):
+    """
+    Build count requests per read scenario (seeded): a path, or a
+    (path, headers) pair for conditional requests.
+    """
+    rng = random.Random(f'{seed}-reads')
+    first_day = END_DATE - timedelta(days=DATE_SPAN_DAYS + 30)
+    months = sorted({(first_day + timedelta(days=d)).strftime('%Y-%m')
+                     for d in range(0, DATE_SPAN_DAYS + 31, 28)})
+    cursors = collect_cursors(client, count) or [None]
+
+    def month_range():
+        start = rng.randrange(len(months))
+        end = min(len(months) - 1, start + rng.randint(0, 2))
+        return f'{months[start]}-01', f'{months[end]}-28'
+
+    def filtered():
+        date_from, date_to = month_range()
+        return (f'/receipts?limit={PAGE_SIZE}&store={rng.choice(SAMPLE_STORES)}'
+                f'&date_from={date_from}&date_to={date_to}')
+
+    def by_store():
+        date_from, date_to = month_range()
+        return f'/stats/by-store?from={date_from}&to={date_to}'
+
+    def month():
+        year, month = rng.choice(months).split('-')
+        return f'/stats/month?year={year}&month={int(month)}'
+
+    item_words = sorted({word.lower() for name, _, _ in SAMPLE_ITEMS for word in name.split()})
+
+    def search_in_month():
+        date_from, date_to = month_range()
+        return f'/search?q={rng.choice(item_words)}&from={date_from}&to={date_to}'
+
+    # Refreshes of unchanged data, and of the last 10 changes
+    list_etag = client.get(f'/receipts?limit={PAGE_SIZE}').headers['ETag']
+    stats_etag = client.get(f'/stats/months?from={months[-12]}&to={months[-1]}').headers['ETag']
+    seq = int(client.get('/receipts?limit=1').headers['X-Change-Seq'])
+
+    builders = {
+        'list_first_page': lambda: f'/receipts?limit={PAGE_SIZE}',
+        'list_max_page': lambda: f'/receipts?limit={MAX_PAGE_SIZE}',
+        'list_not_modified': lambda: (f'/receipts?limit={PAGE_SIZE}', {'If-None-Match': list_etag}),
+        'list_next_page': lambda: (f'/receipts?limit={PAGE_SIZE}&cursor={rng.choice(cursors)}'
+                                   if cursors[0] else f'/receipts?limit={PAGE_SIZE}'),
+        'list_filtered': filtered,
+        'detail': lambda: f'/receipts/{rng.choice(ids)}',
+        'stats_month': month,
+        'stats_months_year': lambda: f'/stats/months?from={months[-12]}&to={months[-1]}',
+        'stats_months_not_modified': lambda: (f'/stats/months?from={months[-12]}&to={months[-1]}',
+                                              {'If-None-Match': stats_etag}),
+        'stats_by_store_range': by_store,
+        'stats_by_store_all': lambda: '/stats/by-store',
+        'stats_by_category_monthly': lambda: '/stats/by-category?granularity=month',
+        'search_word': lambda: f'/search?q={rng.choice(item_words)}',
+        'search_prefix': lambda: f'/search?q={rng.choice(item_words)[:3]}',
+        'search_two_words': lambda: f'/search?q={rng.choice(SAMPLE_STORES).split()[0]}+{rng.choice(item_words)}',
+        'search_category': lambda: '/search?category=alcohol',
+        'search_word_in_months': search_in_month,
+        'changes_recent': lambda: f'/receipts/changes?since={max(seq - 10, 0)}',
+    }
+    return {name: [build() for _ in range(count)] for name, build in builders.items()}
+
+
+def bench_reads(client, ids, count, seed):
+    """Time count GET requests for each read scenario, and their mean response size."""
+    results = {}
+    for name, planned in read_scenarios(client, ids, count, seed).items():
+        planned = [r if isinstance(r, tuple) else (r, {}) for r in planned]
+        for path, headers in planned[:WARMUP_REQUESTS]:
+            client.get(path, headers={**READ_HEADERS, **headers})
+        samples = []
+        sizes = []
+        for path, headers in planned:
+            start = time.perf_counter()
+            response = client.get(path, headers={**READ_HEADERS, **headers})
+            sizes.append(len(response.get_data()))
+            samples.append(time.perf_counter() - start)
+            if response.status_code != (304 if headers else 200):
+                raise RuntimeError(f'GET {path} returned {response.status_code}')
+        results[name] = latency_summary(samples)
+        results[name]['mean_bytes'] = round(sum(sizes) / len(sizes))
+    return results
+
+
+def git_commit():
+    """Return the current git commit (short hash), or None outside a checkout."""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(size, backend='sqlite', seed=42, uploads=200, requests=500, workdir=None):
+    """
+    Run the full benchmark.
+
+    Args:
+        size: Total receipts in the dataset
+        backend: Storage backend ('sqlite', 'jsonl' or 'json')
+        seed: Dataset seed
+        uploads: How many of the receipts go through POST /receipt/upload
+        requests: Requests per read scenario
+        workdir: Data directory (defaults to a new temporary directory)
+
+    Returns:
+        dict: Benchmark results
+    """
+    uploads = min(uploads, size)
+    results = {
+        'meta': {
+            'format': FORMAT,
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'size': size,
+            'storage_backend': backend,
+            'seed': seed,
+            'uploads': uploads,
+            'requests_per_scenario': requests,
+            'git_commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count()
+        },
+        'peak_rss_mb': {}
+    }
+
+    def phase(name, result):
+        results[name] = result
+        results['peak_rss_mb'][name] = peak_rss_mb()
+        print(f'[Benchmark] {name}: {json.dumps(result)[:200]}', file=sys.stderr)
+
+    phase('parser', bench_parser(size, seed))
+    phase('categorizer', bench_categorizer(size, seed))
+    phase('llm', bench_llm(size, seed))
+
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    app_module = load_app(backend, seed)
+    client = app_module.app.test_client()
+    results['peak_rss_mb']['app_start'] = peak_rss_mb()
+
+    phase('upload', bench_uploads(client, uploads, seed))
+    load, ids = bench_bulk_load(app_module, size - uploads, seed)
+    phase('bulk_load', load)
+    if not ids:
+        ids = [r['id'] for r in client.get('/receipts').get_json()]
+    phase('reads', bench_reads(client, ids, requests, seed))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the expense tracker backend.')
+    parser.add_argument('--size', default='1k', help="Receipts in the dataset: 1k, 100k, 1m or a number")
+    parser.add_argument('--backend', default='sqlite', choices=('sqlite', 'jsonl', 'json'))
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--uploads', type=int, default=200, help='Receipts uploaded as images')
+    parser.add_argument('--requests', type=int, default=500, help='Requests per read scenario')
+    parser.add_argument('--output', help='Result file (default: benchmarks/results/<time>-<size>-<backend>.json)')
+    parser.add_argument('--workdir', help='Keep the generated data in this directory')
+    args = parser.parse_args(argv)
+
+    size = parse_size(args.size)
+    output = os.path.abspath(args.output or os.path.join(
+        RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{args.size}-{args.backend}.json"))
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix='expense-bench-')
+
+    try:
+        results = run(size, backend=args.backend, seed=args.seed, uploads=args.uploads,
+                      requests=args.requests, workdir=workdir)
+    finally:
+        if not args.workdir:
+            os.chdir(BACKEND_DIR)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
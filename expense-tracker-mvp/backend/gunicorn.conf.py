@@ -0,0 +1,42 @@
+"""
+Gunicorn configuration for production serving.
+
+Usage: gunicorn -c gunicorn.conf.py wsgi:app
+
+Each worker process loads the app itself (no preload_app): database
+connections and background threads must not be shared across fork.
+Storage writes are safe across workers (SQLite transactions, or a lock
+file for the json/jsonl backends). Settings can be overridden with the
+environment variables below.
+"""
+
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:5001')
+
+# Uploads spend most of their time in OCR (a separate process pool or an
+# external binary), so threaded workers keep the CPU busy while requests
+# wait; WEB_CONCURRENCY processes x THREADS requests in flight
+workers = int(os.environ.get('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2, 8)))
+worker_class = 'gthread'
+threads = int(os.environ.get('THREADS', 4))
+
+# Longer than OCR_TIMEOUT (30s) so slow OCR returns 504 from the app
+# instead of the worker being killed mid-request
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers now and then to cap memory growth of in-process caches
+max_requests = 5000
+max_requests_jitter = 500
+
+# Background jobs are claimed by every worker; a job is only retried once
+# its lease expires, never because another worker restarted. Workers share
+# metrics snapshots in METRICS_DIR so /metrics covers all of them
+raw_env = [f"JOB_LEASE_SECONDS={os.environ.get('JOB_LEASE_SECONDS', 600)}",
+           f"METRICS_DIR={os.environ.get('METRICS_DIR', 'data/metrics')}"]
+
+accesslog = '-'
+errorlog = '-'
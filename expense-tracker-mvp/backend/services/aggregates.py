@@ -0,0 +1,186 @@
+"""
+Materialized monthly spending aggregates.
+
+Receipts are folded into per-month totals once, when they are written,
+instead of on every /stats request:
+
+    (year, month, currency)           -> receipt_count, total_cents
+    (year, month, currency, category) -> amount_cents
+
+Receipts converted to the base currency (see fx_rates) are also folded
+into the same two shapes keyed by base currency, so converted totals
+need no conversion at request time.
+
+Receipt amounts are already integer cents, so updates are plain integer
+sums that never accumulate float error. Stats for a month are then
+O(categories).
+"""
+
+
+def month_key(date_str):
+    """
+    Return (year, month) for an ISO date string, or None if invalid.
+
+    Args:
+        date_str: Receipt date in YYYY-MM-DD format
+    """
+    try:
+        year, month = int(date_str[0:4]), int(date_str[5:7])
+    except (TypeError, ValueError):
+        return None
+    if date_str[4:5] != '-' or not 1 <= month <= 12:
+        return None
+    return (year, month)
+
+
+def iter_months(start, end):
+    """Yield (year, month) pairs from start to end inclusive."""
+    year, month = start
+    while (year, month) <= end:
+        yield (year, month)
+        month += 1
+        if month > 12:
+            year, month = year + 1, 1
+
+
+class MonthlyAggregates:
+    """In-memory monthly totals, updated incrementally per receipt."""
+
+    def __init__(self, receipts=()):
+        """
+        Build aggregates from scratch.
+
+        Args:
+            receipts: Iterable of receipt dicts
+        """
+        # (year, month) -> {'totals': {currency: [receipt_count, total_cents]},
+        #                   'categories': {(currency, category): amount_cents},
+        #                   'converted': {base_currency: [receipt_count, total_cents]},
+        #                   'converted_categories': {(base_currency, category): amount_cents}}
+        self.months = {}
+        for receipt in receipts:
+            self.add(receipt)
+
+    def add(self, receipt, sign=1):
+        """
+        Fold a receipt into the aggregates.
+
+        Args:
+            receipt: Receipt dict
+            sign: 1 to add the receipt, -1 to remove a previously added one
+        """
+        key = month_key(receipt.get('date'))
+        if key is None:
+            # Receipts with invalid dates are not counted in any month
+            return
+
+        bucket = self.months.setdefault(key, {'totals': {}, 'categories': {},
+                                              'converted': {}, 'converted_categories': {}})
+        self._fold(bucket['totals'], bucket['categories'], receipt.get('currency', 'USD'),
+                   receipt, 'total_cents', 'price_cents', sign)
+        if 'base_total_cents' in receipt:
+            self._fold(bucket['converted'], bucket['converted_categories'], receipt['base_currency'],
+                       receipt, 'base_total_cents', 'base_price_cents', sign)
+
+    def _fold(self, totals, categories, currency, receipt, total_field, price_field, sign):
+        counts = totals.setdefault(currency, [0, 0])
+        counts[0] += sign
+        counts[1] += sign * receipt.get(total_field, 0)
+
+        for item in receipt.get('items', []):
+            category_key = (currency, item.get('category', 'other'))
+            categories[category_key] = categories.get(category_key, 0) + sign * item.get(price_field, 0)
+
+    def remove(self, receipt):
+        """Remove a previously added receipt from the aggregates."""
+        self.add(receipt, sign=-1)
+
+    def month_rows(self, year, month):
+        """
+        Return the aggregate rows for one month.
+
+        Returns:
+            tuple: (totals, categories) where totals is a list of
+            (currency, receipt_count, total_cents) and categories a list of
+            (currency, category, amount_cents)
+        """
+        return self._rows(year, month, 'totals', 'categories')
+
+    def converted_rows(self, year, month):
+        """
+        Return the base-currency aggregate rows for one month.
+
+        Returns:
+            tuple: (totals, categories) as in month_rows, keyed by base currency
+        """
+        return self._rows(year, month, 'converted', 'converted_categories')
+
+    def _rows(self, year, month, totals_key, categories_key):
+        bucket = self.months.get((year, month))
+        if bucket is None:
+            return [], []
+        totals = [(currency, count, cents) for currency, (count, cents) in bucket[totals_key].items() if count]
+        categories = [(currency, category, cents)
+                      for (currency, category), cents in bucket[categories_key].items()]
+        return totals, categories
+
+
+def summarize_month(year, month, totals, categories, currency=None):
+    """
+    Build the /stats/month response body from aggregate rows.
+
+    Args:
+        year: Calendar year
+        month: Calendar month (1-12)
+        totals: List of (currency, receipt_count, total_cents)
+        categories: List of (currency, category, amount_cents)
+        currency: Only count rows in this currency (None for all rows)
+
+    Returns:
+        dict: Month summary with total_spent, receipt_count and categories
+    """
+    if currency is not None:
+        totals = [row for row in totals if row[0] == currency]
+        categories = [row for row in categories if row[0] == currency]
+
+    receipt_count = sum(count for _, count, _ in totals)
+    total_cents = sum(cents for _, _, cents in totals)
+
+    category_cents = {}
+    for _, category, cents in categories:
+        category_cents[category] = category_cents.get(category, 0) + cents
+
+    # Format category breakdown for response
+    category_list = [
+        {'category': cat, 'amount': cents / 100}
+        for cat, cents in category_cents.items()
+        if cents
+    ]
+    category_list.sort(key=lambda x: x['amount'], reverse=True)
+
+    summary = {
+        'month': month,
+        'year': year,
+        'total_spent': total_cents / 100,
+        'receipt_count': receipt_count,
+        'categories': category_list
+    }
+    if currency is not None:
+        summary['currency'] = currency
+    return summary
+
+
+def currency_breakdown(totals):
+    """
+    Per-currency totals in original amounts, largest receipt count first.
+
+    Args:
+        totals: List of (currency, receipt_count, total_cents)
+
+    Returns:
+        list: [{'currency', 'receipt_count', 'total'}]
+    """
+    breakdown = [{'currency': currency, 'receipt_count': count, 'total': cents / 100}
+                 for currency, count, cents in totals]
+    breakdown.sort(key=lambda x: (-x['receipt_count'], x['currency']))
+    return breakdown
@@ -3,40 +3,87 @@ AI Parser Service for converting OCR text to structured receipt data.
 
 CURRENT IMPLEMENTATION: Rule-based parsing with simple categorization logic.
 
-TO INTEGRATE REAL AI:
-Replace the parse_receipt method with one of these options:
-1. OpenAI GPT-4 API
-2. Anthropic Claude API
-3. Local LLM (e.g., Llama)
-4. Custom trained model
-
-Example with OpenAI:
-    import openai
-    response = openai.ChatCompletion.create(
-        model="gpt-4",
-        messages=[{
-            "role": "system",
-            "content": "Parse this receipt text into JSON..."
-        }, {
-            "role": "user",
-            "content": ocr_text
-        }]
-    )
-    return json.loads(response.choices[0].message.content)
+To parse with a real LLM instead, set PARSER_BACKEND=llm: LLMParser
+(services/llm_parser.py) sends receipts to an OpenAI-compatible chat
+completions API and falls back to this parser when the API is slow or
+fails. services/mock_llm.py is a local stand-in for that API.
 """
 
 import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from itertools import islice
+
+from services.categorizer import KeywordCategorizer
+from services.metrics import timer
+from services.models import LineItem, ParsedReceipt, parse_amount
+
+
+# Compiled once at import. parse_receipt runs each pattern over the whole
+# text in a single scan rather than looping over lines in Python.
+DATE_PATTERN = re.compile(r'Date:\s*(\d{1,2}/\d{1,2}/\d{4})')
+
+# Item line: text followed by price in various formats:
+# $12.34, €12,34, 12.34, 12,34
+# ([^\S\n] is whitespace within a line; the trailing .* consumes the rest of
+# the line so there is at most one item per line)
+ITEM_PATTERN = re.compile(
+    r'^(.+?)[^\S\n]+(?:[\$€£¥]?[^\S\n]*)?(\d+[.,]\d{2})[^\S\n]*(?:[\$€£¥])?.*$',
+    re.MULTILINE
+)
+
+# Total line in multiple formats: Total: $12.34, TOTAL (€) 12,34, Suma 12.34
+TOTAL_PATTERN = re.compile(
+    r'\b(total|suma|importe):?\s*(?:\([€\$£¥]\))?\s*(?:[€\$£¥])?\s*(\d+[.,]\d{2})',
+    re.IGNORECASE
+)
+TOTAL_KEYWORDS = ('total', 'suma', 'importe')  # Priority order
+
+# Lines whose item name contains one of these are totals, not items
+NON_ITEM_PATTERN = re.compile(r'total|tax|suma|importe', re.IGNORECASE)
+
+CURRENCY_PATTERN = re.compile(r'€|£|¥|\$|EUR|GBP|JPY|CNY', re.IGNORECASE)
+CURRENCY_CODES = {'€': 'EUR', 'EUR': 'EUR', '£': 'GBP', 'GBP': 'GBP',
+                  '¥': 'JPY', 'JPY': 'JPY', 'CNY': 'JPY', '$': 'USD'}
+CURRENCY_PRIORITY = ('EUR', 'GBP', 'JPY', 'USD')
+COMMA_DECIMAL_PATTERN = re.compile(r'\d+,\d{2}')
+
+# Parser instance of each parse_many() worker process
+_worker_parser = None
+
+
+def _init_worker(parser):
+    """Process pool initializer: keep one compiled parser per worker."""
+    global _worker_parser
+    _worker_parser = parser
+
+
+def _parse_chunk(texts):
+    """Parse a chunk of OCR texts in a worker process."""
+    return [_worker_parser.parse_receipt(text) for text in texts]
 
 
 class AIParser:
     """Service for parsing OCR text into structured receipt data using AI."""
 
-    def __init__(self):
-        """Initialize AI parser."""
-        # In real implementation, initialize AI client here
-        # e.g., self.client = openai.OpenAI(api_key="...")
-        pass
+    # Bump when parsing output changes so cached parse results are not reused
+    VERSION = '3'
+
+    def __init__(self, categorizer=None):
+        """
+        Initialize AI parser.
+
+        Args:
+            categorizer: Optional KeywordCategorizer or LearnedCategorizer
+                (defaults to the rules in services/category_rules.cfg)
+        """
+        self.categorizer = categorizer or KeywordCategorizer()
+
+    @property
+    def version(self):
+        """Parser and categorizer version; parse results are cached under it."""
+        return f'{self.VERSION}-{self.categorizer.version}'
 
     def parse_receipt(self, ocr_text):
         """
@@ -46,50 +93,97 @@ class AIParser:
             ocr_text: Raw text extracted from receipt
 
         Returns:
-            dict: Structured receipt data with format:
-                {
-                    "store": str,
-                    "date": str (ISO format),
-                    "items": [{"name": str, "price": str, "category": str}],
-                    "total": str,
-                    "currency": str
-                }
+            ParsedReceipt: store, date (ISO format), items (LineItem tuple),
+                total_cents and currency; amounts are integer cents
         """
+        with timer('parse'):
+            return self._parse(ocr_text)
+
+    def parse_receipt_versioned(self, ocr_text):
+        """
+        Parse OCR text and report the version that produced the result.
+
+        Returns:
+            tuple: (ParsedReceipt, parser version to cache the result under)
+        """
+        version = self.version
+        return self.parse_receipt(ocr_text), version
+
+    def _parse(self, ocr_text):
         # MOCK IMPLEMENTATION
         # This uses rule-based parsing for the mock OCR output
         # In production, replace with AI API call
 
-        lines = ocr_text.strip().split('\n')
-
         # Extract store (first non-empty line)
-        store = lines[0] if lines else "Unknown Store"
-
-        # Extract date
-        date_str = self._extract_date(ocr_text)
-
-        # Extract currency
-        currency = self._extract_currency(ocr_text)
-
-        # Extract items
-        items = self._extract_items(ocr_text)
-
-        # Extract total
-        total = self._extract_total(ocr_text)
+        store = ocr_text.strip().split('\n', 1)[0]
+
+        # Extract items (one per line with a price)
+        lines = []
+        for match in ITEM_PATTERN.finditer(ocr_text):
+            item_name = match.group(1).strip()
+
+            # Skip lines that are totals
+            if NON_ITEM_PATTERN.search(item_name):
+                continue
+
+            lines.append((item_name, parse_amount(match.group(2))))
+
+        # All items of the receipt are categorized in one batch
+        categories = self.categorizer.categorize_many([name for name, _ in lines])
+        items = [LineItem(name, price_cents, category)
+                 for (name, price_cents), category in zip(lines, categories)]
+
+        # Extract total (first match per keyword, then by keyword priority)
+        totals = {}
+        for match in TOTAL_PATTERN.finditer(ocr_text):
+            totals.setdefault(match.group(1).lower(), match.group(2))
+
+        return ParsedReceipt(
+            store=store,
+            date=self._format_date(DATE_PATTERN.search(ocr_text)),
+            items=tuple(items),
+            total_cents=self._select_total(totals),
+            currency=self._extract_currency(ocr_text)
+        )
+
+    def parse_many(self, texts, workers=None, chunk_size=256):
+        """
+        Parse many OCR texts, yielding results in input order.
 
-        return {
-            "store": store,
-            "date": date_str,
-            "items": items,
-            "total": total,
-            "currency": currency
-        }
+        Texts are consumed lazily and sent to a process pool in chunks; each
+        worker receives a copy of this parser once and reuses its compiled
+        state for every chunk. At most two chunks per worker are in flight,
+        so memory stays bounded for arbitrarily long inputs.
 
-    def _extract_date(self, text):
-        """Extract and parse date from receipt text."""
-        # Look for date patterns
-        date_pattern = r'Date:\s*(\d{1,2}/\d{1,2}/\d{4})'
-        match = re.search(date_pattern, text)
+        Args:
+            texts: Iterable of OCR text strings
+            workers: Number of worker processes (None or 1 parses inline)
+            chunk_size: Texts sent to a worker per task
 
+        Yields:
+            ParsedReceipt: parse_receipt() output for each text
+        """
+        if not workers or workers <= 1:
+            for text in texts:
+                yield self.parse_receipt(text)
+            return
+
+        texts = iter(texts)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(self,)) as pool:
+            in_flight = deque()
+            while True:
+                while len(in_flight) < workers * 2:
+                    chunk = list(islice(texts, chunk_size))
+                    if not chunk:
+                        break
+                    in_flight.append(pool.submit(_parse_chunk, chunk))
+                if not in_flight:
+                    break
+                yield from in_flight.popleft().result()
+
+    def _format_date(self, match):
+        """Convert a matched receipt date to ISO format."""
         if match:
             date_str = match.group(1)
             try:
@@ -102,79 +196,24 @@ class AIParser:
         # Default to today if no date found
         return datetime.now().strftime('%Y-%m-%d')
 
-    def _extract_items(self, text):
-        """Extract line items from receipt text."""
-        items = []
-
-        # Look for lines with item name and price
-        # Pattern: text followed by price in various formats:
-        # $12.34, €12,34, 12.34, 12,34
-        item_pattern = r'(.+?)\s+(?:[\$€£¥]?\s*)?(\d+[.,]\d{2})\s*(?:[\$€£¥])?'
-
-        lines = text.split('\n')
-        for line in lines:
-            match = re.search(item_pattern, line)
-            if match:
-                item_name = match.group(1).strip()
-                price = match.group(2)
-
-                # Normalize price format (convert comma to dot)
-                price = self._normalize_price(price)
-
-                # Skip lines that are totals
-                if any(keyword in item_name.lower() for keyword in ['subtotal', 'total', 'tax', 'suma', 'importe']):
-                    continue
-
-                # Categorize item
-                category = self._categorize_item(item_name)
-
-                items.append({
-                    "name": item_name,
-                    "price": price,
-                    "category": category
-                })
-
-        return items
-
-    def _extract_total(self, text):
-        """Extract total amount from receipt."""
-        # Look for total line in multiple formats
-        # Patterns: Total: $12.34, TOTAL (€) 12,34, Total 12.34
-        total_patterns = [
-            r'[Tt][Oo][Tt][Aa][Ll]\s*(?:\([€\$£¥]\))?\s*(?:[€\$£¥])?\s*(\d+[.,]\d{2})',
-            r'[Ss][Uu][Mm][Aa]\s*(?:\([€\$£¥]\))?\s*(?:[€\$£¥])?\s*(\d+[.,]\d{2})',
-            r'[Ii][Mm][Pp][Oo][Rr][Tt][Ee]\s*(?:\([€\$£¥]\))?\s*(?:[€\$£¥])?\s*(\d+[.,]\d{2})',
-        ]
-
-        for pattern in total_patterns:
-            match = re.search(pattern, text)
-            if match:
-                price = match.group(1)
-                return self._normalize_price(price)
-
-        return "0.00"
-
-    def _normalize_price(self, price_str):
-        """Normalize price format by converting comma to dot."""
-        # Replace comma with dot for decimal separator
-        return price_str.replace(',', '.')
+    def _select_total(self, totals):
+        """Pick the total in cents by keyword priority (total, suma, importe)."""
+        for keyword in TOTAL_KEYWORDS:
+            if keyword in totals:
+                return parse_amount(totals[keyword])
+        return 0
 
     def _extract_currency(self, text):
-        """Detect currency from receipt text."""
-        # Check for currency symbols
-        if '€' in text or 'EUR' in text.upper():
-            return 'EUR'
-        elif '£' in text or 'GBP' in text.upper():
-            return 'GBP'
-        elif '¥' in text or 'JPY' in text.upper() or 'CNY' in text.upper():
-            return 'JPY'
-        elif '$' in text:
-            # Could be USD, CAD, AUD, etc. Default to USD
-            return 'USD'
+        """Detect currency from symbols/codes in the receipt text."""
+        currencies = {CURRENCY_CODES[token.upper()] for token in CURRENCY_PATTERN.findall(text)}
+        for currency in CURRENCY_PRIORITY:
+            # '$' could be USD, CAD, AUD, etc. Default to USD
+            if currency in currencies:
+                return currency
 
         # Default to EUR for comma-based decimal separators
         # (common in Europe)
-        if re.search(r'\d+,\d{2}', text):
+        if COMMA_DECIMAL_PATTERN.search(text):
             return 'EUR'
 
         return 'USD'  # Default fallback
@@ -183,85 +222,7 @@ class AIParser:
         """
         Categorize item based on name.
 
-        Categories: groceries, household, alcohol, other
-        """
-        item_lower = item_name.lower()
-
-        # Alcohol keywords
-        alcohol_keywords = ['beer', 'wine', 'liquor', 'vodka', 'whiskey', 'rum', 'tequila']
-        if any(keyword in item_lower for keyword in alcohol_keywords):
-            return 'alcohol'
-
-        # Household keywords
-        household_keywords = ['detergent', 'paper', 'towel', 'soap', 'cleaner', 'tissue', 'trash', 'bag']
-        if any(keyword in item_lower for keyword in household_keywords):
-            return 'household'
-
-        # Groceries (most food items)
-        grocery_keywords = [
-            'milk', 'bread', 'egg', 'chicken', 'beef', 'pork', 'fish',
-            'banana', 'apple', 'orange', 'tomato', 'lettuce', 'carrot',
-            'pasta', 'rice', 'cereal', 'cheese', 'yogurt', 'juice',
-            'organic', 'fresh', 'frozen'
-        ]
-        if any(keyword in item_lower for keyword in grocery_keywords):
-            return 'groceries'
-
-        # Default to groceries for food-related stores
-        return 'groceries'
-
-    def parse_receipt_with_ai(self, ocr_text):
-        """
-        PLACEHOLDER for real AI implementation.
-
-        Uncomment and modify based on your chosen AI service.
+        Uses the learned model if the categorizer has one, otherwise the
+        keywords in services/category_rules.cfg.
         """
-        # Example: OpenAI GPT-4
-        # import openai
-        # import json
-        #
-        # prompt = f"""
-        # Parse this receipt text into JSON format with this structure:
-        # {{
-        #     "store": "store name",
-        #     "date": "YYYY-MM-DD",
-        #     "items": [
-        #         {{"name": "item name", "price": "0.00", "category": "groceries|household|alcohol|other"}}
-        #     ],
-        #     "total": "0.00"
-        # }}
-        #
-        # Receipt text:
-        # {ocr_text}
-        #
-        # Return only the JSON, no additional text.
-        # """
-        #
-        # response = openai.ChatCompletion.create(
-        #     model="gpt-4",
-        #     messages=[
-        #         {"role": "system", "content": "You are a receipt parsing assistant. Return only valid JSON."},
-        #         {"role": "user", "content": prompt}
-        #     ],
-        #     temperature=0.1
-        # )
-        #
-        # result = response.choices[0].message.content
-        # return json.loads(result)
-
-        # Example: Anthropic Claude
-        # import anthropic
-        # import json
-        #
-        # client = anthropic.Anthropic(api_key="...")
-        # message = client.messages.create(
-        #     model="claude-3-5-sonnet-20241022",
-        #     max_tokens=1024,
-        #     messages=[{
-        #         "role": "user",
-        #         "content": f"Parse this receipt into JSON: {ocr_text}"
-        #     }]
-        # )
-        # return json.loads(message.content[0].text)
-
-        raise NotImplementedError("Real AI parsing not implemented yet")
+        return self.categorizer.categorize(item_name)
@@ -0,0 +1,392 @@
+"""
+Columnar analytics snapshot for ad-hoc spending queries.
+
+Receipts and line items are kept as flat NumPy columns on disk, so
+group-by queries over years of data are a few vectorized passes instead
+of walking nested receipt dicts:
+
+    receipts: day (int32), cents (int64), store (int32), currency (int16),
+              base_cents (int64), base_currency (int16)
+    items:    day (int32), cents (int64), category (int16), store (int32),
+              currency (int16), base_cents (int64), base_currency (int16)
+
+`day` is the receipt date as days since 1970-01-01. Stores, categories
+and currencies are dictionary-encoded. `base_cents` is the amount
+converted to `base_currency` at ingest (see fx_rates); base_currency is
+-1 for receipts that could not be converted. Each column is a raw binary file
+that is memory-mapped for reads and appended to on upload. A small
+snapshot.json records the committed row counts and dictionaries, and is
+rewritten last, so a crash mid-append leaves extra bytes that are
+ignored. It also counts the receipts ingested, so a snapshot that missed
+receipts (a crash between the storage write and the append) is detected
+at startup and rebuilt. A full rebuild writes a new generation directory and then
+switches snapshot.json to it, so other processes (e.g. the
+reparse-receipts command) can rebuild while the server keeps reading.
+Appends and rebuilds from several server processes are serialized by a
+lock file (snapshot.lock); reads take no cross-process lock.
+"""
+
+import copy
+import json
+import os
+import shutil
+import threading
+from datetime import date
+
+import numpy as np
+
+from services.file_lock import FileLock
+
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+COLUMNS = {
+    'receipts': (('day', np.int32), ('cents', np.int64), ('store', np.int32),
+                 ('currency', np.int16), ('base_cents', np.int64), ('base_currency', np.int16)),
+    'items': (('day', np.int32), ('cents', np.int64), ('category', np.int16),
+              ('store', np.int32), ('currency', np.int16), ('base_cents', np.int64),
+              ('base_currency', np.int16)),
+}
+# Bumped when COLUMNS changes; older snapshots are rebuilt on startup
+FORMAT = 2
+DICTIONARIES = ('stores', 'categories', 'currencies')
+GRANULARITIES = ('day', 'week', 'month', 'all')
+
+
+def to_day(date_str):
+    """Return days since 1970-01-01 for a YYYY-MM-DD string, or None if invalid."""
+    try:
+        return date.fromisoformat(date_str).toordinal() - EPOCH_ORDINAL
+    except (TypeError, ValueError):
+        return None
+
+
+def day_label(day):
+    """Format a day number back into YYYY-MM-DD."""
+    return date.fromordinal(int(day) + EPOCH_ORDINAL).isoformat()
+
+
+class AnalyticsSnapshot:
+    """Memory-mapped columnar copy of receipts and items for analytics."""
+
+    def __init__(self, directory):
+        """
+        Open (or create) the snapshot.
+
+        Args:
+            directory: Directory holding snapshot.json and the column files
+        """
+        self.directory = directory
+        self.meta_path = os.path.join(directory, 'snapshot.json')
+        self._lock = threading.RLock()
+        self._write_lock = FileLock(os.path.join(directory, 'snapshot.lock'))
+        self._fingerprint = None
+        self._meta = None
+        self._codes = {}
+        self._mapped = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def exists(self):
+        """Return True if a snapshot has been built."""
+        return os.path.exists(self.meta_path)
+
+    def is_current(self, receipt_count):
+        """
+        Check whether the snapshot can be used as is.
+
+        Args:
+            receipt_count: Number of receipts in storage
+
+        Returns:
+            bool: True if a snapshot in the current column format exists
+                and has ingested exactly receipt_count receipts
+        """
+        if not self.exists():
+            return False
+        with self._lock:
+            self._refresh()
+            return self._meta.get('format') == FORMAT and self._meta.get('receipt_count') == receipt_count
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.meta_path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _empty_meta(self, generation):
+        return {
+            'format': FORMAT,
+            'generation': generation,
+            'rows': {table: 0 for table in COLUMNS},
+            # Receipts ingested, including those left out for invalid dates
+            'receipt_count': 0,
+            **{name: [] for name in DICTIONARIES}
+        }
+
+    def _refresh(self):
+        """Reload metadata if snapshot.json changed on disk (caller holds the lock)."""
+        fingerprint = self._stat()
+        if fingerprint == self._fingerprint and self._meta is not None:
+            return
+        if fingerprint is None:
+            meta = self._empty_meta(0)
+        else:
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        self._meta = meta
+        self._fingerprint = fingerprint
+        self._codes = {name: {value: code for code, value in enumerate(meta[name])}
+                       for name in DICTIONARIES}
+        self._mapped = {}
+
+    def _generation_dir(self, generation):
+        return os.path.join(self.directory, f'gen-{generation}')
+
+    def _column_path(self, generation, table, column):
+        return os.path.join(self._generation_dir(generation), f'{table}.{column}.bin')
+
+    def _write_meta(self, meta):
+        """Atomically replace snapshot.json (this commits appended rows)."""
+        tmp_path = self.meta_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.meta_path)
+        self._fingerprint = self._stat()
+
+    def _encode(self, meta, codes, name, value):
+        code = codes[name].get(value)
+        if code is None:
+            code = len(meta[name])
+            meta[name].append(value)
+            codes[name][value] = code
+        return code
+
+    def _to_columns(self, receipts, meta, codes):
+        """Convert receipt dicts into per-table lists of column values."""
+        rows = {table: {column: [] for column, _ in columns} for table, columns in COLUMNS.items()}
+        for receipt in receipts:
+            day = to_day(receipt.get('date'))
+            if day is None:
+                # Receipts with invalid dates are left out, as in the monthly stats
+                continue
+            store = self._encode(meta, codes, 'stores', receipt.get('store') or '')
+            currency = self._encode(meta, codes, 'currencies', receipt.get('currency', 'USD'))
+            base_currency = -1
+            if 'base_total_cents' in receipt:
+                base_currency = self._encode(meta, codes, 'currencies', receipt['base_currency'])
+
+            table = rows['receipts']
+            table['day'].append(day)
+            table['cents'].append(receipt.get('total_cents', 0))
+            table['store'].append(store)
+            table['currency'].append(currency)
+            table['base_cents'].append(receipt.get('base_total_cents', 0))
+            table['base_currency'].append(base_currency)
+
+            table = rows['items']
+            for item in receipt.get('items', []):
+                table['day'].append(day)
+                table['cents'].append(item.get('price_cents', 0))
+                table['category'].append(
+                    self._encode(meta, codes, 'categories', item.get('category', 'other')))
+                table['store'].append(store)
+                table['currency'].append(currency)
+                table['base_cents'].append(item.get('base_price_cents', 0))
+                table['base_currency'].append(base_currency)
+        return rows
+
+    def _append_columns(self, generation, rows, committed):
+        """Append column values after the committed rows of each file."""
+        for table, columns in COLUMNS.items():
+            for column, dtype in columns:
+                path = self._column_path(generation, table, column)
+                values = np.asarray(rows[table][column], dtype=dtype)
+                with open(path, 'ab') as f:
+                    # Drop bytes of a previously interrupted append
+                    f.truncate(committed[table] * np.dtype(dtype).itemsize)
+                    f.write(values.tobytes())
+
+    def append(self, receipts):
+        """
+        Add newly stored receipts to the snapshot.
+
+        Args:
+            receipts: Receipt dicts just written to storage
+        """
+        with self._write_lock, self._lock:
+            self._refresh()
+            meta = copy.deepcopy(self._meta)
+            codes = {name: dict(values) for name, values in self._codes.items()}
+            generation = meta['generation']
+            os.makedirs(self._generation_dir(generation), exist_ok=True)
+
+            rows = self._to_columns(receipts, meta, codes)
+            self._append_columns(generation, rows, meta['rows'])
+            for table in COLUMNS:
+                meta['rows'][table] += len(rows[table]['day'])
+            meta['receipt_count'] = meta.get('receipt_count', 0) + len(receipts)
+            self._write_meta(meta)
+            self._meta = meta
+            self._codes = codes
+
+    def rebuild(self, receipts):
+        """
+        Rebuild the snapshot from scratch (after receipts were rewritten).
+
+        Args:
+            receipts: Every stored receipt
+        """
+        with self._write_lock, self._lock:
+            self._refresh()
+            previous = self._meta.get('generation') if self.exists() else None
+            meta = self._empty_meta((previous or 0) + 1)
+            codes = {name: {} for name in DICTIONARIES}
+            generation = meta['generation']
+            shutil.rmtree(self._generation_dir(generation), ignore_errors=True)
+            os.makedirs(self._generation_dir(generation))
+
+            rows = self._to_columns(receipts, meta, codes)
+            self._append_columns(generation, rows, meta['rows'])
+            for table in COLUMNS:
+                meta['rows'][table] = len(rows[table]['day'])
+            meta['receipt_count'] = len(receipts)
+            self._write_meta(meta)
+            self._meta = meta
+            self._codes = codes
+            self._mapped = {}
+
+            # Readers that already mapped the old files keep them until they
+            # notice the new generation; unlinked files stay readable
+            if previous is not None:
+                shutil.rmtree(self._generation_dir(previous), ignore_errors=True)
+
+    def _table(self, table):
+        """Return {column: array} for a table, memory-mapping its files."""
+        self._refresh()
+        arrays = self._mapped.get(table)
+        rows = self._meta['rows'][table]
+        if arrays is None or len(arrays['day']) != rows:
+            arrays = {}
+            for column, dtype in COLUMNS[table]:
+                if rows:
+                    path = self._column_path(self._meta['generation'], table, column)
+                    arrays[column] = np.memmap(path, dtype=dtype, mode='r', shape=(rows,))
+                else:
+                    arrays[column] = np.empty(0, dtype=dtype)
+            self._mapped[table] = arrays
+        return arrays
+
+    def _select(self, columns, date_from, date_to, currency, base_currency):
+        """
+        Return (row mask, amount column) for a query.
+
+        With a currency, rows in that currency and their original amounts
+        are selected; otherwise rows converted to base_currency and their
+        converted amounts.
+        """
+        mask = np.ones(len(columns['day']), dtype=bool)
+        if date_from is not None:
+            mask &= columns['day'] >= to_day(date_from)
+        if date_to is not None:
+            mask &= columns['day'] <= to_day(date_to)
+        column, amounts = ('currency', 'cents') if currency is not None else ('base_currency', 'base_cents')
+        code = self._codes['currencies'].get(currency if currency is not None else base_currency)
+        if code is None:
+            mask[:] = False
+        else:
+            mask &= columns[column] == code
+        return mask, columns[amounts]
+
+    def spend_by_store(self, date_from=None, date_to=None, currency=None, base_currency='USD'):
+        """
+        Total spend and receipt count per store.
+
+        Args:
+            date_from, date_to: Optional inclusive YYYY-MM-DD receipt date range
+            currency: Only receipts in this currency, in original amounts
+            base_currency: Currency of converted amounts (used without currency)
+
+        Returns:
+            list: [{'store', 'total', 'receipt_count'}] by total, highest first
+        """
+        with self._lock:
+            columns = self._table('receipts')
+            mask, amounts = self._select(columns, date_from, date_to, currency, base_currency)
+            stores = columns['store'][mask]
+            size = len(self._meta['stores'])
+            # Sum in int64: bincount weights are float64 and lose exact cents
+            totals = np.zeros(size, dtype=np.int64)
+            np.add.at(totals, stores, amounts[mask])
+            counts = np.bincount(stores, minlength=size)
+            names = self._meta['stores']
+
+        results = [
+            {'store': names[code], 'total': round(int(totals[code]) / 100, 2), 'receipt_count': int(counts[code])}
+            for code in np.flatnonzero(counts)
+        ]
+        results.sort(key=lambda x: x['total'], reverse=True)
+        return results
+
+    def spend_by_category(self, date_from=None, date_to=None, granularity='all', currency=None,
+                          base_currency='USD'):
+        """
+        Item spend per category, optionally per day, week or month.
+
+        Args:
+            date_from, date_to: Optional inclusive YYYY-MM-DD receipt date range
+            granularity: 'day', 'week' (starting Monday), 'month' or 'all'
+            currency: Only receipts in this currency, in original amounts
+            base_currency: Currency of converted amounts (used without currency)
+
+        Returns:
+            list: [{'period', 'total', 'categories': [{'category', 'amount'}]}]
+            oldest first; period is the first day of each bucket (None for 'all')
+        """
+        with self._lock:
+            columns = self._table('items')
+            mask, amounts = self._select(columns, date_from, date_to, currency, base_currency)
+            days = columns['day'][mask].astype(np.int64)
+            categories = columns['category'][mask].astype(np.int64)
+            cents = amounts[mask]
+            names = self._meta['categories']
+
+        if granularity == 'day':
+            periods = days
+        elif granularity == 'week':
+            # 1970-01-01 was a Thursday; shift so buckets start on Monday
+            periods = days - (days + 3) % 7
+        elif granularity == 'month':
+            months = days.astype('datetime64[D]').astype('datetime64[M]')
+            periods = months.astype('datetime64[D]').astype(np.int64)
+        else:
+            periods = np.zeros(len(days), dtype=np.int64)
+
+        # Group by (period, category) with one sort, summing exact int64 cents
+        keys, inverse = np.unique(periods * len(names) + categories, return_inverse=True)
+        sums = np.zeros(len(keys), dtype=np.int64)
+        np.add.at(sums, inverse.reshape(-1), cents)
+
+        buckets = {}
+        for key, amount_cents in zip(keys.tolist(), sums.tolist()):
+            period, category = divmod(key, len(names))
+            buckets.setdefault(period, []).append((names[category], amount_cents))
+
+        results = []
+        for period, amounts in buckets.items():
+            amounts.sort(key=lambda x: x[1], reverse=True)
+            results.append({
+                'period': day_label(period) if granularity != 'all' else None,
+                'total': round(sum(cents for _, cents in amounts) / 100, 2),
+                'categories': [{'category': category, 'amount': round(cents / 100, 2)}
+                               for category, cents in amounts]
+            })
+        return results
+
+    def stats(self):
+        """Return row counts of the snapshot."""
+        with self._lock:
+            self._refresh()
+            return dict(self._meta['rows'])
@@ -0,0 +1,141 @@
+"""
+Keyword-based item categorizer used by AIParser.
+
+Category keywords are loaded from category_rules.cfg and compiled into a
+single trie-shaped regex, so categorizing an item is one regex scan of its
+name no matter how many keywords the rules contain.
+
+Matching keeps the original substring semantics: an item belongs to the
+highest-priority category that has any keyword contained in its name.
+The regex finds the longest keyword starting at each position; each
+keyword is pre-assigned the best category among all keywords contained
+in it, so the result is the same as testing every keyword.
+"""
+
+import configparser
+import os
+import re
+
+
+DEFAULT_RULES_FILE = os.path.join(os.path.dirname(__file__), 'category_rules.cfg')
+DEFAULT_CATEGORY = 'groceries'
+
+
+def load_category_rules(path=DEFAULT_RULES_FILE):
+    """
+    Load category keyword rules.
+
+    Args:
+        path: Path to a rules file with one [category] section per
+            category (in priority order) and one keyword per line
+
+    Returns:
+        list: [(category, [keywords])] in priority order
+    """
+    config = configparser.ConfigParser(allow_no_value=True, delimiters=('=',), interpolation=None)
+    with open(path, 'r', encoding='utf-8') as f:
+        config.read_file(f)
+    return [(section, [kw.strip().lower() for kw in config[section] if kw.strip()])
+            for section in config.sections()]
+
+
+def _trie_regex(words):
+    """Build a regex matching any of words, factored by shared prefixes."""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def build(node):
+        # Longer continuations are tried before ending here (longest match)
+        end = node.get('') is True
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if end:
+            return '(?:' + body + ')?'
+        return body
+
+    return build(trie)
+
+
+class KeywordCategorizer:
+    """Assigns item categories from keyword rules with one compiled regex."""
+
+    # Parse results are cached by categorizer version (see AIParser.version)
+    version = 'rules'
+
+    def __init__(self, rules=None, default=DEFAULT_CATEGORY):
+        """
+        Compile the rules.
+
+        Args:
+            rules: [(category, [keywords])] in priority order
+                (defaults to category_rules.cfg)
+            default: Category for items matching no keyword
+        """
+        if rules is None:
+            rules = load_category_rules()
+        self.default = default
+        self.categories = [category for category, _ in rules]
+
+        # Priority rank of each keyword's own category (lower is better)
+        rank = {}
+        for priority, (_, keywords) in enumerate(rules):
+            for keyword in keywords:
+                rank.setdefault(keyword, priority)
+
+        # A keyword's effective rank is the best one among all keywords it
+        # contains, since matching it implies matching those as well
+        self._rank_of = {}
+        for keyword in rank:
+            self._rank_of[keyword] = min(
+                rank.get(keyword[i:j], len(rules))
+                for i in range(len(keyword))
+                for j in range(i + 1, len(keyword) + 1)
+            )
+
+        self._pattern = None
+        if rank:
+            self._pattern = re.compile('(?=(' + _trie_regex(rank) + '))')
+
+    def match(self, item_name):
+        """
+        Return the category of the best keyword in an item name.
+
+        Args:
+            item_name: Item name as printed on the receipt
+
+        Returns:
+            str: Category name, or None if no keyword matches
+        """
+        if self._pattern is None:
+            return None
+
+        best = None
+        for keyword in self._pattern.findall(item_name.lower()):
+            rank = self._rank_of[keyword]
+            if best is None or rank < best:
+                best = rank
+                if best == 0:
+                    break
+        return self.categories[best] if best is not None else None
+
+    def categorize(self, item_name):
+        """
+        Categorize an item by name.
+
+        Args:
+            item_name: Item name as printed on the receipt
+
+        Returns:
+            str: Category name (the default if no keyword matches)
+        """
+        return self.match(item_name) or self.default
+
+    def categorize_many(self, item_names):
+        """Categorize several items; returns a list of category names."""
+        return [self.categorize(name) for name in item_names]
@@ -0,0 +1,126 @@
+"""
+Change log for delta sync.
+
+Every receipt write is recorded with a change sequence number that only
+ever grows, across all server processes. GET /receipts/changes?since=<seq>
+returns the receipts changed after seq, and list and stats responses use
+the current sequence in their ETags.
+
+The log keeps one row per receipt: a new change to a receipt replaces
+its row with one at the next sequence number. A client that is behind
+therefore gets each changed receipt once, in its latest state, and the
+log never grows beyond one row per receipt (deleted receipts stay as
+tombstones). Rows carry the list summary of the receipt, so serving
+changes never touches receipt storage. The log lives in its own SQLite
+database (data/changes.db), whichever storage backend is in use, and is
+written after the receipt storage, analytics and search index, so data
+read after reading sequence N includes every change up to N.
+"""
+
+import sqlite3
+import threading
+
+from services import json_codec
+from services.storage import summarize_receipt
+
+
+class ChangeLog:
+    """Per-receipt change sequence in SQLite."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            receipt_id TEXT NOT NULL UNIQUE,
+            created_seq INTEGER,        -- seq of the first change; NULL if this is it
+            deleted INTEGER NOT NULL DEFAULT 0,
+            summary TEXT                -- JSON list summary; NULL once deleted
+        );
+    """
+
+    def __init__(self, path):
+        """
+        Open (or create) the change log.
+
+        Args:
+            path: Path to the SQLite database file holding the log
+        """
+        self.path = path
+        self._local = threading.local()
+
+        conn = self._connect()
+        with conn:
+            conn.executescript(self.SCHEMA)
+
+    def _connect(self):
+        """Return the calling thread's connection, opening it on first use."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def is_empty(self):
+        """Return True if no change was ever recorded."""
+        return self._connect().execute('SELECT 1 FROM changes LIMIT 1').fetchone() is None
+
+    def current_seq(self):
+        """Return the latest change sequence number (0 before the first change)."""
+        return self._connect().execute('SELECT coalesce(max(seq), 0) FROM changes').fetchone()[0]
+
+    def record(self, receipts=(), deleted_ids=()):
+        """
+        Record new or changed receipts and deletions in one transaction.
+
+        Args:
+            receipts: Receipt dicts as stored, in the order to number them
+            deleted_ids: Ids of receipts that were removed
+        """
+        conn = self._connect()
+        with conn:
+            # REPLACE drops the receipt's previous row and inserts one with
+            # the next sequence number, keeping when it was first seen
+            conn.executemany("""
+                INSERT OR REPLACE INTO changes (receipt_id, created_seq, deleted, summary)
+                VALUES (?, (SELECT coalesce(created_seq, seq) FROM changes
+                            WHERE receipt_id = ? AND NOT deleted), 0, ?)
+            """, [(r['id'], r['id'], json_codec.dumps(summarize_receipt(r))) for r in receipts])
+            conn.executemany(
+                'INSERT OR REPLACE INTO changes (receipt_id, deleted) VALUES (?, 1)',
+                [(receipt_id,) for receipt_id in deleted_ids]
+            )
+
+    def changes(self, since, limit):
+        """
+        Return receipts changed after a sequence number, oldest change first.
+
+        Args:
+            since: Sequence number the client is up to date with (0 for all)
+            limit: Maximum number of changes
+
+        Returns:
+            tuple: (changes, next_since, has_more). Each change is
+                {"seq", "op": "created"|"updated"|"deleted", "id"} plus the
+                receipt summary for created and updated receipts. next_since
+                is the sequence number to pass as since next time.
+        """
+        rows = self._connect().execute(
+            'SELECT seq, receipt_id, created_seq, deleted, summary FROM changes '
+            'WHERE seq > ? ORDER BY seq LIMIT ?',
+            (since, limit + 1)
+        ).fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        changes = []
+        for seq, receipt_id, created_seq, deleted, summary in rows:
+            change = {'seq': seq, 'id': receipt_id}
+            if deleted:
+                change['op'] = 'deleted'
+            else:
+                # Receipts the client has never seen are new to it
+                change['op'] = 'created' if (created_seq or seq) > since else 'updated'
+                change['receipt'] = json_codec.loads(summary)
+            changes.append(change)
+        return changes, (rows[-1][0] if rows else since), has_more
@@ -0,0 +1,83 @@
+"""
+Negotiated compression of API responses.
+
+JSON and text responses of at least min_size bytes are compressed with
+the best encoding the client accepts: Brotli if the optional brotli
+package is installed and the client sends "br", otherwise gzip. Smaller
+responses are sent as is, since compressing them saves too few bytes to
+be worth the time. So are streamed responses such as images, which are
+already compressed and support byte ranges.
+"""
+
+import gzip
+
+try:
+    import brotli  # Optional dependency
+except ImportError:
+    brotli = None
+
+from services.metrics import timer
+
+
+COMPRESSIBLE_TYPES = frozenset({'application/json', 'text/plain', 'text/csv', 'text/html'})
+
+
+class ResponseCompressor:
+    """Compresses Flask responses by Accept-Encoding."""
+
+    def __init__(self, min_size=1024, gzip_level=6, brotli_quality=4, mimetypes=COMPRESSIBLE_TYPES):
+        """
+        Initialize the compressor.
+
+        Args:
+            min_size: Smallest response body in bytes worth compressing
+            gzip_level: gzip level (1 fastest - 9 smallest)
+            brotli_quality: Brotli quality (0 fastest - 11 smallest; above
+                about 5 it gets too slow for responses built per request)
+            mimetypes: Response types to compress
+        """
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.mimetypes = mimetypes
+        # In order of preference when the client accepts several equally
+        self.encodings = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+    def compress(self, response, accept_encodings):
+        """
+        Compress a response in place if the client accepts it and it is large enough.
+
+        Args:
+            response: Flask response
+            accept_encodings: The request's parsed Accept-Encoding header
+                (request.accept_encodings)
+
+        Returns:
+            The response
+        """
+        if (response.mimetype not in self.mimetypes or response.direct_passthrough
+                or response.is_streamed or 'Content-Encoding' in response.headers):
+            return response
+
+        # Caches must keep compressed and uncompressed copies apart
+        response.vary.add('Accept-Encoding')
+        if response.status_code not in (200, 201) or (response.content_length or 0) < self.min_size:
+            return response
+        encoding = accept_encodings.best_match(self.encodings)
+        if encoding is None:
+            return response
+
+        data = response.get_data()
+        with timer('compress', encoding=encoding):
+            if encoding == 'br':
+                data = brotli.compress(data, quality=self.brotli_quality)
+            else:
+                data = gzip.compress(data, compresslevel=self.gzip_level, mtime=0)
+        response.set_data(data)
+        response.headers['Content-Encoding'] = encoding
+
+        # A strong ETag names exact bytes, which compression changes
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
@@ -0,0 +1,84 @@
+"""
+Cross-process file lock.
+
+The file-based storage backends and the analytics snapshot are written
+by every server worker process. FileLock serializes those writes with an
+advisory lock on a small lock file (flock on POSIX, msvcrt on Windows)
+and also works as a reentrant lock between threads of one process.
+"""
+
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    """Exclusive lock shared by all processes using the same lock file."""
+
+    def __init__(self, path):
+        """
+        Initialize the lock (the lock file is created on first use).
+
+        Args:
+            path: Path of the lock file
+        """
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+        self._pid = None
+
+    def acquire(self):
+        """Block until this thread holds the lock (reentrant)."""
+        self._thread_lock.acquire()
+        if self._depth == 0:
+            try:
+                if self._file is None or self._pid != os.getpid():
+                    # Lock files are opened per process; a descriptor
+                    # inherited across fork would share the parent's lock
+                    self._file = open(self.path, 'a+b')
+                    self._pid = os.getpid()
+                self._lock_file()
+            except BaseException:
+                self._thread_lock.release()
+                raise
+        self._depth += 1
+
+    def release(self):
+        """Release one level of the lock."""
+        self._depth -= 1
+        if self._depth == 0:
+            self._unlock_file()
+        self._thread_lock.release()
+
+    def _lock_file(self):
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            return
+        self._file.seek(0)
+        while True:
+            try:
+                # Retries for ~10 seconds before raising; keep waiting
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                continue
+
+    def _unlock_file(self):
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            return
+        self._file.seek(0)
+        msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
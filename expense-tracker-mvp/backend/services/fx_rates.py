@@ -0,0 +1,193 @@
+"""
+Local daily FX rate table for converting receipts to a base currency.
+
+Rates come from a CSV file on disk (no network access), one row per day
+and currency, in the format published by the ECB:
+
+    date,currency,rate
+    2026-01-02,USD,1.0321
+    2026-01-02,GBP,0.8290
+
+`rate` is the number of units of `currency` per one unit of the quote
+currency (EUR for ECB data; the quote currency itself is implicitly 1).
+A receipt dated on a day without a rate (weekends, holidays) uses the
+most recent earlier rate. Receipts dated before the first rate of their
+currency are left unconverted.
+
+Conversion happens once, when a receipt is stored: the receipt record
+gets `base_currency`, `base_total_cents`, `fx_rate` and per-item
+`base_price_cents`, which the monthly aggregates and the analytics
+snapshot sum alongside the original amounts. Factors are cached per
+(date, currency).
+"""
+
+import csv
+import hashlib
+import json
+import os
+from bisect import bisect_right
+from decimal import Decimal, InvalidOperation, ROUND_HALF_EVEN
+
+
+CONVERTED_FIELDS = ('base_currency', 'base_total_cents', 'fx_rate')
+# Cross rates are rounded to this many decimal places, which is also what
+# is recorded in a receipt's fx_rate
+FACTOR_EXPONENT = Decimal('1e-10')
+
+
+class FXRates:
+    """Daily exchange rates from a local CSV file, with per-day factor caching."""
+
+    def __init__(self, path, base_currency='USD', quote_currency='EUR'):
+        """
+        Load the rate table.
+
+        Args:
+            path: Path to the rates CSV (a missing file means no rates, so
+                only receipts already in the base currency are converted)
+            base_currency: Currency that converted totals are expressed in
+            quote_currency: Currency the CSV rates are quoted against
+        """
+        self.path = path
+        self.base_currency = base_currency
+        self.quote_currency = quote_currency
+        # currency -> (sorted ISO dates, rates per quote unit)
+        self._rates = {}
+        self._factors = {}
+        self._digest = hashlib.sha256()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path, 'rb') as f:
+            self._digest.update(f.read())
+
+        table = {}
+        with open(self.path, 'r', encoding='utf-8', newline='') as f:
+            for line_number, row in enumerate(csv.DictReader(f), start=2):
+                try:
+                    day = row['date'].strip()
+                    currency = row['currency'].strip().upper()
+                    rate = Decimal(row['rate'].strip())
+                except (AttributeError, KeyError, InvalidOperation):
+                    raise ValueError(f'{self.path}:{line_number}: expected date,currency,rate')
+                if rate <= 0:
+                    raise ValueError(f'{self.path}:{line_number}: rate must be positive')
+                table.setdefault(currency, {})[day] = rate
+
+        for currency, by_day in table.items():
+            days = sorted(by_day)
+            self._rates[currency] = (days, [by_day[day] for day in days])
+
+    def fingerprint(self):
+        """Identify the base currency and rate table (changes when either does)."""
+        return {'base_currency': self.base_currency, 'quote_currency': self.quote_currency,
+                'rates_sha256': self._digest.hexdigest()}
+
+    def _quote_rate(self, date_str, currency):
+        """Units of currency per quote unit on date_str, or None if unknown."""
+        if currency == self.quote_currency:
+            return Decimal(1)
+        series = self._rates.get(currency)
+        if series is None:
+            return None
+        days, rates = series
+        index = bisect_right(days, date_str)
+        return rates[index - 1] if index else None
+
+    def factor(self, date_str, currency):
+        """
+        Return the base-currency value of one unit of currency on a date.
+
+        Args:
+            date_str: Receipt date (YYYY-MM-DD)
+            currency: Receipt currency code
+
+        Returns:
+            Decimal: Conversion factor, or None if no rate is available
+        """
+        if currency == self.base_currency:
+            return Decimal(1)
+        key = (date_str, currency)
+        if key not in self._factors:
+            factor = None
+            if isinstance(date_str, str):
+                source = self._quote_rate(date_str, currency)
+                target = self._quote_rate(date_str, self.base_currency)
+                if source is not None and target is not None:
+                    factor = (target / source).quantize(FACTOR_EXPONENT, rounding=ROUND_HALF_EVEN)
+            self._factors[key] = factor
+        return self._factors[key]
+
+    def convert(self, cents, factor):
+        """Convert integer cents with a factor, rounding half to even."""
+        return int((cents * factor).to_integral_value(rounding=ROUND_HALF_EVEN))
+
+    def convert_receipt(self, receipt):
+        """
+        Return a receipt record with base-currency amounts filled in.
+
+        Stale converted fields are dropped when no rate is available.
+
+        Args:
+            receipt: Receipt dict with integer cent amounts
+
+        Returns:
+            dict: New receipt dict
+        """
+        converted = {k: v for k, v in receipt.items() if k not in CONVERTED_FIELDS}
+        items = [{k: v for k, v in item.items() if k != 'base_price_cents'}
+                 for item in receipt.get('items', [])]
+        converted['items'] = items
+
+        factor = self.factor(receipt.get('date'), receipt.get('currency', 'USD'))
+        if factor is None:
+            return converted
+
+        converted['base_currency'] = self.base_currency
+        converted['base_total_cents'] = self.convert(receipt.get('total_cents', 0), factor)
+        converted['fx_rate'] = format(factor.normalize(), 'f')
+        for item in items:
+            item['base_price_cents'] = self.convert(item.get('price_cents', 0), factor)
+        return converted
+
+
+def reconvert_receipts(storage, fx_rates, state_path):
+    """
+    Re-convert stored receipts if the base currency or rate table changed.
+
+    The fingerprint of the rates used last is kept in state_path, so
+    this is a no-op on a normal start.
+
+    Args:
+        storage: ReceiptStorage instance
+        fx_rates: FXRates instance
+        state_path: JSON file recording the fingerprint of the last conversion
+
+    Returns:
+        int: Number of receipts updated, or None if nothing had to be checked
+    """
+    fingerprint = fx_rates.fingerprint()
+    try:
+        with open(state_path, 'r', encoding='utf-8') as f:
+            if json.load(f) == fingerprint:
+                return None
+    except (FileNotFoundError, ValueError):
+        pass
+
+    updated = []
+    for receipt in storage.load_all():
+        converted = fx_rates.convert_receipt(receipt)
+        if converted != receipt:
+            updated.append(converted)
+    if updated:
+        storage.update_receipts(updated)
+
+    tmp_path = state_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(fingerprint, f)
+    os.replace(tmp_path, state_path)
+    print(f"[FX] Converted {len(updated)} receipts to {fx_rates.base_currency}")
+    return len(updated)
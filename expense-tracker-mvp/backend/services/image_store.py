@@ -0,0 +1,214 @@
+"""
+Receipt image storage.
+
+Uploads are streamed to disk in chunks with a size limit. While streaming,
+the SHA-256 of the content is computed and the leading magic bytes are
+checked, so renamed non-images are rejected before any decoding. Each
+accepted image is then stored as two derivatives, keyed by content hash:
+
+1. uploads/<sha256>.jpg        - working copy, downscaled and recompressed
+                                 (used for OCR and full-size viewing)
+2. uploads/thumbs/<sha256>.jpg - small thumbnail for list views
+
+The original upload is moved to an optional cold originals directory,
+or discarded when none is configured. Phone photos are typically
+3-8 MB, while the two derivatives together are a few hundred KB.
+"""
+
+import hashlib
+import os
+import uuid
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from services.metrics import REGISTRY, timer
+
+
+# Leading bytes of each accepted image format
+MAGIC_BYTES = {
+    'png': (b'\x89PNG\r\n\x1a\n',),
+    'jpeg': (b'\xff\xd8\xff',),
+    'gif': (b'GIF87a', b'GIF89a'),
+}
+EXTENSIONS = {'png': 'png', 'jpeg': 'jpg', 'gif': 'gif'}
+MAGIC_LENGTH = max(len(magic) for signatures in MAGIC_BYTES.values() for magic in signatures)
+
+
+def sniff_image_type(header):
+    """
+    Identify an image format from its leading bytes.
+
+    Args:
+        header: First bytes of the file (at least MAGIC_LENGTH when available)
+
+    Returns:
+        str: 'png', 'jpeg' or 'gif', or None if the bytes match no known format
+    """
+    for image_type, signatures in MAGIC_BYTES.items():
+        if header.startswith(signatures):
+            return image_type
+    return None
+
+
+class ImageStore:
+    """Stores uploaded receipt images as a working copy and a thumbnail."""
+
+    def __init__(self, upload_dir, originals_dir=None, max_bytes=16 * 1024 * 1024,
+                 chunk_size=64 * 1024, working_max_side=1600, working_quality=85,
+                 thumb_size=320, thumb_quality=70):
+        """
+        Initialize the image store.
+
+        Args:
+            upload_dir: Directory for working copies (thumbnails go in thumbs/)
+            originals_dir: Directory to keep original uploads in, or None to
+                discard them after the derivatives are written
+            max_bytes: Maximum size of one uploaded image
+            chunk_size: Bytes read per chunk while streaming an upload
+            working_max_side: Shorter side of the working copy in pixels
+                (1600 keeps a full-width receipt above 300 DPI)
+            working_quality: JPEG quality of the working copy
+            thumb_size: Bounding box of thumbnails in pixels
+            thumb_quality: JPEG quality of thumbnails
+        """
+        self.upload_dir = upload_dir
+        self.thumb_dir = os.path.join(upload_dir, 'thumbs')
+        self.originals_dir = originals_dir
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.working_max_side = working_max_side
+        self.working_quality = working_quality
+        self.thumb_size = thumb_size
+        self.thumb_quality = thumb_quality
+
+        os.makedirs(self.thumb_dir, exist_ok=True)
+        if originals_dir:
+            os.makedirs(originals_dir, exist_ok=True)
+
+    def path(self, filename):
+        """Return the path of a stored working copy."""
+        return os.path.join(self.upload_dir, filename)
+
+    def thumbnail_path(self, filename):
+        """Return the thumbnail path for a stored working copy."""
+        return os.path.join(self.thumb_dir, os.path.splitext(filename)[0] + '.jpg')
+
+    def ensure_thumbnail(self, filename):
+        """
+        Return the thumbnail path of a stored image, creating it if missing.
+
+        Images stored before thumbnails existed get one on first request.
+
+        Returns:
+            str: Thumbnail path, or None if the image itself is missing
+        """
+        thumb_path = self.thumbnail_path(filename)
+        if os.path.exists(thumb_path):
+            return thumb_path
+
+        source_path = self.path(filename)
+        if not os.path.exists(source_path):
+            return None
+        try:
+            with Image.open(source_path) as image:
+                image.draft('RGB', (self.thumb_size, self.thumb_size))
+                self._write_thumbnail(self._to_rgb(ImageOps.exif_transpose(image)), thumb_path)
+        except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError):
+            return None
+        return thumb_path
+
+    def save(self, stream):
+        """
+        Stream an upload to disk and store its derivatives.
+
+        Args:
+            stream: Readable binary file object
+
+        Returns:
+            tuple: (content_hash, saved_filename, filepath) of the working copy
+
+        Raises:
+            ValueError: If the file is too large or not a valid image
+        """
+        tmp_path = os.path.join(self.upload_dir, f".{uuid.uuid4()}.part")
+        try:
+            with timer('image_spool'):
+                content_hash, image_type = self._spool(stream, tmp_path)
+            saved_filename = f"{content_hash}.jpg"
+            filepath = self.path(saved_filename)
+
+            # Content-addressed: an identical image was already stored
+            if not os.path.exists(filepath):
+                with timer('image_resize'):
+                    self._write_derivatives(tmp_path, filepath, self.thumbnail_path(saved_filename))
+                if self.originals_dir:
+                    original = os.path.join(self.originals_dir,
+                                            f"{content_hash}.{EXTENSIONS[image_type]}")
+                    os.replace(tmp_path, original)
+            return content_hash, saved_filename, filepath
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _spool(self, stream, tmp_path):
+        """Copy stream to tmp_path in chunks, checking magic bytes and size."""
+        header = stream.read(MAGIC_LENGTH)
+        image_type = sniff_image_type(header)
+        if image_type is None:
+            raise ValueError('Invalid image file')
+
+        digest = hashlib.sha256(header)
+        size = len(header)
+        with open(tmp_path, 'wb') as out:
+            out.write(header)
+            for chunk in iter(lambda: stream.read(self.chunk_size), b''):
+                size += len(chunk)
+                if size > self.max_bytes:
+                    raise ValueError(f'File too large (max {self.max_bytes // (1024 * 1024)}MB)')
+                digest.update(chunk)
+                out.write(chunk)
+        REGISTRY.inc('upload_bytes_total', size)
+        return digest.hexdigest(), image_type
+
+    def _write_derivatives(self, source_path, working_path, thumb_path):
+        """Write the downscaled working copy and thumbnail of an image."""
+        try:
+            with Image.open(source_path) as original:
+                # Let the JPEG decoder downscale while decoding (much cheaper)
+                scale = self.working_max_side / min(original.size)
+                if scale < 1.0:
+                    original.draft('RGB', tuple(round(side * scale) for side in original.size))
+
+                image = self._to_rgb(ImageOps.exif_transpose(original))
+                scale = self.working_max_side / min(image.size)
+                if scale < 1.0:
+                    size = tuple(max(1, round(side * scale)) for side in image.size)
+                    image = image.resize(size, Image.Resampling.LANCZOS)
+        except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError):
+            raise ValueError('Invalid image file')
+
+        self._write_thumbnail(image.copy(), thumb_path)
+        self._save_jpeg(image, working_path, self.working_quality)
+
+    def _write_thumbnail(self, image, thumb_path):
+        image.thumbnail((self.thumb_size, self.thumb_size), Image.Resampling.LANCZOS)
+        self._save_jpeg(image, thumb_path, self.thumb_quality)
+
+    def _to_rgb(self, image):
+        """Convert to RGB, flattening transparency onto white paper."""
+        if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image, mask=image.getchannel('A'))
+            return background
+        return image.convert('RGB')
+
+    def _save_jpeg(self, image, path, quality):
+        """Save as JPEG via a temporary name so readers never see partial files."""
+        tmp_path = f"{path}.{uuid.uuid4()}.part"
+        try:
+            image.save(tmp_path, 'JPEG', quality=quality, optimize=True, progressive=True)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
@@ -0,0 +1,393 @@
+"""
+Learned item categorizer: hashed character n-grams and a linear model.
+
+Item names are normalized (lowercased, digits and punctuation dropped)
+and turned into sparse features: each word and its character 2- to
+4-grams (padded with spaces, so word starts and ends count), hashed into
+a fixed number of buckets. A softmax regression over those features,
+trained in NumPy, assigns the category. There is no vocabulary to store
+or grow, so names never seen before still share n-grams with known ones
+("lagers" with "lager", "dish soap" with "soap").
+
+`flask --app app train-categorizer` trains the model from the items of
+stored receipts plus a CSV of corrected item categories, and saves it as
+one compressed .npz file. Corrected names are also kept verbatim in the
+model, so a correction always wins for that exact name.
+
+LearnedCategorizer scores all items of a receipt in one vectorized pass
+and keeps the category of each normalized name in an LRU cache, so
+repeat products skip scoring entirely. The model is loaded on first use
+rather than at startup, and reloaded when the file changes. Without a
+model, or when the model is not confident, the keyword rules decide.
+"""
+
+import csv
+import hashlib
+import io
+import os
+import re
+import threading
+import zlib
+from collections import Counter
+
+import numpy as np
+
+from services.categorizer import KeywordCategorizer
+from services.metrics import timer
+from services.result_cache import LRUCache
+
+
+N_FEATURES = 1 << 18
+NGRAM_RANGE = (2, 4)
+BIAS = 0  # Feature present in every name; its weights are the class priors
+
+WORD_PATTERN = re.compile(r'[^\W\d_]+')
+
+
+def normalize_name(name):
+    """Lowercase an item name and keep only its words ('Milk 2% 1gal' -> 'milk gal')."""
+    return ' '.join(WORD_PATTERN.findall(name.lower()))
+
+
+def hash_features(names, n_features=N_FEATURES, ngram_range=NGRAM_RANGE):
+    """
+    Turn normalized names into hashed sparse features.
+
+    Args:
+        names: Normalized item names
+        n_features: Number of hash buckets (feature 0 is the bias)
+        ngram_range: (shortest, longest) character n-gram length
+
+    Returns:
+        tuple: (indices, offsets) - the feature ids of all names
+            concatenated (int32), and where each name's ids start (int64).
+            Every name has at least the bias feature.
+    """
+    low, high = ngram_range
+    buckets = n_features - 1
+    indices = []
+    offsets = []
+    for name in names:
+        offsets.append(len(indices))
+        indices.append(BIAS)
+        for word in name.split():
+            indices.append(1 + zlib.crc32(b'w:' + word.encode('utf-8')) % buckets)
+            padded = f' {word} '
+            for n in range(low, high + 1):
+                for i in range(len(padded) - n + 1):
+                    indices.append(1 + zlib.crc32(padded[i:i + n].encode('utf-8')) % buckets)
+    return np.array(indices, dtype=np.int32), np.array(offsets, dtype=np.int64)
+
+
+def _softmax(scores):
+    scores = scores - scores.max(axis=1, keepdims=True)
+    np.exp(scores, out=scores)
+    scores /= scores.sum(axis=1, keepdims=True)
+    return scores
+
+
+class ItemClassifier:
+    """Softmax regression over hashed n-gram features of item names."""
+
+    def __init__(self, weights, categories, overrides=None, ngram_range=NGRAM_RANGE):
+        """
+        Wrap trained weights.
+
+        Args:
+            weights: float32 array of shape (n_features, len(categories))
+            categories: Category name of each weight column
+            overrides: {normalized name: category} for corrected names
+            ngram_range: n-gram lengths the weights were trained with
+        """
+        self.weights = weights
+        self.categories = list(categories)
+        self.overrides = dict(overrides or {})
+        self.ngram_range = tuple(ngram_range)
+
+        digest = hashlib.sha1(weights.tobytes())
+        digest.update(repr((self.categories, sorted(self.overrides.items()))).encode('utf-8'))
+        self.version = digest.hexdigest()[:12]
+
+    @classmethod
+    def train(cls, names, labels, sample_weights=None, overrides=None, n_features=N_FEATURES,
+              epochs=100, learning_rate=0.05, l2=1e-3):
+        """
+        Fit a model with full-batch Adam on the cross-entropy loss.
+
+        Args:
+            names: Normalized item names
+            labels: Category of each name
+            sample_weights: Optional weight of each example (default 1)
+            overrides: {normalized name: category} kept verbatim in the model
+            n_features: Number of hash buckets
+            epochs: Gradient steps over the whole training set
+            learning_rate: Adam step size
+            l2: L2 penalty on the weights
+
+        Returns:
+            ItemClassifier: The trained model
+        """
+        categories = sorted(set(labels))
+        column = {category: i for i, category in enumerate(categories)}
+        targets = np.array([column[label] for label in labels], dtype=np.int64)
+        if sample_weights is None:
+            sample_weights = np.ones(len(targets))
+        sample_weights = np.asarray(sample_weights, dtype=np.float64)
+        sample_weights = sample_weights / sample_weights.sum()
+
+        indices, offsets = hash_features(names, n_features)
+        rows = np.repeat(np.arange(len(offsets)), np.diff(np.append(offsets, len(indices))))
+        # Buckets no name uses keep zero weights, so train only the used ones
+        active, indices = np.unique(indices, return_inverse=True)
+        weights = np.zeros((len(active), len(categories)), dtype=np.float32)
+        first_moment = np.zeros_like(weights)
+        second_moment = np.zeros_like(weights)
+        beta1, beta2, eps = 0.9, 0.999, 1e-8
+
+        for step in range(1, epochs + 1):
+            probs = _softmax(np.add.reduceat(weights[indices], offsets, axis=0))
+            probs[np.arange(len(targets)), targets] -= 1.0
+            probs *= sample_weights[:, None]
+
+            # Sparse X^T (P - Y): one bincount per category
+            gradient = np.empty_like(weights)
+            for k in range(len(categories)):
+                gradient[:, k] = np.bincount(indices, weights=probs[rows, k], minlength=len(active))
+            gradient += l2 * weights
+
+            first_moment = beta1 * first_moment + (1 - beta1) * gradient
+            second_moment = beta2 * second_moment + (1 - beta2) * gradient * gradient
+            step_size = learning_rate * np.sqrt(1 - beta2 ** step) / (1 - beta1 ** step)
+            weights -= step_size * first_moment / (np.sqrt(second_moment) + eps)
+
+        full = np.zeros((n_features, len(categories)), dtype=np.float32)
+        full[active] = weights
+        return cls(full, categories, overrides=overrides)
+
+    def predict(self, names):
+        """
+        Categorize normalized names in one vectorized pass.
+
+        Args:
+            names: Normalized item names
+
+        Returns:
+            tuple: (categories, confidences) - the most likely category of
+                each name, and its probability (1.0 for corrected names)
+        """
+        if not names:
+            return [], np.zeros(0)
+        indices, offsets = hash_features(names, len(self.weights), self.ngram_range)
+        probs = _softmax(np.add.reduceat(self.weights[indices], offsets, axis=0))
+        best = probs.argmax(axis=1)
+        confidences = probs[np.arange(len(names)), best]
+
+        categories = [self.categories[i] for i in best]
+        for i, name in enumerate(names):
+            if name in self.overrides:
+                categories[i] = self.overrides[name]
+                confidences[i] = 1.0
+        return categories, confidences
+
+    def save(self, path):
+        """Write the model to path atomically (compressed .npz)."""
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer,
+            weights=self.weights,
+            categories=np.array(self.categories),
+            override_names=np.array(list(self.overrides), dtype=str),
+            override_categories=np.array(list(self.overrides.values()), dtype=str),
+            ngram_range=np.array(self.ngram_range)
+        )
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(buffer.getvalue())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Read a model written by save()."""
+        with np.load(path) as data:
+            overrides = dict(zip(data['override_names'].tolist(), data['override_categories'].tolist()))
+            return cls(data['weights'], data['categories'].tolist(), overrides=overrides,
+                       ngram_range=data['ngram_range'].tolist())
+
+
+def load_corrections(path):
+    """
+    Read corrected item categories.
+
+    Args:
+        path: CSV file with `name,category` rows (a header row is optional)
+
+    Returns:
+        list: (item name, category) pairs; empty if the file does not exist
+    """
+    if not os.path.exists(path):
+        return []
+    corrections = []
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        for row in csv.reader(f):
+            if len(row) < 2 or not row[0].strip() or not row[1].strip():
+                continue
+            if (row[0].strip().lower(), row[1].strip().lower()) == ('name', 'category'):
+                continue
+            corrections.append((row[0].strip(), row[1].strip().lower()))
+    return corrections
+
+
+def training_set(receipts, corrections, rules=None, correction_weight=5.0):
+    """
+    Build training examples from stored receipts and corrections.
+
+    Every distinct (normalized name, category) pair of stored items whose
+    category the keyword rules assign is one example. Other stored
+    categories came from the model itself (or the LLM), or are the default
+    given when no keyword matched, so training on them would only reinforce
+    past guesses and mistakes. Corrections replace stored examples of the
+    same name and count correction_weight times as much.
+
+    Args:
+        receipts: Stored receipt dicts
+        corrections: (item name, category) pairs from load_corrections()
+        rules: KeywordCategorizer whose labels are trusted
+        correction_weight: Weight of a correction relative to a stored item
+
+    Returns:
+        tuple: (names, labels, sample_weights, overrides)
+    """
+    rules = rules or KeywordCategorizer()
+    overrides = {}
+    for name, category in corrections:
+        key = normalize_name(name)
+        if key:
+            overrides[key] = category
+
+    pairs = Counter()
+    for receipt in receipts:
+        for item in receipt.get('items', ()):
+            key = normalize_name(item.get('name') or '')
+            category = item.get('category')
+            if not key or not category or key in overrides:
+                continue
+            if rules.match(key) != category:
+                continue
+            pairs[(key, category)] += 1
+
+    names = [name for name, _ in pairs] + list(overrides)
+    labels = [category for _, category in pairs] + list(overrides.values())
+    sample_weights = [1.0] * len(pairs) + [correction_weight] * len(overrides)
+    return names, labels, sample_weights, overrides
+
+
+class LearnedCategorizer:
+    """Item categorizer backed by an ItemClassifier file, with keyword rules as fallback."""
+
+    def __init__(self, model_path, fallback=None, min_confidence=0.6, cache_size=50000):
+        """
+        Set up the categorizer (the model itself is loaded on first use).
+
+        Args:
+            model_path: Path of the .npz model written by train-categorizer
+            fallback: KeywordCategorizer for when there is no model or it
+                is not confident (defaults to category_rules.cfg)
+            min_confidence: Lowest model probability to accept a category
+            cache_size: Normalized item names whose category is cached
+        """
+        self.model_path = model_path
+        self.fallback = fallback or KeywordCategorizer()
+        self.min_confidence = min_confidence
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._fingerprint = False  # Never matches a stat result or None
+        self._state = (None, self._new_cache())
+
+    def __getstate__(self):
+        # Parser worker processes get a copy without the lock, model or cache
+        return {'model_path': self.model_path, 'fallback': self.fallback,
+                'min_confidence': self.min_confidence, 'cache_size': self.cache_size}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def _new_cache(self):
+        return LRUCache(max_entries=self.cache_size, max_bytes=self.cache_size * 64, sizeof=len)
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.model_path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _current(self):
+        """Return (model or None, cache), loading the model if its file changed."""
+        fingerprint = self._stat()
+        if fingerprint != self._fingerprint:
+            with self._lock:
+                if fingerprint != self._fingerprint:
+                    model = None
+                    if fingerprint is not None:
+                        try:
+                            model = ItemClassifier.load(self.model_path)
+                        except (OSError, ValueError, KeyError) as e:
+                            print(f"[Categorizer] Ignoring unreadable model {self.model_path}: {e}")
+                    # A new model invalidates every cached category
+                    self._state = (model, self._new_cache())
+                    self._fingerprint = fingerprint
+        return self._state
+
+    @property
+    def version(self):
+        """Identifies the categories this categorizer produces (for parse result caching)."""
+        model, _ = self._current()
+        return f'learned-{model.version}' if model is not None else self.fallback.version
+
+    def categorize(self, item_name):
+        """
+        Categorize one item by name.
+
+        Args:
+            item_name: Item name as printed on the receipt
+
+        Returns:
+            str: Category name
+        """
+        return self.categorize_many([item_name])[0]
+
+    def categorize_many(self, item_names):
+        """
+        Categorize several items, scoring all uncached names in one batch.
+
+        Args:
+            item_names: Item names as printed on the receipt
+
+        Returns:
+            list: Category name of each item
+        """
+        model, cache = self._current()
+        if model is None:
+            return [self.fallback.categorize(name) for name in item_names]
+
+        keys = [normalize_name(name) for name in item_names]
+        categories = [cache.get(key) for key in keys]
+        missing = list(dict.fromkeys(key for key, category in zip(keys, categories) if category is None))
+        if not missing:
+            return categories
+
+        with timer('categorize'):
+            predicted, confidences = model.predict(missing)
+        scored = {}
+        for key, category, confidence in zip(missing, predicted, confidences):
+            if confidence < self.min_confidence:
+                category = self.fallback.categorize(key)
+            cache.put(key, category)
+            scored[key] = category
+        return [category if category is not None else scored[key]
+                for key, category in zip(keys, categories)]
+
+    def stats(self):
+        """Return the loaded model's version and the name cache counters."""
+        model, cache = self._current()
+        return {'model': model.version if model is not None else None, **cache.stats()}
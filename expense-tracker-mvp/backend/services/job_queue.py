@@ -0,0 +1,226 @@
+"""
+Local job queue for asynchronous receipt processing.
+
+Jobs are stored in a small SQLite database (data/jobs.db) so queued work
+survives restarts without an external broker. A JobWorkerPool runs a
+configurable number of worker threads that claim jobs, call a handler
+and record the result. Jobs left in 'processing' by a crash are put back
+in the queue on startup, so handlers must be idempotent. When several
+server processes share the queue, a restarting process must not requeue
+jobs that another one is still running; there a lease is used instead:
+a job still 'processing' after lease_seconds is claimed again.
+
+Job status values: queued -> processing -> done | failed
+"""
+
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from services import json_codec
+
+
+class JobQueue:
+    """SQLite-backed FIFO job queue."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            status TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            result TEXT,
+            error TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at);
+    """
+
+    def __init__(self, path, lease_seconds=None):
+        """
+        Initialize the queue.
+
+        Args:
+            path: Path to the SQLite database file holding jobs
+            lease_seconds: If set, reclaim jobs that have been processing for
+                this long instead of requeueing all processing jobs on startup
+                (use when several processes share the queue)
+        """
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self._local = threading.local()
+        self._available = threading.Condition()
+
+        conn = self._connect()
+        with conn:
+            conn.executescript(self.SCHEMA)
+            if lease_seconds is None:
+                # Jobs interrupted by a restart go back to the queue
+                conn.execute("UPDATE jobs SET status = 'queued' WHERE status = 'processing'")
+
+    def _connect(self):
+        """Return the calling thread's connection, opening it on first use."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, kind, payload, job_id=None):
+        """
+        Add a job to the queue.
+
+        Args:
+            kind: Job type name used to pick a handler
+            payload: JSON-serializable dict passed to the handler
+            job_id: Optional id (a UUID is generated otherwise)
+
+        Returns:
+            str: The job id
+        """
+        job_id = job_id or str(uuid.uuid4())
+        now = datetime.now().isoformat()
+        self._connect().execute(
+            'INSERT INTO jobs (id, kind, status, payload, created_at, updated_at) '
+            "VALUES (?, ?, 'queued', ?, ?, ?)",
+            (job_id, kind, json_codec.dumps(payload), now, now)
+        )
+        with self._available:
+            self._available.notify()
+        return job_id
+
+    def claim(self, timeout=None):
+        """
+        Atomically take the oldest queued job and mark it processing.
+
+        Args:
+            timeout: Seconds to wait for a job when the queue is empty
+
+        Returns:
+            dict or None: The claimed job, or None if none became available
+        """
+        job = self._claim_next()
+        if job is None and timeout:
+            with self._available:
+                self._available.wait(timeout)
+            job = self._claim_next()
+        return job
+
+    def _claim_next(self):
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if self.lease_seconds is None:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+            else:
+                expired = (datetime.now() - timedelta(seconds=self.lease_seconds)).isoformat()
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' "
+                    "OR (status = 'processing' AND updated_at < ?) ORDER BY created_at LIMIT 1",
+                    (expired,)
+                ).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'processing', attempts = attempts + 1, updated_at = ? "
+                'WHERE id = ?',
+                (datetime.now().isoformat(), row['id'])
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return self._row_to_job(row, status='processing')
+
+    def complete(self, job_id, result):
+        """Mark a job done and store its JSON-serializable result."""
+        self._finish(job_id, 'done', result=json_codec.dumps(result))
+
+    def fail(self, job_id, error):
+        """Mark a job failed with an error message."""
+        self._finish(job_id, 'failed', error=str(error))
+
+    def _finish(self, job_id, status, result=None, error=None):
+        self._connect().execute(
+            'UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ? WHERE id = ?',
+            (status, result, error, datetime.now().isoformat(), job_id)
+        )
+
+    def get(self, job_id):
+        """Return a job dict by id, or None."""
+        row = self._connect().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def counts(self):
+        """Return the number of jobs per status."""
+        rows = self._connect().execute('SELECT status, COUNT(*) AS n FROM jobs GROUP BY status')
+        return {row['status']: row['n'] for row in rows}
+
+    def _row_to_job(self, row, status=None):
+        return {
+            'id': row['id'],
+            'kind': row['kind'],
+            'status': status or row['status'],
+            'payload': json_codec.loads(row['payload']),
+            'result': json_codec.loads(row['result']) if row['result'] else None,
+            'error': row['error'],
+            'attempts': row['attempts'],
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at']
+        }
+
+
+class JobWorkerPool:
+    """Pool of worker threads processing jobs from a JobQueue."""
+
+    def __init__(self, queue, handlers, workers=2, poll_interval=1.0):
+        """
+        Initialize the pool.
+
+        Args:
+            queue: JobQueue to claim jobs from
+            handlers: Dict mapping job kind to a callable(payload) -> result
+            workers: Number of worker threads
+            poll_interval: Seconds to wait for new jobs before polling again
+        """
+        self.queue = queue
+        self.handlers = handlers
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        """Start the worker threads."""
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'job-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """Ask workers to exit after their current job."""
+        self._stop.set()
+        with self.queue._available:
+            self.queue._available.notify_all()
+
+    def _run(self):
+        while not self._stop.is_set():
+            job = self.queue.claim(timeout=self.poll_interval)
+            if job is None:
+                continue
+
+            try:
+                handler = self.handlers[job['kind']]
+                result = handler(job['payload'])
+                self.queue.complete(job['id'], result)
+            except Exception as e:
+                print(f"[Jobs] Job {job['id']} failed: {e}")
+                self.queue.fail(job['id'], e)
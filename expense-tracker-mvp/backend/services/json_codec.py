@@ -0,0 +1,75 @@
+"""
+JSON encoding for API responses and stored data.
+
+orjson is used when it is installed: it is several times faster than the
+standard library and encodes straight to UTF-8 bytes. Without it the
+stdlib json module is used with the same settings. Either way the output
+is compact, with no indentation and no spaces after separators, and
+non-ASCII text is written as UTF-8. Both encoders read each other's output,
+and indented files written by older versions.
+"""
+
+import dataclasses
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+from uuid import UUID
+
+try:
+    import orjson  # Optional dependency
+except ImportError:
+    orjson = None
+
+
+ENCODER = 'orjson' if orjson is not None else 'json'
+
+
+def _default(value):
+    """Encode the types both encoders handle beyond plain JSON, the way orjson does."""
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, UUID):
+        return str(value)
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return dataclasses.asdict(value)
+    if hasattr(value, 'tolist'):
+        # NumPy scalars and arrays
+        return value.tolist()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+_COMPACT = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=_default)
+_INDENTED = json.JSONEncoder(ensure_ascii=False, indent=2, default=_default)
+if orjson is not None:
+    _OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def encode(obj, indent=False):
+    """
+    Encode obj as UTF-8 JSON.
+
+    Args:
+        obj: JSON-serializable value
+        indent: Indent nested values by 2 spaces (for human-readable files)
+
+    Returns:
+        bytes: Encoded JSON
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default,
+                            option=_OPTIONS | orjson.OPT_INDENT_2 if indent else _OPTIONS)
+    return (_INDENTED if indent else _COMPACT).encode(obj).encode('utf-8')
+
+
+def loads(data):
+    """Decode JSON from str or bytes (raises ValueError if malformed)."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj):
+    """Encode obj as a compact JSON string (e.g. for a TEXT column)."""
+    return encode(obj).decode('utf-8')
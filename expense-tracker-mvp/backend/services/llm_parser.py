@@ -0,0 +1,464 @@
+"""
+Receipt parsing with an LLM behind an OpenAI-compatible chat completions API.
+
+LLMParser has the interface of AIParser (parse_receipt, parse_many,
+version) and replaces it when PARSER_BACKEND=llm. A round trip per
+receipt would dominate upload latency and cost, so:
+
+- Micro-batching: receipts parsed at the same time are sent in one
+  request, up to batch_size of them. A batch is sent when it is full or
+  batch_wait seconds after its first receipt arrived, and keeps growing
+  while it waits for a free request slot.
+- Concurrency limit: at most max_concurrency requests are in flight.
+- Pooled HTTP client: keep-alive connections are reused, so requests
+  skip TCP and TLS setup.
+- Retries: connection errors, 429 and 5xx responses are retried with
+  exponential backoff and jitter, waiting at least Retry-After.
+- Cache: results are cached by a hash of the OCR text with whitespace
+  normalized. Parsing the same text again never calls the API, and
+  identical texts in flight share one request.
+- Fallback: a receipt whose result has not arrived after timeout
+  seconds, or failed, or came back malformed, is parsed by the
+  rule-based AIParser instead.
+
+services/mock_llm.py is a local stand-in server for trying this out and
+for benchmarks, with no network access or API key.
+"""
+
+import hashlib
+import http.client
+import queue
+import random
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import date
+from urllib.parse import urlsplit
+
+from services import json_codec
+from services.metrics import REGISTRY, timer
+from services.models import LineItem, ParsedReceipt, parse_cents
+from services.result_cache import LRUCache
+
+
+# Bump when the prompt or result handling changes so cached parse results are not reused
+PROMPT_VERSION = '1'
+CATEGORIES = ('groceries', 'household', 'alcohol', 'other')
+CURRENCY_PATTERN = re.compile(r'^[A-Z]{3}$')
+
+SYSTEM_PROMPT = 'You are a receipt parsing assistant. Return only valid JSON.'
+USER_PROMPT = """Parse each receipt below into JSON with this structure, one entry per receipt, in order:
+{{"receipts": [{{"store": "store name", "date": "YYYY-MM-DD", "currency": "ISO 4217 code",
+  "total": "0.00", "items": [{{"name": "item name", "price": "0.00", "category": "{categories}"}}]}}]}}
+
+{receipts}"""
+RECEIPT_BLOCK = '<receipt {number}>\n{text}\n</receipt {number}>'
+
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+class LLMError(Exception):
+    """The LLM API failed or returned something that is not a parse result."""
+
+
+def text_key(ocr_text):
+    """Cache key of an OCR text: SHA-256 of the text with whitespace runs collapsed."""
+    normalized = WHITESPACE_PATTERN.sub(' ', ocr_text).strip()
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+def build_messages(texts):
+    """Return the chat messages asking the model to parse texts."""
+    blocks = '\n\n'.join(RECEIPT_BLOCK.format(number=i, text=text.strip())
+                         for i, text in enumerate(texts, 1))
+    return [
+        {'role': 'system', 'content': SYSTEM_PROMPT},
+        {'role': 'user', 'content': USER_PROMPT.format(categories='|'.join(CATEGORIES), receipts=blocks)}
+    ]
+
+
+def to_parsed_receipt(data, categorizer=None):
+    """
+    Convert one receipt of the model's JSON into a ParsedReceipt.
+
+    Args:
+        data: Dict with store, date, currency, total and items
+        categorizer: Categorizes items the model left without a known category
+
+    Returns:
+        ParsedReceipt: The parse result, amounts in integer cents
+
+    Raises:
+        ValueError: If a required field is missing or malformed, or an
+            amount is not a finite number
+    """
+    if not isinstance(data, dict) or not isinstance(data.get('items'), list):
+        raise ValueError('receipt is not an object with items')
+    receipt_date = date.fromisoformat(str(data.get('date'))).isoformat()
+    currency = str(data.get('currency') or 'USD').upper()
+    if not CURRENCY_PATTERN.match(currency):
+        raise ValueError(f'invalid currency {currency!r}')
+
+    names, prices, categories = [], [], []
+    for item in data['items']:
+        if not isinstance(item, dict) or not str(item.get('name') or '').strip():
+            raise ValueError('item without a name')
+        names.append(str(item['name']).strip())
+        prices.append(parse_cents(item.get('price', 0)))
+        category = item.get('category')
+        categories.append(category if category in CATEGORIES else None)
+
+    if categorizer is not None and None in categories:
+        guessed = categorizer.categorize_many([name for name, c in zip(names, categories) if c is None])
+        categories = [c if c is not None else guessed.pop(0) for c in categories]
+    return ParsedReceipt(
+        store=str(data.get('store') or '').strip(),
+        date=receipt_date,
+        items=tuple(LineItem(name, price, category or 'other')
+                    for name, price, category in zip(names, prices, categories)),
+        total_cents=parse_cents(data.get('total', 0)),
+        currency=currency
+    )
+
+
+class HTTPConnectionPool:
+    """Thread-safe pool of keep-alive HTTP(S) connections to one server."""
+
+    def __init__(self, base_url, size=4, timeout=30):
+        """
+        Initialize the pool (connections are opened on demand).
+
+        Args:
+            base_url: Server URL, e.g. 'https://api.openai.com/v1'; request
+                paths are appended to its path
+            size: Idle connections kept open for reuse
+            timeout: Socket timeout in seconds
+        """
+        parts = urlsplit(base_url)
+        if parts.scheme not in ('http', 'https'):
+            raise ValueError(f'Unsupported URL scheme: {base_url}')
+        self._connection_class = (http.client.HTTPSConnection if parts.scheme == 'https'
+                                  else http.client.HTTPConnection)
+        self.host = parts.hostname
+        self.port = parts.port
+        self.prefix = parts.path.rstrip('/')
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self.opened = 0
+
+    def _open(self):
+        self.opened += 1
+        return self._connection_class(self.host, self.port, timeout=self.timeout)
+
+    def request(self, method, path, body=None, headers=None):
+        """
+        Send a request on an idle connection (or a new one) and read the response.
+
+        A reused connection the server has meanwhile closed is retried once
+        on a new connection.
+
+        Returns:
+            tuple: (status, response headers, body bytes)
+
+        Raises:
+            OSError, http.client.HTTPException: If the request fails
+        """
+        try:
+            conn, reused = self._idle.get_nowait(), True
+        except queue.Empty:
+            conn, reused = self._open(), False
+
+        while True:
+            try:
+                conn.request(method, self.prefix + path, body=body, headers=headers or {})
+                response = conn.getresponse()
+                data = response.read()
+                break
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                if not reused:
+                    raise
+                conn, reused = self._open(), False
+
+        if response.will_close or self._idle.qsize() >= self.size:
+            conn.close()
+        else:
+            self._idle.put(conn)
+        return response.status, response.headers, data
+
+    def close(self):
+        """Close all idle connections."""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class LLMParser:
+    """Parses receipts with an LLM, batched, cached and bounded, with rule-based fallback."""
+
+    def __init__(self, base_url, model, fallback, api_key=None, max_concurrency=4, batch_size=8,
+                 batch_wait=0.05, timeout=20, request_timeout=120, retries=2, backoff=0.5,
+                 max_backoff=8.0, cache_size=10000):
+        """
+        Initialize the parser (threads and connections start on first use).
+
+        Args:
+            base_url: Chat completions API base URL (POST {base_url}/chat/completions)
+            model: Model name sent with each request
+            fallback: AIParser used on timeouts and failures; its categorizer
+                also fills in categories the model leaves out
+            api_key: Bearer token, if the API needs one
+            max_concurrency: Requests in flight at once
+            batch_size: Receipts per request at most
+            batch_wait: Seconds a batch waits for more receipts before it is sent
+            timeout: Seconds a receipt waits for its result before falling back
+            request_timeout: Socket timeout of a request; a request may outlive
+                the receipts' timeout, and its results still land in the cache
+            retries: Retries of a failed request
+            backoff: Delay before the first retry in seconds (doubles each time)
+            max_backoff: Longest delay between retries
+            cache_size: Parse results cached by OCR text hash
+        """
+        self.model = model
+        self.fallback = fallback
+        self.api_key = api_key
+        self.max_concurrency = max_concurrency
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._pool = HTTPConnectionPool(base_url, size=max_concurrency, timeout=request_timeout)
+        self._cache = LRUCache(max_entries=cache_size, max_bytes=cache_size * 4096,
+                               sizeof=lambda parsed: 200 + 100 * len(parsed.items))
+        self._queue = queue.Queue()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._in_flight = {}  # text key -> Future shared by callers of the same text
+        self._lock = threading.Lock()
+        self._executor = None
+        self._counts = {'requests': 0, 'retries': 0, 'failed_requests': 0, 'llm': 0, 'cache': 0,
+                        'fallback': 0}
+
+    @property
+    def version(self):
+        """Parser version; parse results are cached under it."""
+        return f'llm-{self.model}-{PROMPT_VERSION}'
+
+    @property
+    def categorizer(self):
+        """Item categorizer of the fallback parser."""
+        return self.fallback.categorizer
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self._counts[name] += value
+
+    def _start(self):
+        """Start the batching thread and request pool (caller holds the lock)."""
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                            thread_name_prefix='llm-request')
+        threading.Thread(target=self._batch_loop, name='llm-batcher', daemon=True).start()
+
+    def parse_receipt(self, ocr_text):
+        """
+        Parse OCR text into structured receipt data.
+
+        Args:
+            ocr_text: Raw text extracted from receipt
+
+        Returns:
+            ParsedReceipt: From the LLM (or the cache), or from the rule-based
+                parser if the LLM did not answer in time or failed
+        """
+        return self.parse_receipt_versioned(ocr_text)[0]
+
+    def parse_receipt_versioned(self, ocr_text):
+        """
+        Parse OCR text and report the version that produced the result.
+
+        A fallback result carries the fallback parser's version, so callers
+        caching by version do not keep it in place of the LLM's answer.
+
+        Returns:
+            tuple: (ParsedReceipt, parser version to cache the result under)
+        """
+        key = text_key(ocr_text)
+        parsed = self._cache.get(key)
+        if parsed is not None:
+            self._record('cache')
+            return parsed, self.version
+
+        with self._lock:
+            if self._executor is None:
+                self._start()
+            future = self._in_flight.get(key)
+            if future is None:
+                future = Future()
+                self._in_flight[key] = future
+                self._queue.put((key, ocr_text, future))
+
+        try:
+            parsed = future.result(timeout=self.timeout)
+        except (FutureTimeoutError, LLMError):
+            # A late result still lands in the cache for the next parse
+            self._record('fallback')
+            return self.fallback.parse_receipt_versioned(ocr_text)
+        self._record('llm')
+        return parsed, self.version
+
+    def _record(self, source):
+        self._count(source)
+        REGISTRY.inc('llm_receipts_total', source=source)
+
+    def parse_many(self, texts, workers=None):
+        """
+        Parse many OCR texts, yielding results in input order.
+
+        Enough texts are kept in flight to fill max_concurrency full batches.
+
+        Args:
+            texts: Iterable of OCR text strings
+            workers: Ignored; concurrency is set by max_concurrency and batch_size
+
+        Yields:
+            ParsedReceipt: parse_receipt() output for each text
+        """
+        window = 2 * self.max_concurrency * self.batch_size
+        with ThreadPoolExecutor(max_workers=window) as pool:
+            in_flight = deque()
+            for text in texts:
+                in_flight.append(pool.submit(self.parse_receipt, text))
+                if len(in_flight) >= window:
+                    yield in_flight.popleft().result()
+            while in_flight:
+                yield in_flight.popleft().result()
+
+    def _batch_loop(self):
+        """Group queued receipts into batches and send each once a request slot is free."""
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            self._slots.acquire()
+            # Receipts that queued up while waiting for the slot join this batch
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._executor.submit(self._send_batch, batch)
+
+    def _send_batch(self, batch):
+        """Request one batch and resolve its futures (runs on the request pool)."""
+        try:
+            try:
+                results = self._request([text for _, text, _ in batch])
+            except LLMError as e:
+                results = [e] * len(batch)
+
+            for (key, _, future), data in zip(batch, results):
+                try:
+                    if isinstance(data, LLMError):
+                        raise data
+                    parsed = to_parsed_receipt(data, self.categorizer)
+                except (LLMError, ValueError, TypeError) as e:
+                    error = e if isinstance(e, LLMError) else LLMError(f'Malformed receipt: {e}')
+                    self._finish(key, future, error=error)
+                    continue
+                self._cache.put(key, parsed)
+                self._finish(key, future, result=parsed)
+        except Exception as e:
+            for key, _, future in batch:
+                if not future.done():
+                    self._finish(key, future, error=LLMError(str(e)))
+        finally:
+            self._slots.release()
+
+    def _finish(self, key, future, result=None, error=None):
+        with self._lock:
+            self._in_flight.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def _request(self, texts):
+        """
+        Send one chat completions request for texts, retrying transient failures.
+
+        Returns:
+            list: The model's JSON object for each text, in order
+
+        Raises:
+            LLMError: If the request keeps failing or the reply is not a
+                list of len(texts) receipts
+        """
+        body = json_codec.encode({
+            'model': self.model,
+            'messages': build_messages(texts),
+            'temperature': 0,
+            'response_format': {'type': 'json_object'}
+        })
+        headers = {'Content-Type': 'application/json'}
+        if self.api_key:
+            headers['Authorization'] = f'Bearer {self.api_key}'
+
+        for attempt in range(self.retries + 1):
+            retry_after = 0.0
+            self._count('requests')
+            try:
+                with timer('llm_request'):
+                    status, response_headers, data = self._pool.request(
+                        'POST', '/chat/completions', body=body, headers=headers)
+            except (OSError, http.client.HTTPException) as e:
+                error = LLMError(f'Request failed: {e}')
+                REGISTRY.inc('llm_requests_total', outcome='error')
+            else:
+                REGISTRY.inc('llm_requests_total', outcome=str(status))
+                if status == 200:
+                    return self._read_reply(data, len(texts))
+                error = LLMError(f'HTTP {status}')
+                if status != 429 and status < 500:
+                    break
+                try:
+                    retry_after = float(response_headers.get('Retry-After') or 0)
+                except ValueError:
+                    pass
+
+            if attempt < self.retries:
+                self._count('retries')
+                delay = min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+                time.sleep(max(delay, min(retry_after, self.max_backoff)))
+
+        self._count('failed_requests')
+        raise error
+
+    def _read_reply(self, data, count):
+        try:
+            content = json_codec.loads(data)['choices'][0]['message']['content']
+            receipts = json_codec.loads(content)['receipts']
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            raise LLMError(f'Unexpected reply: {e}')
+        if not isinstance(receipts, list) or len(receipts) != count:
+            raise LLMError(f'Expected {count} receipts in the reply')
+        return receipts
+
+    def stats(self):
+        """Return request, result source and cache counters."""
+        with self._lock:
+            counts = dict(self._counts)
+        return {**counts, 'connections_opened': self._pool.opened, 'cache': self._cache.stats()}
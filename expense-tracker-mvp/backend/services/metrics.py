@@ -0,0 +1,230 @@
+"""
+Lightweight request and stage metrics in Prometheus text format.
+
+Services record into the module-level REGISTRY:
+
+    with timer('ocr', backend='tesseract'):
+        ...
+    REGISTRY.inc('upload_bytes_total', size)
+
+Durations go into histograms with fixed buckets, sizes into counters.
+Each process keeps its own registry in memory. With several server
+processes, share_directory() makes each one dump a snapshot to a shared
+directory once per interval, and render() merges them, so any worker can
+answer a scrape for the whole server. Snapshots of exited workers are
+folded into archive.json, so counters never go backwards.
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from services.file_lock import FileLock
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+METRICS = {
+    'http_request_duration_seconds': ('histogram', 'HTTP request latency by route, method and status'),
+    'http_request_bytes_total': ('counter', 'HTTP request body bytes by route'),
+    'http_response_bytes_total': ('counter', 'HTTP response body bytes by route'),
+    'stage_duration_seconds': ('histogram', 'Time spent in each processing stage'),
+    'upload_bytes_total': ('counter', 'Image bytes received in uploads'),
+    'ocr_text_bytes_total': ('counter', 'Bytes of OCR text extracted'),
+    'json_serialized_bytes_total': ('counter', 'Bytes of JSON produced for API responses'),
+    'llm_requests_total': ('counter', 'LLM API requests by outcome (HTTP status or error)'),
+    'llm_receipts_total': ('counter', 'Receipts parsed by the LLM parser by source (llm, cache, fallback)'),
+}
+
+
+class MetricsRegistry:
+    """Thread-safe counters and histograms keyed by name and labels."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        Initialize an empty registry.
+
+        Args:
+            buckets: Upper bounds (seconds) of the histogram buckets
+        """
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters = {}
+        # (name, labels) -> [bucket counts..., overflow, sum, count]
+        self._histograms = {}
+        self._share_dir = None
+        self._share_path = None
+
+    def inc(self, name, value=1, **labels):
+        """Add value to a counter."""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """Record one observation in a histogram."""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            series = self._histograms.get(key)
+            if series is None:
+                series = self._histograms[key] = [0] * (len(self.buckets) + 3)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def snapshot(self):
+        """Return the registry contents as a JSON-serializable dict."""
+        with self._lock:
+            return {
+                'counters': [[name, list(labels), value]
+                             for (name, labels), value in self._counters.items()],
+                'histograms': [[name, list(labels), list(series)]
+                               for (name, labels), series in self._histograms.items()]
+            }
+
+    def share_directory(self, directory, interval=1.0):
+        """
+        Publish this process's metrics for other processes to merge.
+
+        Args:
+            directory: Directory shared by all server processes
+            interval: Seconds between snapshot dumps
+        """
+        os.makedirs(directory, exist_ok=True)
+        self._share_dir = directory
+        self._share_path = os.path.join(directory, f'{os.getpid()}-{uuid.uuid4().hex[:8]}.json')
+        self._archive_exited()
+
+        def dump_loop():
+            while True:
+                time.sleep(interval)
+                self._dump(self._share_path)
+
+        threading.Thread(target=dump_loop, name='metrics-dump', daemon=True).start()
+
+    def _dump(self, path):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, path)
+
+    def _archive_exited(self):
+        """Fold snapshots of processes that are no longer running into archive.json."""
+        archive_path = os.path.join(self._share_dir, 'archive.json')
+        with FileLock(os.path.join(self._share_dir, 'archive.lock')):
+            exited = []
+            for name in os.listdir(self._share_dir):
+                pid = name.split('-', 1)[0]
+                if name.endswith('.json') and pid.isdigit() and not _process_running(int(pid)):
+                    exited.append(os.path.join(self._share_dir, name))
+            if not exited:
+                return
+            snapshots = _read_snapshots(exited + [archive_path])
+            archive = MetricsRegistry(self.buckets)
+            archive._merge(snapshots)
+            archive._dump(archive_path)
+            for path in exited:
+                os.remove(path)
+
+    def _merge(self, snapshots):
+        for snapshot in snapshots:
+            for name, labels, value in snapshot['counters']:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                self._counters[key] = self._counters.get(key, 0) + value
+            for name, labels, series in snapshot['histograms']:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                if len(series) == len(self.buckets) + 2:
+                    # Snapshot written before the overflow slot existed
+                    series = series[:-2] + [0] + series[-2:]
+                merged = self._histograms.setdefault(key, [0] * len(series))
+                for i, value in enumerate(series):
+                    merged[i] += value
+
+    def render(self):
+        """
+        Render all metrics in the Prometheus text exposition format.
+
+        Includes the snapshots of other processes when sharing is enabled.
+        """
+        snapshots = [self.snapshot()]
+        if self._share_dir:
+            others = [os.path.join(self._share_dir, name) for name in os.listdir(self._share_dir)
+                      if name.endswith('.json') and os.path.join(self._share_dir, name) != self._share_path]
+            snapshots.extend(_read_snapshots(others))
+        merged = MetricsRegistry(self.buckets)
+        merged._merge(snapshots)
+
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            if kind == 'counter':
+                for (series_name, labels), value in sorted(merged._counters.items()):
+                    if series_name == name:
+                        lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+                continue
+            for (series_name, labels), series in sorted(merged._histograms.items()):
+                if series_name != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_format_labels(labels + (("le", repr(bound)),))} {cumulative}')
+                lines.append(f'{name}_bucket{_format_labels(labels + (("le", "+Inf"),))} {series[-1]}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(series[-2])}')
+                lines.append(f'{name}_count{_format_labels(labels)} {series[-1]}')
+        return '\n'.join(lines) + '\n'
+
+
+def _process_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _read_snapshots(paths):
+    snapshots = []
+    for path in paths:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                snapshots.append(json.load(f))
+        except (FileNotFoundError, ValueError):
+            continue
+    return snapshots
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+REGISTRY = MetricsRegistry()
+
+
+@contextmanager
+def timer(stage, **labels):
+    """Time a block and record it under stage_duration_seconds{stage=...}."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        REGISTRY.observe('stage_duration_seconds', time.perf_counter() - start, stage=stage, **labels)
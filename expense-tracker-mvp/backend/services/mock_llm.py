@@ -0,0 +1,201 @@
+"""
+Local stand-in for an OpenAI-compatible chat completions API.
+
+Answers POST .../chat/completions the way LLMParser expects. It finds the
+<receipt N> blocks in the prompt, parses each one with the rule-based
+AIParser, and replies with {"receipts": [...]} as the message content.
+Model latency, rate limiting and server errors are simulated, so batching,
+the concurrency limit, retries and fallback can be tried out and
+benchmarked with no network access or API key:
+
+    python -m services.mock_llm --port 8089 --latency 0.5
+    PARSER_BACKEND=llm LLM_API_URL=http://localhost:8089/v1 python app.py
+"""
+
+import argparse
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from services import json_codec
+from services.ai_parser import AIParser
+from services.models import format_cents
+
+
+RECEIPT_PATTERN = re.compile(r'<receipt (\d+)>\n(.*?)\n</receipt \1>', re.DOTALL)
+
+
+class MockLLMServer:
+    """Threaded HTTP server that answers receipt parsing prompts with AIParser."""
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.3, per_receipt_latency=0.02,
+                 error_rate=0.0, max_concurrency=None, seed=None):
+        """
+        Initialize the server (call start() to serve).
+
+        Args:
+            host: Interface to listen on
+            port: Port to listen on (0 picks a free one)
+            latency: Seconds every request takes, like a model's time to first token
+            per_receipt_latency: Extra seconds per receipt in the request,
+                like generating its output tokens
+            error_rate: Fraction of requests answered 503 Service Unavailable
+            max_concurrency: Requests served at once; more get 429 Too Many
+                Requests (default unlimited)
+            seed: Seed for which requests fail
+        """
+        self.latency = latency
+        self.per_receipt_latency = per_receipt_latency
+        self.error_rate = error_rate
+        self.max_concurrency = max_concurrency
+        self.parser = AIParser()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.counts = {'connections': 0, 'requests': 0, 'receipts': 0, 'rejected': 0, 'errors': 0,
+                       'max_in_flight': 0}
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        """Base URL to configure as LLM_API_URL."""
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/v1'
+
+    def start(self):
+        """Serve in a background thread; returns the base URL."""
+        self._thread = threading.Thread(target=self.serve_forever, name='mock-llm', daemon=True)
+        self._thread.start()
+        return self.url
+
+    def serve_forever(self):
+        """Serve in the calling thread until stop()."""
+        self._server.serve_forever()
+
+    def stop(self):
+        """Stop serving and close the listening socket."""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self.counts[name] += value
+
+    def reply(self, body):
+        """
+        Answer one chat completions request body.
+
+        Returns:
+            tuple: (HTTP status, reply dict, extra headers)
+        """
+        with self._lock:
+            rejected = self.max_concurrency is not None and self._in_flight >= self.max_concurrency
+            failed = not rejected and self._rng.random() < self.error_rate
+            if not rejected:
+                self._in_flight += 1
+                self.counts['max_in_flight'] = max(self.counts['max_in_flight'], self._in_flight)
+        if rejected:
+            self._count('rejected')
+            return 429, {'error': {'message': 'Rate limit reached'}}, {'Retry-After': '0.1'}
+
+        try:
+            prompt = body['messages'][-1]['content']
+            texts = [text for _, text in RECEIPT_PATTERN.findall(prompt)]
+            time.sleep(self.latency + self.per_receipt_latency * len(texts))
+            if failed:
+                self._count('errors')
+                return 503, {'error': {'message': 'Service unavailable'}}, {}
+
+            receipts = [self._receipt_json(self.parser.parse_receipt(text)) for text in texts]
+            self._count('requests')
+            self._count('receipts', len(texts))
+            content = json_codec.dumps({'receipts': receipts})
+            return 200, {
+                'object': 'chat.completion',
+                'model': body.get('model'),
+                'choices': [{'index': 0, 'finish_reason': 'stop',
+                             'message': {'role': 'assistant', 'content': content}}]
+            }, {}
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def _receipt_json(self, parsed):
+        return {
+            'store': parsed.store,
+            'date': parsed.date,
+            'currency': parsed.currency,
+            'total': format_cents(parsed.total_cents),
+            'items': [{'name': item.name, 'price': format_cents(item.price_cents),
+                       'category': item.category} for item in parsed.items]
+        }
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # Keep-alive, as real APIs allow
+
+            def setup(self):
+                super().setup()
+                server._count('connections')
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                if not self.path.endswith('/chat/completions'):
+                    status, reply, headers = 404, {'error': {'message': 'Not found'}}, {}
+                else:
+                    try:
+                        status, reply, headers = server.reply(json_codec.loads(body))
+                    except (ValueError, KeyError, IndexError, TypeError):
+                        status, reply, headers = 400, {'error': {'message': 'Invalid request'}}, {}
+
+                data = json_codec.encode(reply)
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                try:
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # The client gave up waiting
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run a local stand-in LLM API for receipt parsing.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', type=float, default=0.3, help='Seconds per request')
+    parser.add_argument('--per-receipt-latency', type=float, default=0.02,
+                        help='Extra seconds per receipt in a request')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='Fraction of requests answered 503')
+    parser.add_argument('--max-concurrency', type=int,
+                        help='Requests served at once; more get 429')
+    args = parser.parse_args(argv)
+
+    server = MockLLMServer(args.host, args.port, latency=args.latency,
+                           per_receipt_latency=args.per_receipt_latency, error_rate=args.error_rate,
+                           max_concurrency=args.max_concurrency)
+    print(f"Mock LLM API on {server.url} (Ctrl-C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
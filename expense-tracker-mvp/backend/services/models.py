@@ -0,0 +1,116 @@
+"""
+Receipt data model with exact money amounts.
+
+Money is held as integer minor units ("cents": hundredths of the
+currency unit, for every currency) from parse time onwards. Stored
+receipt records carry `total_cents` and per-item `price_cents`, so
+aggregation is plain integer addition. The API still returns amounts as
+strings such as "4.99", formatted once on the way out.
+
+The parser produces ParsedReceipt/LineItem: compact, immutable named
+tuples that can be shared between caches and threads without copying.
+"""
+
+from decimal import Decimal
+from typing import NamedTuple
+
+
+# Largest amount in cents that fits a signed 64-bit integer (SQLite INTEGER)
+MAX_CENTS = 2 ** 63 - 1
+
+
+class LineItem(NamedTuple):
+    """One priced line of a receipt."""
+
+    name: str
+    price_cents: int
+    category: str
+
+    def to_record(self):
+        """Return the stored dict form of the item."""
+        return {'name': self.name, 'price_cents': self.price_cents, 'category': self.category}
+
+
+class ParsedReceipt(NamedTuple):
+    """Structured data extracted from a receipt's OCR text."""
+
+    store: str
+    date: str
+    items: tuple
+    total_cents: int
+    currency: str = 'USD'
+
+
+def parse_cents(value):
+    """
+    Convert an amount ('4.99', '4,99', Decimal, int) to integer cents.
+
+    Raises:
+        ValueError: If value is not a finite number, or its cents do not
+            fit in a signed 64-bit integer
+    """
+    try:
+        cents = int((Decimal(str(value).replace(',', '.')) * 100).to_integral_value())
+    except (ArithmeticError, ValueError):
+        # InvalidOperation and Overflow are ArithmeticErrors; int() raises
+        # ValueError for NaN and OverflowError for Infinity
+        raise ValueError(f'Invalid amount: {value!r}') from None
+    if abs(cents) > MAX_CENTS:
+        raise ValueError(f'Amount out of range: {value!r}')
+    return cents
+
+
+def to_cents(value):
+    """Convert an amount ('4.99', '4,99', Decimal, int) to integer cents (0 if invalid)."""
+    try:
+        return parse_cents(value)
+    except ValueError:
+        return 0
+
+
+def parse_amount(text):
+    """
+    Convert a printed amount with exactly two decimals to cents.
+
+    Args:
+        text: Amount such as '12.34' or '12,34'
+
+    Returns:
+        int: Amount in cents
+    """
+    return int(text[:-3]) * 100 + int(text[-2:])
+
+
+def format_cents(cents):
+    """Format integer cents as a decimal string ('4.99')."""
+    sign = '-' if cents < 0 else ''
+    whole, fraction = divmod(abs(cents), 100)
+    return f'{sign}{whole}.{fraction:02d}'
+
+
+def upgrade_record(receipt):
+    """
+    Convert a receipt record written before amounts became integer cents.
+
+    String `total` and item `price` values become `total_cents` and
+    `price_cents`. Records already in the current format are returned
+    unchanged.
+
+    Args:
+        receipt: Stored receipt dict
+
+    Returns:
+        dict: Receipt dict with integer cent amounts
+    """
+    if 'total' not in receipt and not any('price' in item for item in receipt.get('items', ())):
+        return receipt
+
+    upgraded = {k: v for k, v in receipt.items() if k != 'total'}
+    if 'total_cents' not in upgraded:
+        upgraded['total_cents'] = to_cents(receipt.get('total', 0))
+    upgraded['items'] = [
+        {**{k: v for k, v in item.items() if k != 'price'},
+         'price_cents': item.get('price_cents', to_cents(item.get('price', 0)))}
+        for item in receipt.get('items', [])
+    ]
+    return upgraded
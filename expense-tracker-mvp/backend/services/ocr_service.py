@@ -1,16 +1,21 @@
 """
 OCR Service for extracting text from receipt images.
 
-CURRENT IMPLEMENTATION: Mock OCR that returns sample receipt text.
+OCR engines are pluggable backends selected by name:
 
-TO INTEGRATE REAL OCR:
-Replace the extract_text method with one of these options:
-1. Google Cloud Vision API
-2. AWS Textract
-3. Tesseract OCR (open source)
-4. Azure Computer Vision
+1. mock      - Returns realistic sample receipt text (default)
+2. tesseract - Local Tesseract OCR via pytesseract (pip install pytesseract,
+               plus the tesseract binary). Images are pre-processed with
+               Pillow first: grayscale, downscale to a target DPI and
+               binarize, which cuts OCR time per receipt.
 
-Example with Google Cloud Vision:
+OCRService can run the backend in a bounded process pool with a per-job
+timeout. At most max_pending jobs run or wait at once; beyond that
+extract_text() raises OCRBusyError so the API can answer 429 instead of
+queueing unbounded work.
+
+TO INTEGRATE A CLOUD OCR:
+Add an OCRBackend subclass, e.g. for Google Cloud Vision:
     from google.cloud import vision
     client = vision.ImageAnnotatorClient()
     with open(image_path, 'rb') as image_file:
@@ -21,17 +26,25 @@ Example with Google Cloud Vision:
 """
 
 import random
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
 from datetime import datetime, timedelta
 
+from services.metrics import REGISTRY, timer
 
-class OCRService:
-    """Service for extracting text from receipt images using OCR."""
 
-    def __init__(self):
-        """Initialize OCR service."""
-        # In real implementation, initialize OCR client here
-        # e.g., self.client = vision.ImageAnnotatorClient()
-        pass
+class OCRBusyError(Exception):
+    """Raised when the OCR pool is saturated and cannot accept more work."""
+
+
+class OCRTimeoutError(Exception):
+    """Raised when OCR for one image exceeds the configured timeout."""
+
+
+class OCRBackend:
+    """Base class for OCR engines."""
+
+    name = None
 
     def extract_text(self, image_path):
         """
@@ -43,91 +56,273 @@ class OCRService:
         Returns:
             String containing extracted text from the receipt
         """
+        raise NotImplementedError
+
+
+SAMPLE_STORES = ['Walmart', 'Target', 'Whole Foods', 'Costco', 'Safeway']
+
+# (name, min price, max price)
+SAMPLE_ITEMS = [
+    ('Organic Milk 1gal', 4.5, 6.5),
+    ('Bread Whole Wheat', 2.5, 4.0),
+    ('Eggs Large 12ct', 3.0, 5.0),
+    ('Chicken Breast 2lb', 8.0, 12.0),
+    ('Bananas 3lb', 1.5, 3.0),
+    ('Tomatoes 2lb', 3.0, 5.0),
+    ('Pasta 16oz', 1.5, 3.0),
+    ('Laundry Detergent', 8.0, 15.0),
+    ('Paper Towels 6pk', 10.0, 15.0),
+    ('Orange Juice 64oz', 4.0, 6.0),
+    ('Beer 6pk', 8.0, 12.0),
+    ('Wine Bottle', 10.0, 20.0),
+]
+
+
+def mock_receipt_text(rng=random, today=None):
+    """
+    Generate realistic receipt text, as the mock OCR backend returns it.
+
+    Args:
+        rng: random.Random instance (seed one for reproducible text)
+        today: Latest receipt date (defaults to now); dates fall within
+            the 30 days before it
+
+    Returns:
+        str: Receipt text
+    """
+    store = rng.choice(SAMPLE_STORES)
+
+    # Generate random date within last 30 days
+    days_ago = rng.randint(0, 30)
+    receipt_date = (today or datetime.now()) - timedelta(days=days_ago)
+    date_str = receipt_date.strftime('%m/%d/%Y')
+
+    # Select random items
+    sample_items = [(name, rng.uniform(low, high)) for name, low, high in SAMPLE_ITEMS]
+    num_items = rng.randint(4, 8)
+    selected_items = rng.sample(sample_items, num_items)
+
+    # Build receipt text
+    lines = [
+        store,
+        f"Date: {date_str}",
+        "",
+        "Items:"
+    ]
+
+    total = 0
+    for item_name, price in selected_items:
+        total += price
+        lines.append(f"{item_name}    ${price:.2f}")
+
+    lines.append("")
+    lines.append(f"Subtotal: ${total:.2f}")
+    lines.append(f"Tax: ${total * 0.08:.2f}")
+    total_with_tax = total * 1.08
+    lines.append(f"Total: ${total_with_tax:.2f}")
+    lines.append("")
+    lines.append("Thank you for shopping!")
+
+    return "\n".join(lines)
+
+
+class MockOCRBackend(OCRBackend):
+    """Mock OCR that returns sample receipt text."""
+
+    name = 'mock'
+
+    def __init__(self, seed=None, **options):
+        """
+        Initialize the mock backend.
+
+        Args:
+            seed: Optional seed for reproducible receipt text
+        """
+        self._rng = random.Random(seed) if seed is not None else random
+
+    def extract_text(self, image_path):
         # MOCK IMPLEMENTATION
         # This returns realistic sample receipt text
         # In production, replace this with actual OCR API call
-
-        sample_stores = ['Walmart', 'Target', 'Whole Foods', 'Costco', 'Safeway']
-        store = random.choice(sample_stores)
-
-        # Generate random date within last 30 days
-        days_ago = random.randint(0, 30)
-        receipt_date = datetime.now() - timedelta(days=days_ago)
-        date_str = receipt_date.strftime('%m/%d/%Y')
-
-        # Generate sample items
-        sample_items = [
-            ('Organic Milk 1gal', random.uniform(4.5, 6.5)),
-            ('Bread Whole Wheat', random.uniform(2.5, 4.0)),
-            ('Eggs Large 12ct', random.uniform(3.0, 5.0)),
-            ('Chicken Breast 2lb', random.uniform(8.0, 12.0)),
-            ('Bananas 3lb', random.uniform(1.5, 3.0)),
-            ('Tomatoes 2lb', random.uniform(3.0, 5.0)),
-            ('Pasta 16oz', random.uniform(1.5, 3.0)),
-            ('Laundry Detergent', random.uniform(8.0, 15.0)),
-            ('Paper Towels 6pk', random.uniform(10.0, 15.0)),
-            ('Orange Juice 64oz', random.uniform(4.0, 6.0)),
-            ('Beer 6pk', random.uniform(8.0, 12.0)),
-            ('Wine Bottle', random.uniform(10.0, 20.0)),
-        ]
-
-        # Select random items
-        num_items = random.randint(4, 8)
-        selected_items = random.sample(sample_items, num_items)
-
-        # Build receipt text
-        lines = [
-            store,
-            f"Date: {date_str}",
-            "",
-            "Items:"
-        ]
-
-        total = 0
-        for item_name, price in selected_items:
-            total += price
-            lines.append(f"{item_name}    ${price:.2f}")
-
-        lines.append("")
-        lines.append(f"Subtotal: ${total:.2f}")
-        lines.append(f"Tax: ${total * 0.08:.2f}")
-        total_with_tax = total * 1.08
-        lines.append(f"Total: ${total_with_tax:.2f}")
-        lines.append("")
-        lines.append("Thank you for shopping!")
-
-        mock_text = "\n".join(lines)
+        mock_text = mock_receipt_text(self._rng)
 
         print(f"[OCR Mock] Extracted text from {image_path}")
         return mock_text
 
-    def extract_text_real(self, image_path):
+
+class TesseractOCRBackend(OCRBackend):
+    """Local Tesseract OCR with Pillow pre-processing."""
+
+    name = 'tesseract'
+
+    # Typical thermal receipt paper is 80mm (~3.15in) wide; used to estimate
+    # the scan DPI when the image carries no DPI metadata
+    RECEIPT_WIDTH_INCHES = 3.15
+
+    def __init__(self, target_dpi=300, timeout=None, lang='eng', **options):
+        """
+        Initialize Tesseract backend.
+
+        Args:
+            target_dpi: Resolution images are downscaled to before OCR
+            timeout: Seconds after which the tesseract process is killed
+            lang: Tesseract language code(s)
+        """
+        import pytesseract  # Optional dependency, only needed for this backend
+        self._pytesseract = pytesseract
+        self.target_dpi = target_dpi
+        self.timeout = timeout or 0
+        self.lang = lang
+
+    def preprocess(self, image_path):
         """
-        PLACEHOLDER for real OCR implementation.
+        Prepare an image for OCR: grayscale, downscale and binarize.
 
-        Uncomment and modify based on your chosen OCR service.
+        Returns:
+            PIL.Image: 1-bit image at no more than target_dpi
         """
-        # Example: Google Cloud Vision
-        # from google.cloud import vision
-        # client = vision.ImageAnnotatorClient()
-        #
-        # with open(image_path, 'rb') as image_file:
-        #     content = image_file.read()
-        #
-        # image = vision.Image(content=content)
-        # response = client.text_detection(image=image)
-        #
-        # if response.error.message:
-        #     raise Exception(f'OCR error: {response.error.message}')
-        #
-        # return response.text_annotations[0].description if response.text_annotations else ""
-
-        # Example: Tesseract OCR (open source)
-        # import pytesseract
-        # from PIL import Image
-        #
-        # image = Image.open(image_path)
-        # text = pytesseract.image_to_string(image)
-        # return text
-
-        raise NotImplementedError("Real OCR not implemented yet")
+        from PIL import Image, ImageOps
+
+        with Image.open(image_path) as original:
+            image = ImageOps.exif_transpose(original).convert('L')
+
+        # Downscale to the target DPI (phone photos are often 600+ DPI)
+        dpi = original.info.get('dpi', (0, 0))[0] or image.width / self.RECEIPT_WIDTH_INCHES
+        if dpi > self.target_dpi:
+            scale = self.target_dpi / dpi
+            size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+            image = image.resize(size, Image.Resampling.LANCZOS)
+
+        # Binarize with Otsu's threshold computed from the histogram
+        threshold = self._otsu_threshold(image.histogram())
+        return image.point(lambda value: 255 if value > threshold else 0, mode='1')
+
+    def _otsu_threshold(self, histogram):
+        """Return the gray level that best separates ink from paper."""
+        total = sum(histogram)
+        sum_all = sum(level * count for level, count in enumerate(histogram))
+        sum_background = 0
+        weight_background = 0
+        best_threshold = 127
+        best_variance = 0
+
+        for level, count in enumerate(histogram):
+            weight_background += count
+            if weight_background == 0:
+                continue
+            weight_foreground = total - weight_background
+            if weight_foreground == 0:
+                break
+            sum_background += level * count
+            mean_background = sum_background / weight_background
+            mean_foreground = (sum_all - sum_background) / weight_foreground
+            variance = weight_background * weight_foreground * (mean_background - mean_foreground) ** 2
+            if variance > best_variance:
+                best_variance = variance
+                best_threshold = level
+        return best_threshold
+
+    def extract_text(self, image_path):
+        image = self.preprocess(image_path)
+        try:
+            return self._pytesseract.image_to_string(image, lang=self.lang, timeout=self.timeout)
+        except RuntimeError as e:
+            # pytesseract raises RuntimeError when its timeout kills tesseract
+            raise OCRTimeoutError(f'OCR timed out for {image_path}') from e
+
+
+BACKENDS = {backend.name: backend for backend in (MockOCRBackend, TesseractOCRBackend)}
+
+
+def create_backend(name, **options):
+    """Create an OCR backend by name ('mock' or 'tesseract')."""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown OCR backend: {name}")
+    return BACKENDS[name](**options)
+
+
+# Backend instance of each pool worker process
+_worker_backend = None
+
+
+def _init_worker(name, options):
+    """Process pool initializer: create one backend per worker process."""
+    global _worker_backend
+    _worker_backend = create_backend(name, **options)
+
+
+def _extract_in_worker(image_path):
+    return _worker_backend.extract_text(image_path)
+
+
+class OCRService:
+    """Service for extracting text from receipt images using OCR."""
+
+    def __init__(self, backend='mock', workers=0, timeout=30, max_pending=None, **options):
+        """
+        Initialize OCR service.
+
+        Args:
+            backend: OCR backend name ('mock' or 'tesseract')
+            workers: Size of the OCR process pool (0 runs OCR in the calling thread)
+            timeout: Seconds to wait for one image before giving up
+            max_pending: Maximum OCR jobs running or waiting at once
+                (defaults to 2 per worker, or 4 without a pool)
+            **options: Backend options (e.g. target_dpi for tesseract)
+        """
+        options.setdefault('timeout', timeout)
+        self.backend_name = backend
+        self.timeout = timeout
+        self._backend = create_backend(backend, **options)
+        self._pool = None
+        if workers:
+            self._pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                             initargs=(backend, options))
+        self.max_pending = max_pending or (workers * 2 if workers else 4)
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+
+    def extract_text(self, image_path, block=False):
+        """
+        Extract text from receipt image.
+
+        Args:
+            image_path: Path to the receipt image file
+            block: Wait for a free slot instead of failing when saturated
+
+        Returns:
+            String containing extracted text from the receipt
+
+        Raises:
+            OCRBusyError: If max_pending jobs are already in progress
+            OCRTimeoutError: If OCR takes longer than the timeout
+        """
+        if not self._slots.acquire(blocking=block):
+            raise OCRBusyError('OCR service is at capacity, retry later')
+
+        with timer('ocr', backend=self.backend_name):
+            text = self._extract(image_path)
+        REGISTRY.inc('ocr_text_bytes_total', len(text.encode('utf-8')))
+        return text
+
+    def _extract(self, image_path):
+        """Run OCR on a held slot and release the slot once the work is over."""
+        if self._pool is None:
+            try:
+                return self._backend.extract_text(image_path)
+            finally:
+                self._slots.release()
+
+        try:
+            future = self._pool.submit(_extract_in_worker, image_path)
+        except BaseException:
+            self._slots.release()
+            raise
+        # A timed-out run cannot be interrupted and keeps its pool worker
+        # busy, so its slot stays taken until it finishes (or is cancelled
+        # before it started)
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise OCRTimeoutError(f'OCR timed out for {image_path}')
@@ -0,0 +1,127 @@
+"""
+Compressed store for raw OCR text.
+
+OCR text is only needed for debugging and re-parsing, yet it is by far
+the largest field of a receipt. Keeping it out of the receipt records
+means list, detail and stats reads never load it. Texts are
+zlib-compressed and kept by receipt id in a small SQLite database
+(data/ocr_text.db), whichever receipt storage backend is in use.
+"""
+
+import sqlite3
+import threading
+import zlib
+
+
+class OCRTextStore:
+    """zlib-compressed OCR text blobs addressed by receipt id."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS ocr_text (
+            receipt_id TEXT PRIMARY KEY,
+            data BLOB NOT NULL
+        );
+    """
+
+    def __init__(self, path, level=6):
+        """
+        Initialize the store.
+
+        Args:
+            path: Path to the SQLite database file holding OCR text
+            level: zlib compression level (1 fastest - 9 smallest)
+        """
+        self.path = path
+        self.level = level
+        self._local = threading.local()
+
+        conn = self._connect()
+        with conn:
+            conn.executescript(self.SCHEMA)
+
+    def _connect(self):
+        """Return the calling thread's connection, opening it on first use."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def put(self, receipt_id, ocr_text):
+        """Store (or replace) the OCR text of one receipt."""
+        self.put_many([(receipt_id, ocr_text)])
+
+    def put_many(self, texts):
+        """
+        Store the OCR text of several receipts in one transaction.
+
+        Args:
+            texts: Iterable of (receipt_id, ocr_text) pairs
+        """
+        rows = [(receipt_id, zlib.compress(ocr_text.encode('utf-8'), self.level))
+                for receipt_id, ocr_text in texts if ocr_text is not None]
+        conn = self._connect()
+        with conn:
+            conn.executemany('INSERT OR REPLACE INTO ocr_text (receipt_id, data) VALUES (?, ?)', rows)
+
+    def delete_many(self, receipt_ids):
+        """Drop the OCR text of several receipts, if any is stored."""
+        conn = self._connect()
+        with conn:
+            conn.executemany('DELETE FROM ocr_text WHERE receipt_id = ?',
+                             [(receipt_id,) for receipt_id in receipt_ids])
+
+    def get(self, receipt_id):
+        """Return the OCR text of a receipt, or None if none is stored."""
+        row = self._connect().execute(
+            'SELECT data FROM ocr_text WHERE receipt_id = ?', (receipt_id,)
+        ).fetchone()
+        return zlib.decompress(row[0]).decode('utf-8') if row else None
+
+    def get_many(self, receipt_ids):
+        """
+        Return the OCR text of several receipts.
+
+        Returns:
+            dict: {receipt_id: ocr_text} for the ids that have stored text
+        """
+        conn = self._connect()
+        texts = {}
+        ids = list(receipt_ids)
+        # Stay below SQLite's bound-parameter limit
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            rows = conn.execute(
+                f'SELECT receipt_id, data FROM ocr_text WHERE receipt_id IN ({placeholders})', chunk
+            )
+            for receipt_id, data in rows:
+                texts[receipt_id] = zlib.decompress(data).decode('utf-8')
+        return texts
+
+
+def migrate_inline_ocr_text(storage, ocr_store):
+    """
+    Move OCR text still stored inside receipt records into the OCR store.
+
+    Texts are written to the store before the receipts are rewritten
+    without them, so an interrupted migration is simply re-run.
+
+    Args:
+        storage: ReceiptStorage instance
+        ocr_store: OCRTextStore instance
+
+    Returns:
+        int: Number of receipts migrated
+    """
+    receipts = storage.receipts_with_ocr_text()
+    if not receipts:
+        return 0
+
+    ocr_store.put_many((r['id'], r['ocr_text']) for r in receipts)
+    storage.update_receipts([{k: v for k, v in r.items() if k != 'ocr_text'} for r in receipts])
+    storage.reclaim_space()
+    print(f"[Storage] Moved OCR text of {len(receipts)} receipts to {ocr_store.path}")
+    return len(receipts)
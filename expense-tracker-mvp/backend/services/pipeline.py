@@ -0,0 +1,108 @@
+"""
+Receipt processing pipeline shared by synchronous uploads and background jobs.
+
+process_image() runs OCR and parsing for one stored image, reusing cached
+results for images whose content hash was seen before.
+"""
+
+from datetime import datetime
+
+from services.models import format_cents
+
+
+def process_image(filepath, ocr_service, ai_parser, result_cache=None, content_hash=None,
+                  block=False):
+    """
+    Run OCR and AI parsing on a stored receipt image.
+
+    Args:
+        filepath: Path to the saved image
+        ocr_service: OCRService instance
+        ai_parser: AIParser or LLMParser instance
+        result_cache: Optional PipelineResultCache
+        content_hash: SHA-256 of the image bytes (cache key)
+        block: Wait for OCR capacity instead of raising OCRBusyError
+
+    Returns:
+        tuple: (ocr_text, ParsedReceipt)
+    """
+    cache = result_cache
+    parser_version = ai_parser.version
+
+    # Step 1: OCR - Extract text from image
+    ocr_text = cache.get_ocr(content_hash) if cache else None
+    if ocr_text is None:
+        ocr_text = ocr_service.extract_text(filepath, block=block)
+        if cache:
+            cache.put_ocr(content_hash, ocr_text)
+
+    # Step 2: AI Parsing - Convert text to structured data
+    parsed_data = cache.get_parsed(content_hash, parser_version) if cache else None
+    if parsed_data is None:
+        # Cached under the version that produced it, which is not
+        # parser_version when an LLM parse fell back to the rules
+        parsed_data, parsed_version = ai_parser.parse_receipt_versioned(ocr_text)
+        if cache:
+            cache.put_parsed(content_hash, parsed_version, parsed_data)
+
+    return ocr_text, parsed_data
+
+
+def build_receipt(receipt_id, saved_filename, parsed, uploaded_at=None, content_hash=None,
+                  fx_rates=None):
+    """
+    Create the stored receipt record from pipeline output.
+
+    The raw OCR text is not part of the record; callers store it in the
+    OCRTextStore.
+
+    Args:
+        receipt_id: Receipt UUID
+        saved_filename: Name of the image file under the upload folder
+        parsed: ParsedReceipt from AIParser.parse_receipt
+        uploaded_at: ISO upload timestamp (defaults to now)
+        content_hash: SHA-256 of the image bytes, used to detect duplicate uploads
+        fx_rates: Optional FXRates; adds amounts converted to the base currency
+
+    Returns:
+        dict: Receipt record (amounts in integer cents)
+    """
+    receipt = {
+        'id': receipt_id,
+        'filename': saved_filename,
+        'uploaded_at': uploaded_at or datetime.now().isoformat(),
+        'store': parsed.store,
+        'date': parsed.date,
+        'items': [item.to_record() for item in parsed.items],
+        'total_cents': parsed.total_cents,
+        'currency': parsed.currency  # Store currency
+    }
+    if content_hash:
+        receipt['content_hash'] = content_hash
+    if fx_rates is not None:
+        receipt = fx_rates.convert_receipt(receipt)
+    return receipt
+
+
+def public_item(item):
+    """Return the API form of a stored item (price as a decimal string)."""
+    public = {k: v for k, v in item.items() if k not in ('price_cents', 'base_price_cents')}
+    public['price'] = format_cents(item.get('price_cents', 0))
+    return public
+
+
+def public_receipt(receipt):
+    """
+    Return the API form of a stored receipt.
+
+    Amounts are formatted as decimal strings and OCR text is left out
+    (too verbose for API responses). Converted receipts also carry
+    base_currency, base_total and fx_rate.
+    """
+    public = {k: v for k, v in receipt.items()
+              if k not in ('ocr_text', 'total_cents', 'base_total_cents', 'items')}
+    public['items'] = [public_item(item) for item in receipt.get('items', [])]
+    public['total'] = format_cents(receipt.get('total_cents', 0))
+    if 'base_total_cents' in receipt:
+        public['base_total'] = format_cents(receipt['base_total_cents'])
+    return public
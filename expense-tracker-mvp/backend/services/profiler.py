@@ -0,0 +1,85 @@
+"""
+Sampling profiler for a single request.
+
+A background thread looks at the request thread's Python stack every
+`interval` seconds (sys._current_frames) and counts identical stacks.
+Nothing is hooked into the profiled code, so the overhead is the sampling
+thread alone and only while a profile is running. The result is written in
+the "collapsed stacks" format read by flamegraph.pl and speedscope:
+
+    app.py:upload_receipt;services/pipeline.py:process_image 42
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+
+class SamplingProfiler:
+    """Samples one thread's stack until stopped."""
+
+    def __init__(self, thread_id, interval=0.002):
+        """
+        Initialize the profiler (call start() to begin sampling).
+
+        Args:
+            thread_id: threading.get_ident() of the thread to sample
+            interval: Seconds between samples
+        """
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+
+    def start(self):
+        """Start sampling in a background thread."""
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling and wait for the sampling thread to finish."""
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[self._collapse(frame)] += 1
+                self.samples += 1
+            time.sleep(self.interval)
+
+    def _collapse(self, frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f'{_short_path(code.co_filename)}:{code.co_name}')
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def write(self, path):
+        """
+        Write the samples in collapsed-stack format, most frequent first.
+
+        Args:
+            path: Output file path
+        """
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+        os.replace(tmp_path, path)
+
+
+def _short_path(filename):
+    """Shorten a source path relative to the working directory or site-packages."""
+    if 'site-packages' in filename:
+        return filename.rsplit('site-packages' + os.sep, 1)[-1]
+    try:
+        relative = os.path.relpath(filename)
+    except ValueError:  # Other drive on Windows
+        return filename
+    return filename if relative.startswith('..') else relative
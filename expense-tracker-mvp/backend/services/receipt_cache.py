@@ -0,0 +1,166 @@
+"""
+In-process receipt cache for the file-based storage backends.
+
+ReceiptIndex keeps parsed receipts with an id -> receipt dict, a
+pre-sorted uploaded_at order and materialized monthly aggregates, so
+detail lookups are O(1), list calls neither reparse nor resort, and
+monthly stats are O(categories). ReceiptFileCache wraps an index around a JSON
+file and reloads it only when the file's mtime/size fingerprint changes
+(e.g. another process wrote it) or the write path replaces it.
+"""
+
+import bisect
+import os
+import threading
+
+from services.aggregates import MonthlyAggregates
+
+
+def _order_key(receipt):
+    """Sort key for upload order (ties broken by id)."""
+    return (receipt.get('uploaded_at', ''), receipt['id'])
+
+
+class ReceiptIndex:
+    """Receipts indexed by id, kept in uploaded_at order, with monthly aggregates."""
+
+    def __init__(self, receipts=()):
+        """
+        Build the index.
+
+        Args:
+            receipts: Iterable of receipt dicts (later duplicates win by id)
+        """
+        self.by_id = {}
+        self.by_hash = {}
+        for receipt in receipts:
+            self.by_id[receipt['id']] = receipt
+            if receipt.get('content_hash'):
+                self.by_hash[receipt['content_hash']] = receipt
+        self._ordered = sorted(self.by_id.values(), key=_order_key)
+        self._keys = [_order_key(r) for r in self._ordered]
+        self.aggregates = MonthlyAggregates(self._ordered)
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def get(self, receipt_id):
+        """Return the receipt for an id, or None."""
+        return self.by_id.get(receipt_id)
+
+    def find_by_hash(self, content_hash):
+        """Return the receipt uploaded with this image hash, or None."""
+        return self.by_hash.get(content_hash)
+
+    def add(self, receipt):
+        """Insert or replace a receipt, keeping upload order."""
+        previous = self.by_id.get(receipt['id'])
+        if previous is not None:
+            self._remove_ordered(previous)
+            self.aggregates.remove(previous)
+            if self.by_hash.get(previous.get('content_hash')) is previous:
+                del self.by_hash[previous['content_hash']]
+
+        self.by_id[receipt['id']] = receipt
+        if receipt.get('content_hash'):
+            self.by_hash[receipt['content_hash']] = receipt
+        key = _order_key(receipt)
+        position = bisect.bisect_right(self._keys, key)
+        self._keys.insert(position, key)
+        self._ordered.insert(position, receipt)
+        self.aggregates.add(receipt)
+
+    def rebuild_aggregates(self):
+        """Recompute the monthly aggregates from scratch."""
+        self.aggregates = MonthlyAggregates(self._ordered)
+
+    def _remove_ordered(self, receipt):
+        position = bisect.bisect_left(self._keys, _order_key(receipt))
+        del self._keys[position]
+        del self._ordered[position]
+
+    def newest_first(self):
+        """Return receipts sorted by upload date, newest first."""
+        return self._ordered[::-1]
+
+    def iter_newest(self, before=None):
+        """
+        Iterate receipts newest first.
+
+        Args:
+            before: Optional (uploaded_at, id) key; iteration starts at the
+                first receipt strictly older than it (O(log n) seek)
+        """
+        position = len(self._ordered)
+        if before is not None:
+            position = bisect.bisect_left(self._keys, tuple(before))
+        ordered = self._ordered
+        for i in range(position - 1, -1, -1):
+            yield ordered[i]
+
+    def values(self):
+        """Return receipts in upload order, oldest first."""
+        return list(self._ordered)
+
+
+class ReceiptFileCache:
+    """Shared parsed copy of a receipts JSON file, invalidated by inode/mtime/size."""
+
+    def __init__(self, path, loader):
+        """
+        Initialize the cache.
+
+        Args:
+            path: Path of the JSON file backing the cache
+            loader: Callable returning the parsed receipt list from disk
+        """
+        self.path = path
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._index = None
+        self._fingerprint = None
+        self.hits = 0
+        self.misses = 0
+
+    def _stat(self):
+        """Return the (inode, mtime_ns, size) fingerprint of the file, or None."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        # The file is replaced atomically on write, so the inode changes too
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def index(self):
+        """Return the current ReceiptIndex, reloading the file if it changed."""
+        with self._lock:
+            fingerprint = self._stat()
+            if self._index is not None and fingerprint == self._fingerprint:
+                self.hits += 1
+                return self._index
+
+            self.misses += 1
+            self._index = ReceiptIndex(self._loader())
+            self._fingerprint = fingerprint
+            return self._index
+
+    def add(self, receipt):
+        """Add a receipt written by this process and record the new fingerprint."""
+        with self._lock:
+            if self._index is not None:
+                self._index.add(receipt)
+            self._fingerprint = self._stat()
+
+    def replace(self, index):
+        """Install an index written by this process and record the new fingerprint."""
+        with self._lock:
+            self._index = index
+            self._fingerprint = self._stat()
+
+    def stats(self):
+        """Return hit/miss counters and the number of cached receipts."""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._index) if self._index is not None else 0
+        }
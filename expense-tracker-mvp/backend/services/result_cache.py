@@ -0,0 +1,111 @@
+"""
+OCR and parse result cache keyed by image content hash.
+
+Re-uploading the same photo (retries, double taps) should not pay for
+OCR or parsing again. OCR text is cached per image hash, and parse
+output per (image hash, parser version), so a parser upgrade re-parses
+cached OCR text instead of re-running OCR. Both caches are in-process
+LRUs bounded by entry count and approximate size in bytes. Parse results
+are immutable ParsedReceipt objects, so they are shared without copying.
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Thread-safe LRU cache bounded by entry count and total size."""
+
+    def __init__(self, max_entries=10000, max_bytes=64 * 1024 * 1024, sizeof=len):
+        """
+        Initialize the cache.
+
+        Args:
+            max_entries: Maximum number of cached values
+            max_bytes: Maximum total size of cached values
+            sizeof: Callable returning the approximate size of a value
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._entries = OrderedDict()  # key -> (value, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return the cached value for key (marking it recently used), or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        """Cache a value, evicting least recently used entries to stay in bounds."""
+        size = self._sizeof(value)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def stats(self):
+        """Return hit/miss counters and current usage."""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(self._entries),
+            'bytes': self._bytes
+        }
+
+
+class PipelineResultCache:
+    """OCR text and parse output cached by image content hash."""
+
+    def __init__(self, max_entries=10000, max_bytes=64 * 1024 * 1024):
+        """
+        Initialize the caches (each gets the full entry/byte budget).
+
+        Args:
+            max_entries: Maximum number of cached values per cache
+            max_bytes: Maximum approximate size per cache
+        """
+        self.ocr = LRUCache(max_entries, max_bytes)
+        self.parsed = LRUCache(max_entries, max_bytes, sizeof=lambda value: len(repr(value)))
+
+    def get_ocr(self, content_hash):
+        """Return cached OCR text for an image hash, or None."""
+        if content_hash is None:
+            return None
+        return self.ocr.get(content_hash)
+
+    def put_ocr(self, content_hash, ocr_text):
+        if content_hash is not None:
+            self.ocr.put(content_hash, ocr_text)
+
+    def get_parsed(self, content_hash, parser_version):
+        """Return the cached ParsedReceipt, or None."""
+        if content_hash is None:
+            return None
+        return self.parsed.get((content_hash, parser_version))
+
+    def put_parsed(self, content_hash, parser_version, parsed):
+        if content_hash is not None:
+            self.parsed.put((content_hash, parser_version), parsed)
+
+    def stats(self):
+        """Return counters for both caches."""
+        return {'ocr': self.ocr.stats(), 'parsed': self.parsed.stats()}
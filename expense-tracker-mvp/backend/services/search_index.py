@@ -0,0 +1,358 @@
+"""
+Full-text search index over store names, item names and OCR text.
+
+The index is a SQLite FTS5 table in its own database (data/search.db),
+whichever receipt storage backend is in use. Receipts are indexed when
+they are stored and re-indexed when re-parsed. Startup rebuilds the index
+only if its format changed or it does not hold one document per stored
+receipt (e.g. after a crash between the storage write and indexing).
+
+search_docs holds one row per receipt: the indexed text plus the summary
+fields returned with a hit, so a search never touches receipt storage.
+search_fts is an external-content FTS5 index over it, kept in sync by
+triggers. Query words match whole words, except the last one (and any
+word ending in *), which matches as a prefix, so results update as the
+user types ("organic mil" finds "Organic Milk"). Matching is case- and
+accent-insensitive. Hits come newest upload first, as in GET /receipts:
+document ids are derived from uploaded_at rather than assigned in insert
+order (background jobs store receipts some time after their upload), so
+FTS5 walks its doclists in upload order and stops after one page, and the
+cost does not grow with the number of matches the way sorting or
+relevance ranking does. Prefixes
+of up to 4 characters are indexed; longer prefixes are expanded at query
+time.
+"""
+
+import re
+import sqlite3
+import threading
+import unicodedata
+from datetime import datetime, timedelta
+
+from services.models import format_cents
+
+
+TERM_PATTERN = re.compile(r'(\w+)(\*?)')
+WORD_PATTERN = re.compile(r'\w+')
+MAX_TERMS = 8
+
+EPOCH = datetime(1970, 1, 1)
+# Receipts uploaded in the same microsecond get consecutive document ids
+SLOTS_PER_MICROSECOND = 1024
+
+
+def fold(text):
+    """Lower-case text and strip accents, as the FTS5 tokenizer does."""
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def upload_doc_id(uploaded_at):
+    """
+    Return the first document id for a receipt uploaded at uploaded_at.
+
+    Ids grow with the upload time in the order GET /receipts sorts it
+    (the ISO string, ignoring any UTC offset).
+
+    Returns:
+        int: Microseconds since 1970 times SLOTS_PER_MICROSECOND, or None
+            if uploaded_at is not an ISO timestamp
+    """
+    try:
+        uploaded = datetime.fromisoformat(uploaded_at).replace(tzinfo=None)
+    except (TypeError, ValueError):
+        return None
+    return (uploaded - EPOCH) // timedelta(microseconds=1) * SLOTS_PER_MICROSECOND
+
+
+class SearchIndex:
+    """SQLite FTS5 index of receipts for GET /search."""
+
+    # Bump when the indexed fields, tokenizer or document ids change; the
+    # index is then rebuilt
+    FORMAT = '2'
+
+    DOCS_SCHEMA = """
+        CREATE TABLE IF NOT EXISTS search_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS search_docs (
+            doc_id INTEGER PRIMARY KEY,
+            receipt_id TEXT NOT NULL UNIQUE,
+            uploaded_at TEXT NOT NULL,
+            date TEXT,
+            total_cents INTEGER NOT NULL,
+            currency TEXT NOT NULL,
+            item_count INTEGER NOT NULL,
+            store TEXT NOT NULL,
+            items TEXT NOT NULL,       -- item names, one per line
+            categories TEXT NOT NULL,  -- item categories, one per line, same order
+            ocr_text TEXT NOT NULL
+        );
+        CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5(
+            store, items, categories, ocr_text,
+            content='search_docs', content_rowid='doc_id',
+            tokenize='unicode61 remove_diacritics 2', prefix='1 2 3 4'
+        );
+    """
+
+    TRIGGERS = """
+        CREATE TRIGGER IF NOT EXISTS search_docs_insert AFTER INSERT ON search_docs BEGIN
+            INSERT INTO search_fts (rowid, store, items, categories, ocr_text)
+            VALUES (new.doc_id, new.store, new.items, new.categories, new.ocr_text);
+        END;
+        CREATE TRIGGER IF NOT EXISTS search_docs_delete AFTER DELETE ON search_docs BEGIN
+            INSERT INTO search_fts (search_fts, rowid, store, items, categories, ocr_text)
+            VALUES ('delete', old.doc_id, old.store, old.items, old.categories, old.ocr_text);
+        END;
+        CREATE TRIGGER IF NOT EXISTS search_docs_update AFTER UPDATE ON search_docs BEGIN
+            INSERT INTO search_fts (search_fts, rowid, store, items, categories, ocr_text)
+            VALUES ('delete', old.doc_id, old.store, old.items, old.categories, old.ocr_text);
+            INSERT INTO search_fts (rowid, store, items, categories, ocr_text)
+            VALUES (new.doc_id, new.store, new.items, new.categories, new.ocr_text);
+        END;
+    """
+
+    INSERT_DOC = """
+        INSERT INTO search_docs (doc_id, receipt_id, uploaded_at, date, total_cents, currency,
+                                 item_count, store, items, categories, ocr_text)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """
+
+    def __init__(self, path):
+        """
+        Open (or create) the index.
+
+        Args:
+            path: Path to the SQLite database file holding the index
+        """
+        self.path = path
+        self._local = threading.local()
+
+        conn = self._connect()
+        with conn:
+            conn.executescript(self.DOCS_SCHEMA + self.TRIGGERS)
+            # A new, empty index is current; receipts are added as they arrive
+            if self._format() is None and self.is_empty():
+                conn.execute("INSERT INTO search_meta (key, value) VALUES ('format', ?)", (self.FORMAT,))
+
+    def _connect(self):
+        """Return the calling thread's connection, opening it on first use."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _format(self):
+        row = self._connect().execute("SELECT value FROM search_meta WHERE key = 'format'").fetchone()
+        return row[0] if row else None
+
+    def is_empty(self):
+        """Return True if no receipts are indexed."""
+        return self._connect().execute('SELECT 1 FROM search_docs LIMIT 1').fetchone() is None
+
+    def count(self):
+        """Return the number of indexed receipts."""
+        return self._connect().execute('SELECT COUNT(*) FROM search_docs').fetchone()[0]
+
+    def is_current(self, receipt_count):
+        """
+        Check whether the index can be used as is.
+
+        Args:
+            receipt_count: Number of receipts in storage
+
+        Returns:
+            bool: False if the index has an old format, or does not hold
+                receipt_count documents (e.g. created for existing receipts,
+                or a crash came between storing receipts and indexing them)
+        """
+        return self._format() == self.FORMAT and self.count() == receipt_count
+
+    def _doc_row(self, receipt, ocr_text):
+        items = receipt.get('items', [])
+        return (receipt['id'], receipt['uploaded_at'], receipt.get('date'),
+                receipt.get('total_cents', 0), receipt.get('currency', 'USD'), len(items),
+                receipt.get('store') or '',
+                '\n'.join(item.get('name') or '' for item in items),
+                '\n'.join(item.get('category') or '' for item in items),
+                ocr_text or '')
+
+    def add(self, receipts, ocr_texts):
+        """
+        Index new receipts in one transaction.
+
+        Args:
+            receipts: Receipt dicts
+            ocr_texts: (receipt_id, ocr_text) pairs, or a dict by receipt id
+        """
+        ocr_texts = dict(ocr_texts)
+        conn = self._connect()
+        with conn:
+            for receipt in receipts:
+                # Re-running a job for a receipt updates its row instead of failing
+                conn.execute(self.INSERT_DOC + """
+                    ON CONFLICT (receipt_id) DO UPDATE SET
+                        uploaded_at = excluded.uploaded_at, date = excluded.date,
+                        total_cents = excluded.total_cents, currency = excluded.currency,
+                        item_count = excluded.item_count, store = excluded.store,
+                        items = excluded.items, categories = excluded.categories,
+                        ocr_text = excluded.ocr_text
+                """, (self._free_doc_id(conn, receipt),)
+                    + self._doc_row(receipt, ocr_texts.get(receipt['id'])))
+
+    def _free_doc_id(self, conn, receipt):
+        """Return an unused document id in the receipt's upload time slots (None lets SQLite pick)."""
+        first = upload_doc_id(receipt['uploaded_at'])
+        if first is None:
+            return None
+        last = conn.execute('SELECT MAX(doc_id) FROM search_docs WHERE doc_id >= ? AND doc_id < ?',
+                            (first, first + SLOTS_PER_MICROSECOND)).fetchone()[0]
+        return first if last is None else last + 1
+
+    def update(self, receipts):
+        """
+        Re-index changed receipts (e.g. after re-parsing), keeping their OCR text.
+
+        Args:
+            receipts: Receipt dicts (receipts not in the index are ignored)
+        """
+        rows = [self._doc_row(r, None)[2:9] + (r['id'],) for r in receipts]
+        conn = self._connect()
+        with conn:
+            conn.executemany("""
+                UPDATE search_docs SET date = ?, total_cents = ?, currency = ?, item_count = ?,
+                                       store = ?, items = ?, categories = ?
+                WHERE receipt_id = ?
+            """, rows)
+
+    def rebuild(self, receipts, get_ocr_texts, chunk_size=10000):
+        """
+        Re-create the index from all stored receipts.
+
+        Args:
+            receipts: All receipt dicts
+            get_ocr_texts: Function mapping a list of receipt ids to a
+                {receipt_id: ocr_text} dict (e.g. OCRTextStore.get_many)
+            chunk_size: Receipts whose OCR text is loaded at a time
+        """
+        # Oldest first, so receipts uploaded in the same microsecond get
+        # ids in (uploaded_at, id) order
+        receipts = sorted(receipts, key=lambda r: (r['uploaded_at'], r['id']))
+        doc_ids = {}
+        next_slot = {}
+        for receipt in receipts:
+            first = upload_doc_id(receipt['uploaded_at'])
+            if first is not None:
+                doc_ids[receipt['id']] = next_slot.get(first, first)
+                next_slot[first] = doc_ids[receipt['id']] + 1
+        conn = self._connect()
+        # The format is cleared first, so an interrupted rebuild is redone
+        # on the next start. Documents are loaded without the per-row
+        # triggers and the full-text index is then built in one pass
+        conn.executescript("""
+            DELETE FROM search_meta WHERE key = 'format';
+            DROP TABLE IF EXISTS search_fts;
+            DROP TABLE IF EXISTS search_docs;
+        """ + self.DOCS_SCHEMA)
+        with conn:
+            for start in range(0, len(receipts), chunk_size):
+                chunk = receipts[start:start + chunk_size]
+                ocr_texts = get_ocr_texts([r['id'] for r in chunk])
+                conn.executemany(self.INSERT_DOC, [
+                    (doc_ids.get(r['id']),) + self._doc_row(r, ocr_texts.get(r['id'])) for r in chunk
+                ])
+            conn.execute("INSERT INTO search_fts (search_fts) VALUES ('rebuild')")
+        conn.executescript(self.TRIGGERS)
+        with conn:
+            conn.execute("INSERT INTO search_meta (key, value) VALUES ('format', ?)", (self.FORMAT,))
+        print(f"[Search] Indexed {len(receipts)} receipts")
+
+    def search(self, query='', category=None, date_from=None, date_to=None, limit=20, cursor=None):
+        """
+        Find receipts matching a query, newest upload first.
+
+        Args:
+            query: Free text; every word must match a word of the store
+                name, an item name or the OCR text (the last word, and words
+                ending in *, as a prefix)
+            category: Only receipts with at least one item in this category
+            date_from: Inclusive receipt date lower bound (YYYY-MM-DD)
+            date_to: Inclusive receipt date upper bound (YYYY-MM-DD)
+            limit: Page size
+            cursor: next_cursor of the previous page
+
+        Returns:
+            tuple: (hits, next_cursor) where each hit is a receipt summary
+                plus matched_items (matching item names, or the items in
+                category) and an OCR text snippet
+
+        Raises:
+            ValueError: If there are no search terms or the cursor is invalid
+        """
+        terms = [[word, star == '*'] for word, star in TERM_PATTERN.findall(fold(query))][:MAX_TERMS]
+        if not terms and not category:
+            raise ValueError('q must contain at least one word')
+
+        clauses = []
+        if terms:
+            terms[-1][1] = True
+            words = ' AND '.join(f'"{word}"*' if prefix else f'"{word}"' for word, prefix in terms)
+            clauses.append(f'{{store items ocr_text}} : ({words})')
+        if category:
+            clauses.append('categories : "{}"'.format(fold(category).replace('"', '""')))
+
+        sql = """
+            SELECT d.doc_id, d.receipt_id, d.store, d.date, d.total_cents, d.currency,
+                   d.uploaded_at, d.item_count, d.items, d.categories,
+                   snippet(search_fts, 3, '[', ']', '...', 8)
+            FROM search_fts JOIN search_docs d ON d.doc_id = search_fts.rowid
+            WHERE search_fts MATCH ?
+        """
+        params = [' AND '.join(clauses)]
+        if cursor is not None:
+            try:
+                params.append(int(cursor))
+            except ValueError:
+                raise ValueError('Invalid cursor')
+            sql += ' AND search_fts.rowid < ?'
+        if date_from:
+            sql += ' AND d.date >= ?'
+            params.append(date_from)
+        if date_to:
+            sql += ' AND d.date <= ?'
+            params.append(date_to)
+        sql += ' ORDER BY search_fts.rowid DESC LIMIT ?'
+        params.append(limit + 1)
+
+        rows = self._connect().execute(sql, params).fetchall()
+        next_cursor = str(rows[limit - 1][0]) if len(rows) > limit else None
+        return [self._hit(row, terms, category) for row in rows[:limit]], next_cursor
+
+    def _hit(self, row, terms, category):
+        (_, receipt_id, store, date, total_cents, currency, uploaded_at, item_count,
+         items, categories, snippet) = row
+        wanted = fold(category) if category else None
+        matched = []
+        for name, item_category in zip(items.split('\n'), categories.split('\n')):
+            if wanted is not None and fold(item_category) != wanted:
+                continue
+            words = WORD_PATTERN.findall(fold(name))
+            if not terms or any(word.startswith(term) if prefix else word == term
+                                for term, prefix in terms for word in words):
+                matched.append({'name': name, 'category': item_category})
+        return {
+            'id': receipt_id,
+            'store': store,
+            'date': date,
+            'total': format_cents(total_cents),
+            'currency': currency,
+            'uploaded_at': uploaded_at,
+            'item_count': item_count,
+            'matched_items': matched,
+            'snippet': snippet
+        }
@@ -0,0 +1,1071 @@
+"""
+Storage backends for receipt persistence.
+
+Three backends are available, selected by name through create_storage():
+
+1. json   - The original single-document data/receipts.json file. Every
+            write rewrites the whole file, so it is only suitable for
+            small datasets.
+2. jsonl  - File-based append log. Each upload appends one JSON line to
+            data/receipts.jsonl; a background compactor periodically folds
+            the log into the receipts.json snapshot. Startup replays
+            snapshot + log.
+3. sqlite - An embedded SQLite database in WAL mode with indexes on id,
+            date and uploaded_at and one row per line item. Uploads are
+            single-row inserts and reads only touch the rows they need.
+
+On first start the SQLite backend imports an existing receipts.json file
+once and renames it to receipts.json.migrated.
+
+Raw OCR text is not part of receipt records; it lives in the separate
+OCRTextStore (services/ocr_store.py). Amounts are stored as integer cents
+(total_cents, price_cents); records written with string amounts are
+converted when they are read (see services/models.upgrade_record).
+Base-currency amounts added by services/fx_rates are ordinary record
+fields and are aggregated next to the original amounts.
+
+All backends are safe to use from several server processes at once:
+SQLite through its own transactions, the file-based backends through a
+FileLock held around every write (see services/file_lock.py).
+
+JSON is encoded with services/json_codec (orjson when installed) and
+written compact; the file-based backends can indent receipts.json for
+reading by hand.
+"""
+
+import os
+import sqlite3
+import threading
+
+from services import json_codec
+from services.aggregates import MonthlyAggregates
+from services.file_lock import FileLock
+from services.metrics import timer
+from services.models import format_cents, to_cents, upgrade_record
+from services.receipt_cache import ReceiptFileCache, ReceiptIndex
+
+
+# Columns stored directly on the receipts table. Any other receipt keys are
+# kept in the `extra` JSON column so new fields round-trip unchanged.
+# (ocr_text, total and price are only set on rows written before OCR text
+# moved to OCRTextStore and amounts became integer cents.)
+RECEIPT_COLUMNS = ('id', 'filename', 'uploaded_at', 'store', 'date', 'total', 'total_cents', 'currency',
+                   'ocr_text', 'content_hash')
+ITEM_COLUMNS = ('name', 'price', 'price_cents', 'category')
+
+# Fields returned by list endpoints (no items or OCR text)
+SUMMARY_FIELDS = ('id', 'store', 'date', 'total', 'currency', 'uploaded_at', 'item_count')
+
+
+def summarize_receipt(receipt):
+    """Build the simplified list representation of a receipt."""
+    return {
+        'id': receipt['id'],
+        'store': receipt['store'],
+        'date': receipt['date'],
+        'total': format_cents(receipt.get('total_cents', 0)),
+        'currency': receipt.get('currency', 'USD'),
+        'uploaded_at': receipt['uploaded_at'],
+        'item_count': len(receipt.get('items', []))
+    }
+
+
+def matches_filters(receipt, filters):
+    """
+    Check a receipt (or summary) against list filters.
+
+    Args:
+        receipt: Receipt or summary dict
+        filters: Dict with optional keys store, date_from, date_to (inclusive
+            ISO dates), currency, min_total and max_total (integer cents)
+
+    Returns:
+        bool: True if the receipt passes every filter
+    """
+    store = filters.get('store')
+    if store is not None and (receipt.get('store') or '').lower() != store.lower():
+        return False
+    if filters.get('currency') is not None and receipt.get('currency', 'USD') != filters['currency']:
+        return False
+
+    date = receipt.get('date') or ''
+    if filters.get('date_from') is not None and date < filters['date_from']:
+        return False
+    if filters.get('date_to') is not None and date > filters['date_to']:
+        return False
+
+    if filters.get('min_total') is not None or filters.get('max_total') is not None:
+        total = receipt.get('total_cents', 0)
+        if filters.get('min_total') is not None and total < filters['min_total']:
+            return False
+        if filters.get('max_total') is not None and total > filters['max_total']:
+            return False
+    return True
+
+
+def select_new(receipts, has_id, has_hash):
+    """
+    Drop receipts that are already stored, by id or by image content hash.
+
+    Of several receipts in the batch with the same id or content hash, the
+    first is kept.
+
+    Args:
+        receipts: Receipts about to be added
+        has_id: Function telling whether a receipt id is stored
+        has_hash: Function telling whether a content hash is stored
+
+    Returns:
+        list: The receipts to add
+    """
+    new, ids, hashes = [], set(), set()
+    for receipt in receipts:
+        content_hash = receipt.get('content_hash')
+        if receipt['id'] in ids or has_id(receipt['id']):
+            continue
+        if content_hash and (content_hash in hashes or has_hash(content_hash)):
+            continue
+        ids.add(receipt['id'])
+        if content_hash:
+            hashes.add(content_hash)
+        new.append(receipt)
+    return new
+
+
+def paginate(receipts, filters, limit, summarize=summarize_receipt):
+    """
+    Collect one page of summaries from receipts iterated newest first.
+
+    Returns:
+        tuple: (summaries, next_cursor) where next_cursor is the
+        (uploaded_at, id) key of the last summary when more results exist
+    """
+    page = []
+    for receipt in receipts:
+        if filters and not matches_filters(receipt, filters):
+            continue
+        if limit is not None and len(page) == limit:
+            last = page[-1]
+            return page, (last['uploaded_at'], last['id'])
+        page.append(summarize(receipt))
+    return page, None
+
+
+class ReceiptStorage:
+    """Base interface shared by all receipt storage backends."""
+
+    def add_receipt(self, receipt):
+        """Persist a single new receipt."""
+        raise NotImplementedError
+
+    def add_receipts(self, receipts):
+        """
+        Persist several new receipts in one write.
+
+        Receipts whose id is already stored are skipped, so re-running the
+        job that created a receipt is harmless, and so are receipts of an
+        image that is already stored (same content_hash), so concurrent
+        uploads of one image create one receipt.
+
+        Returns:
+            list: The receipts that were added
+        """
+        added = select_new(receipts, lambda receipt_id: self.get_receipt(receipt_id) is not None,
+                           lambda content_hash: self.find_by_hash(content_hash) is not None)
+        for receipt in added:
+            self.add_receipt(receipt)
+        return added
+
+    def update_receipts(self, receipts):
+        """Overwrite existing receipts (matched by id) in one write."""
+        updated = {r['id']: r for r in receipts}
+        self.replace_all([updated.get(r['id'], r) for r in self.load_all()])
+
+    def get_receipt(self, receipt_id):
+        """Return the full receipt dict for an id, or None."""
+        raise NotImplementedError
+
+    def find_by_hash(self, content_hash):
+        """Return the receipt whose image has this SHA-256 content hash, or None."""
+        raise NotImplementedError
+
+    def count(self):
+        """Return the number of stored receipts."""
+        return len(self.load_all())
+
+    def list_summaries(self):
+        """Return receipt summaries sorted by upload date, newest first."""
+        raise NotImplementedError
+
+    def query_summaries(self, filters=None, limit=None, cursor=None):
+        """
+        Return one filtered page of receipt summaries, newest first.
+
+        Args:
+            filters: Optional filter dict (see matches_filters)
+            limit: Maximum number of summaries (None for no limit)
+            cursor: Optional (uploaded_at, id) key; only older receipts are returned
+
+        Returns:
+            tuple: (summaries, next_cursor)
+        """
+        summaries = self.list_summaries()
+        if cursor is not None:
+            summaries = (s for s in summaries if (s['uploaded_at'], s['id']) < cursor)
+        return paginate(summaries, filters, limit, summarize=dict)
+
+    def month_rows(self, year, month):
+        """
+        Return materialized aggregate rows for one month.
+
+        Returns:
+            tuple: (totals, categories) as produced by MonthlyAggregates.month_rows
+        """
+        raise NotImplementedError
+
+    def converted_month_rows(self, year, month):
+        """
+        Return materialized base-currency aggregate rows for one month.
+
+        Returns:
+            tuple: (totals, categories) as produced by MonthlyAggregates.converted_rows
+        """
+        raise NotImplementedError
+
+    def rebuild_aggregates(self):
+        """Recompute the monthly aggregates from all stored receipts."""
+        raise NotImplementedError
+
+    def load_all(self):
+        """Return every stored receipt as a list of dicts."""
+        raise NotImplementedError
+
+    def replace_all(self, receipts):
+        """Replace the stored dataset with the given receipts."""
+        raise NotImplementedError
+
+    def receipts_with_ocr_text(self):
+        """Return stored receipts that still carry inline OCR text."""
+        return [r for r in self.load_all() if r.get('ocr_text') is not None]
+
+    def reclaim_space(self):
+        """Return disk space freed by large rewrites to the OS (no-op by default)."""
+
+    def cache_stats(self):
+        """Return in-process cache counters, or None if the backend has no cache."""
+        return None
+
+
+class JSONFileStorage(ReceiptStorage):
+    """
+    Stores all receipts in one JSON document (original MVP layout).
+
+    Reads are served from a shared in-process cache that is reloaded only
+    when the file changes on disk. Writes hold a cross-process lock
+    (receipts.json.lock) and re-read the file first, so concurrent writers
+    in other processes are never overwritten, and replace the file
+    atomically, so readers never see a partial document.
+    """
+
+    def __init__(self, path, indent=False):
+        """
+        Initialize JSON file storage.
+
+        Args:
+            path: Path to the receipts JSON file
+            indent: Write the file indented instead of compact
+        """
+        self.path = path
+        self.indent = indent
+        self._lock = FileLock(path + '.lock')
+        self._upgraded = False
+        self._cache = ReceiptFileCache(path, self._read_file)
+
+        # Persist records converted from string amounts once
+        with self._lock:
+            receipts = self.load_all()
+            if self._upgraded:
+                self.replace_all(receipts)
+
+    def _read_file(self):
+        if not os.path.exists(self.path):
+            return []
+        with timer('json_file_load'), open(self.path, 'rb') as f:
+            stored = json_codec.loads(f.read())
+        receipts = [upgrade_record(receipt) for receipt in stored]
+        self._upgraded = self._upgraded or any(a is not b for a, b in zip(receipts, stored))
+        return receipts
+
+    def _write_file(self, receipts):
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with timer('json_file_save'), open(tmp_path, 'wb') as f:
+            f.write(json_codec.encode(receipts, indent=self.indent))
+        os.replace(tmp_path, self.path)
+
+    def load_all(self):
+        return self._cache.index().values()
+
+    def replace_all(self, receipts):
+        with self._lock:
+            self._write_file(receipts)
+            self._cache.replace(ReceiptIndex(receipts))
+
+    def add_receipt(self, receipt):
+        self.add_receipts([receipt])
+
+    def add_receipts(self, receipts):
+        with self._lock:
+            # load_all() picks up writes made by other processes
+            stored = self.load_all()
+            index = self._cache.index()
+            added = select_new(receipts, lambda receipt_id: index.get(receipt_id) is not None,
+                               lambda content_hash: index.find_by_hash(content_hash) is not None)
+            if added:
+                stored.extend(added)
+                self._write_file(stored)
+                for receipt in added:
+                    self._cache.add(receipt)
+            return added
+
+    def update_receipts(self, receipts):
+        with self._lock:
+            super().update_receipts(receipts)
+
+    def get_receipt(self, receipt_id):
+        return self._cache.index().get(receipt_id)
+
+    def find_by_hash(self, content_hash):
+        return self._cache.index().find_by_hash(content_hash)
+
+    def count(self):
+        return len(self._cache.index())
+
+    def list_summaries(self):
+        return [summarize_receipt(r) for r in self._cache.index().newest_first()]
+
+    def query_summaries(self, filters=None, limit=None, cursor=None):
+        return paginate(self._cache.index().iter_newest(before=cursor), filters, limit)
+
+    def month_rows(self, year, month):
+        return self._cache.index().aggregates.month_rows(year, month)
+
+    def converted_month_rows(self, year, month):
+        return self._cache.index().aggregates.converted_rows(year, month)
+
+    def rebuild_aggregates(self):
+        self._cache.index().rebuild_aggregates()
+
+    def cache_stats(self):
+        return self._cache.stats()
+
+
+class JSONLogStorage(ReceiptStorage):
+    """
+    Append-only JSON-Lines log with periodic compaction into a snapshot.
+
+    Writes append one line per receipt and are fsynced in batches, so upload
+    cost does not depend on dataset size. The full dataset is kept in memory
+    and rebuilt at startup from the snapshot plus the log. Replay is
+    idempotent (later records win by id), so a crash at any point during
+    compaction loses nothing.
+
+    Several processes may share the files: appends and compaction hold a
+    cross-process lock (receipts.jsonl.lock), and each process applies
+    lines appended by others before it reads or writes. Compaction swaps
+    in a new, empty log file, which tells other processes to reload from
+    the new snapshot.
+    """
+
+    def __init__(self, snapshot_path, log_path, fsync_batch=32, fsync_interval=0.05,
+                 compact_threshold=1000, compact_interval=60, indent=False):
+        """
+        Initialize append log storage.
+
+        Args:
+            snapshot_path: Path of the compacted JSON snapshot (receipts.json)
+            log_path: Path of the JSON-Lines append log
+            fsync_batch: Appends after which the log is fsynced inline
+            fsync_interval: Seconds between background fsyncs of pending appends
+            compact_threshold: Log records that trigger background compaction
+            compact_interval: Seconds between compaction checks
+            indent: Write the snapshot indented instead of compact
+        """
+        self.snapshot_path = snapshot_path
+        self.log_path = log_path
+        self.indent = indent
+        self.fsync_batch = fsync_batch
+        self.compact_threshold = compact_threshold
+
+        self._lock = FileLock(log_path + '.lock')
+        self._pending_sync = 0
+        self._log = None
+
+        with self._lock:
+            self._upgraded = False
+            self._recover()
+            if self._upgraded:
+                # Persist records converted from string amounts once
+                self.compact()
+
+        self._stop = threading.Event()
+        self._start_worker(self._sync_loop, fsync_interval)
+        self._start_worker(self._compact_loop, compact_interval)
+
+    def _start_worker(self, target, interval):
+        thread = threading.Thread(target=target, args=(interval,), daemon=True)
+        thread.start()
+
+    def _recover(self):
+        """Rebuild in-memory state from the snapshot and replay the log (caller holds the lock)."""
+        self._receipts = ReceiptIndex()
+        self._log_records = 0
+        self._log_offset = 0
+
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, 'rb') as f:
+                for stored in json_codec.loads(f.read()):
+                    self._add_recovered(stored)
+
+        if self._log is not None:
+            self._log.close()
+        self._log = open(self.log_path, 'ab')
+        self._log_inode = os.fstat(self._log.fileno()).st_ino
+        self._replay_log()
+
+    def _replay_log(self):
+        """Apply log lines after the current offset (caller holds the lock)."""
+        with open(self.log_path, 'rb') as f:
+            f.seek(self._log_offset)
+            for line in f:
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError('incomplete line')
+                    stored = json_codec.loads(line)
+                except ValueError:
+                    # Torn final line from a crash mid-append. Appends are
+                    # complete lines written under the lock, so no other
+                    # process can still be writing it
+                    print(f"[Storage] Dropping unreadable log tail in {self.log_path}")
+                    break
+                self._add_recovered(stored)
+                self._log_records += 1
+                self._log_offset += len(line)
+
+        # Cut off the torn tail so new appends start on a clean line
+        if self._log_offset != os.path.getsize(self.log_path):
+            os.truncate(self.log_path, self._log_offset)
+
+    def _add_recovered(self, stored):
+        """Index a recovered record, converting string amounts to cents."""
+        receipt = upgrade_record(stored)
+        self._upgraded = self._upgraded or receipt is not stored
+        self._receipts.add(receipt)
+
+    def _log_state(self):
+        """Return the (inode, size) of the log file on disk, or None."""
+        try:
+            st = os.stat(self.log_path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_size)
+
+    def _catch_up(self):
+        """Apply changes made by other processes (caller holds the lock)."""
+        state = self._log_state()
+        if state == (self._log_inode, self._log_offset):
+            return
+        if state is None or state[0] != self._log_inode or state[1] < self._log_offset:
+            # Another process compacted: reload from its snapshot
+            self._sync()
+            self._recover()
+        else:
+            self._replay_log()
+
+    def _refresh(self):
+        """Catch up with other processes before a read, if the log changed."""
+        if self._log_state() != (self._log_inode, self._log_offset):
+            with self._lock:
+                self._catch_up()
+
+    def _sync(self):
+        """Flush and fsync pending appends (caller holds the lock)."""
+        if self._pending_sync:
+            self._log.flush()
+            os.fsync(self._log.fileno())
+            self._pending_sync = 0
+
+    def _sync_loop(self, interval):
+        while not self._stop.wait(interval):
+            if self._pending_sync:
+                with self._lock:
+                    self._sync()
+
+    def _compact_loop(self, interval):
+        while not self._stop.wait(interval):
+            self._refresh()
+            if self._log_records >= self.compact_threshold:
+                self.compact()
+
+    def _write_snapshot(self, receipts):
+        """Atomically write the snapshot via a temp file and rename."""
+        tmp_path = self.snapshot_path + '.tmp'
+        with timer('json_snapshot_save'), open(tmp_path, 'wb') as f:
+            f.write(json_codec.encode(receipts, indent=self.indent))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+    def _start_new_log(self):
+        """Swap in an empty log file (caller holds the lock)."""
+        tmp_path = self.log_path + '.tmp'
+        open(tmp_path, 'wb').close()
+        os.replace(tmp_path, self.log_path)
+        self._log.close()
+        self._log = open(self.log_path, 'ab')
+        self._log_inode = os.fstat(self._log.fileno()).st_ino
+        self._log_offset = 0
+        self._log_records = 0
+        self._pending_sync = 0
+
+    def compact(self):
+        """Fold the log into a new snapshot and start an empty log."""
+        with self._lock:
+            self._catch_up()
+            self._sync()
+            self._write_snapshot(self._receipts.values())
+            self._start_new_log()
+
+    def close(self):
+        """Stop background workers and flush the log."""
+        self._stop.set()
+        with self._lock:
+            self._sync()
+            self._log.close()
+
+    def add_receipt(self, receipt):
+        self.add_receipts([receipt])
+
+    def add_receipts(self, receipts):
+        with self._lock:
+            self._catch_up()
+            added = select_new(receipts, lambda receipt_id: self._receipts.get(receipt_id) is not None,
+                               lambda content_hash: self._receipts.find_by_hash(content_hash) is not None)
+            if not added:
+                return added
+            data = b''.join(json_codec.encode(receipt) + b'\n' for receipt in added)
+            self._log.write(data)
+            self._log.flush()
+            self._log_offset += len(data)
+            for receipt in added:
+                self._receipts.add(receipt)
+            self._log_records += len(added)
+            self._pending_sync += len(added)
+            if self._pending_sync >= self.fsync_batch:
+                self._sync()
+            return added
+
+    def update_receipts(self, receipts):
+        with self._lock:
+            self._catch_up()
+            super().update_receipts(receipts)
+
+    def get_receipt(self, receipt_id):
+        self._refresh()
+        return self._receipts.get(receipt_id)
+
+    def find_by_hash(self, content_hash):
+        self._refresh()
+        return self._receipts.find_by_hash(content_hash)
+
+    def count(self):
+        self._refresh()
+        return len(self._receipts)
+
+    def list_summaries(self):
+        self._refresh()
+        return [summarize_receipt(r) for r in self._receipts.newest_first()]
+
+    def query_summaries(self, filters=None, limit=None, cursor=None):
+        self._refresh()
+        return paginate(self._receipts.iter_newest(before=cursor), filters, limit)
+
+    def month_rows(self, year, month):
+        self._refresh()
+        return self._receipts.aggregates.month_rows(year, month)
+
+    def converted_month_rows(self, year, month):
+        self._refresh()
+        return self._receipts.aggregates.converted_rows(year, month)
+
+    def rebuild_aggregates(self):
+        with self._lock:
+            self._catch_up()
+            self._receipts.rebuild_aggregates()
+
+    def load_all(self):
+        self._refresh()
+        return self._receipts.values()
+
+    def replace_all(self, receipts):
+        with self._lock:
+            self._sync()
+            self._receipts = ReceiptIndex(receipts)
+            self._write_snapshot(receipts)
+            self._start_new_log()
+
+
+class SQLiteStorage(ReceiptStorage):
+    """Stores receipts in an indexed SQLite database running in WAL mode."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS receipts (
+            id TEXT PRIMARY KEY,
+            filename TEXT,
+            uploaded_at TEXT NOT NULL,
+            store TEXT,
+            date TEXT,
+            total_cents INTEGER NOT NULL DEFAULT 0,
+            currency TEXT,
+            ocr_text TEXT,
+            item_count INTEGER NOT NULL DEFAULT 0,
+            extra TEXT,
+            content_hash TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_receipts_date ON receipts (date);
+        CREATE INDEX IF NOT EXISTS idx_receipts_uploaded_at ON receipts (uploaded_at, id);
+
+        CREATE TABLE IF NOT EXISTS items (
+            receipt_id TEXT NOT NULL REFERENCES receipts (id) ON DELETE CASCADE,
+            position INTEGER NOT NULL,
+            name TEXT,
+            price_cents INTEGER NOT NULL DEFAULT 0,
+            category TEXT,
+            extra TEXT,
+            PRIMARY KEY (receipt_id, position)
+        );
+
+        CREATE TABLE IF NOT EXISTS month_totals (
+            year INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            currency TEXT NOT NULL,
+            receipt_count INTEGER NOT NULL,
+            total_cents INTEGER NOT NULL,
+            PRIMARY KEY (year, month, currency)
+        );
+
+        CREATE TABLE IF NOT EXISTS month_categories (
+            year INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            currency TEXT NOT NULL,
+            category TEXT NOT NULL,
+            amount_cents INTEGER NOT NULL,
+            PRIMARY KEY (year, month, currency, category)
+        );
+
+        -- Same shape as month_totals/month_categories, for amounts
+        -- converted to the base currency (currency is the base currency)
+        CREATE TABLE IF NOT EXISTS month_converted_totals (
+            year INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            currency TEXT NOT NULL,
+            receipt_count INTEGER NOT NULL,
+            total_cents INTEGER NOT NULL,
+            PRIMARY KEY (year, month, currency)
+        );
+
+        CREATE TABLE IF NOT EXISTS month_converted_categories (
+            year INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            currency TEXT NOT NULL,
+            category TEXT NOT NULL,
+            amount_cents INTEGER NOT NULL,
+            PRIMARY KEY (year, month, currency, category)
+        );
+    """
+
+    def __init__(self, path, migrate_from=None):
+        """
+        Initialize SQLite storage.
+
+        Args:
+            path: Path to the SQLite database file
+            migrate_from: Optional receipts.json path imported once on first start
+        """
+        self.path = path
+        self._local = threading.local()
+
+        conn = self._connect()
+        with conn:
+            self._upgrade_schema(conn)
+            conn.executescript(self.SCHEMA)
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_receipts_content_hash ON receipts (content_hash)')
+
+        if migrate_from:
+            self._migrate_json(migrate_from)
+
+        # Backfill aggregates for databases created before they existed
+        has_receipts = conn.execute('SELECT 1 FROM receipts LIMIT 1').fetchone()
+        has_totals = conn.execute('SELECT 1 FROM month_totals LIMIT 1').fetchone()
+        if has_receipts and not has_totals:
+            self.rebuild_aggregates()
+
+    def _upgrade_schema(self, conn):
+        """Add columns introduced after a database was created."""
+        columns = {row['name'] for row in conn.execute('PRAGMA table_info(receipts)')}
+        if columns and 'content_hash' not in columns:
+            conn.execute('ALTER TABLE receipts ADD COLUMN content_hash TEXT')
+
+        # Convert string amounts to integer cents (the old TEXT columns stay, unused)
+        if columns and 'total_cents' not in columns:
+            conn.execute('ALTER TABLE receipts ADD COLUMN total_cents INTEGER NOT NULL DEFAULT 0')
+            conn.executemany(
+                'UPDATE receipts SET total_cents = ?, total = NULL WHERE id = ?',
+                [(to_cents(total), receipt_id) for receipt_id, total in
+                 conn.execute('SELECT id, total FROM receipts WHERE total IS NOT NULL').fetchall()]
+            )
+            conn.execute('ALTER TABLE items ADD COLUMN price_cents INTEGER NOT NULL DEFAULT 0')
+            conn.executemany(
+                'UPDATE items SET price_cents = ?, price = NULL WHERE rowid = ?',
+                [(to_cents(price), rowid) for rowid, price in
+                 conn.execute('SELECT rowid, price FROM items WHERE price IS NOT NULL').fetchall()]
+            )
+
+    def _connect(self):
+        """Return the calling thread's connection, opening it on first use."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA foreign_keys=ON')
+            self._local.conn = conn
+        return conn
+
+    def _migrate_json(self, json_path):
+        """Import a legacy receipts.json file once, then rename it."""
+        if not os.path.exists(json_path):
+            return
+
+        receipts = JSONFileStorage(json_path).load_all()
+        conn = self._connect()
+        with conn:
+            self._insert_many(conn, receipts, replace=True)
+        os.replace(json_path, json_path + '.migrated')
+        print(f"[Storage] Migrated {len(receipts)} receipts from {json_path}")
+
+    def _insert_many(self, conn, receipts, replace=False):
+        """Insert receipts and their item rows inside the caller's transaction."""
+        verb = 'INSERT OR REPLACE' if replace else 'INSERT'
+        receipt_rows = []
+        item_rows = []
+
+        receipts = [upgrade_record(receipt) for receipt in receipts]
+        for receipt in receipts:
+            items = receipt.get('items', [])
+            extra = {k: v for k, v in receipt.items() if k not in RECEIPT_COLUMNS and k != 'items'}
+            receipt_rows.append((
+                receipt['id'],
+                receipt.get('filename'),
+                receipt['uploaded_at'],
+                receipt.get('store'),
+                receipt.get('date'),
+                receipt.get('total_cents', 0),
+                receipt.get('currency', 'USD'),
+                receipt.get('ocr_text'),
+                len(items),
+                json_codec.dumps(extra) if extra else None,
+                receipt.get('content_hash')
+            ))
+            for position, item in enumerate(items):
+                item_extra = {k: v for k, v in item.items() if k not in ITEM_COLUMNS}
+                item_rows.append((
+                    receipt['id'],
+                    position,
+                    item.get('name'),
+                    item.get('price_cents', 0),
+                    item.get('category'),
+                    json_codec.dumps(item_extra) if item_extra else None
+                ))
+
+        deltas = MonthlyAggregates(receipts)
+        if replace:
+            # Subtract receipts being overwritten before their rows go away
+            ids = [r[0] for r in receipt_rows]
+            for previous in self._fetch_receipts_by_id(conn, ids):
+                deltas.remove(previous)
+            conn.executemany('DELETE FROM items WHERE receipt_id = ?', [(i,) for i in ids])
+        conn.executemany(
+            f'{verb} INTO receipts (id, filename, uploaded_at, store, date, total_cents, currency, '
+            f'ocr_text, item_count, extra, content_hash) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            receipt_rows
+        )
+        conn.executemany(
+            'INSERT INTO items (receipt_id, position, name, price_cents, category, extra) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            item_rows
+        )
+        self._apply_aggregates(conn, deltas)
+
+    def _apply_aggregates(self, conn, deltas):
+        """Add aggregate deltas to the materialized month tables."""
+        for totals_key, categories_key, table in (('totals', 'categories', 'month'),
+                                                  ('converted', 'converted_categories', 'month_converted')):
+            total_rows = []
+            category_rows = []
+            for (year, month), bucket in deltas.months.items():
+                for currency, (count, cents) in bucket[totals_key].items():
+                    total_rows.append((year, month, currency, count, cents))
+                for (currency, category), cents in bucket[categories_key].items():
+                    category_rows.append((year, month, currency, category, cents))
+
+            conn.executemany(
+                f'INSERT INTO {table}_totals (year, month, currency, receipt_count, total_cents) '
+                'VALUES (?, ?, ?, ?, ?) ON CONFLICT (year, month, currency) DO UPDATE SET '
+                'receipt_count = receipt_count + excluded.receipt_count, '
+                'total_cents = total_cents + excluded.total_cents',
+                total_rows
+            )
+            conn.executemany(
+                f'INSERT INTO {table}_categories (year, month, currency, category, amount_cents) '
+                'VALUES (?, ?, ?, ?, ?) ON CONFLICT (year, month, currency, category) DO UPDATE SET '
+                'amount_cents = amount_cents + excluded.amount_cents',
+                category_rows
+            )
+
+    def _load_items(self, conn, receipt_ids):
+        """Fetch item rows for the given receipts, grouped by receipt id."""
+        items = {receipt_id: [] for receipt_id in receipt_ids}
+        if not receipt_ids:
+            return items
+
+        # Stay below SQLite's bound-parameter limit
+        ids = list(receipt_ids)
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            rows = conn.execute(
+                f'SELECT receipt_id, name, price_cents, category, extra FROM items '
+                f'WHERE receipt_id IN ({placeholders}) ORDER BY receipt_id, position',
+                chunk
+            )
+            for row in rows:
+                item = {'name': row['name'], 'price_cents': row['price_cents'], 'category': row['category']}
+                if row['extra']:
+                    item.update(json_codec.loads(row['extra']))
+                items[row['receipt_id']].append(item)
+        return items
+
+    def _row_to_receipt(self, row, items):
+        """Rebuild a receipt dict from a receipts row and its items."""
+        receipt = {
+            'id': row['id'],
+            'filename': row['filename'],
+            'uploaded_at': row['uploaded_at'],
+            'store': row['store'],
+            'date': row['date'],
+            'items': items,
+            'total_cents': row['total_cents'],
+            'currency': row['currency']
+        }
+        if row['ocr_text'] is not None:
+            receipt['ocr_text'] = row['ocr_text']
+        if row['content_hash']:
+            receipt['content_hash'] = row['content_hash']
+        if row['extra']:
+            receipt.update(json_codec.loads(row['extra']))
+        return receipt
+
+    def _row_to_summary(self, row):
+        """Build a list summary from a receipts row (same key order as summarize_receipt)."""
+        return {
+            'id': row['id'],
+            'store': row['store'],
+            'date': row['date'],
+            'total': format_cents(row['total_cents']),
+            'currency': row['currency'],
+            'uploaded_at': row['uploaded_at'],
+            'item_count': row['item_count']
+        }
+
+    def _fetch_receipts(self, where='', params=(), order='uploaded_at, id'):
+        """Load full receipts matching a WHERE clause."""
+        conn = self._connect()
+        rows = conn.execute(f'SELECT * FROM receipts {where} ORDER BY {order}', params).fetchall()
+        items = self._load_items(conn, [row['id'] for row in rows])
+        return [self._row_to_receipt(row, items[row['id']]) for row in rows]
+
+    def _fetch_receipts_by_id(self, conn, receipt_ids):
+        """Load full receipts for a list of ids (missing ids are skipped)."""
+        rows = []
+        for start in range(0, len(receipt_ids), 500):
+            chunk = receipt_ids[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            rows.extend(conn.execute(f'SELECT * FROM receipts WHERE id IN ({placeholders})', chunk))
+        items = self._load_items(conn, [row['id'] for row in rows])
+        return [self._row_to_receipt(row, items[row['id']]) for row in rows]
+
+    def _stored_values(self, conn, column, values):
+        """Return the subset of values already present in an indexed receipts column."""
+        stored = set()
+        for start in range(0, len(values), 500):
+            chunk = values[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            stored.update(row[0] for row in conn.execute(
+                f'SELECT {column} FROM receipts WHERE {column} IN ({placeholders})', chunk))
+        return stored
+
+    def add_receipt(self, receipt):
+        self.add_receipts([receipt])
+
+    def add_receipts(self, receipts):
+        conn = self._connect()
+        with conn:
+            # Take the write lock before checking for stored ids and hashes,
+            # so a concurrent writer cannot insert one in between
+            conn.execute('BEGIN IMMEDIATE')
+            ids = self._stored_values(conn, 'id', [r['id'] for r in receipts])
+            hashes = self._stored_values(conn, 'content_hash',
+                                         [r['content_hash'] for r in receipts if r.get('content_hash')])
+            added = select_new(receipts, ids.__contains__, hashes.__contains__)
+            self._insert_many(conn, added)
+        return added
+
+    def update_receipts(self, receipts):
+        conn = self._connect()
+        with conn:
+            # Take the write lock before reading the rows being replaced, so
+            # their aggregate deltas cannot be stale
+            conn.execute('BEGIN IMMEDIATE')
+            self._insert_many(conn, receipts, replace=True)
+
+    def get_receipt(self, receipt_id):
+        receipts = self._fetch_receipts('WHERE id = ?', (receipt_id,))
+        return receipts[0] if receipts else None
+
+    def find_by_hash(self, content_hash):
+        receipts = self._fetch_receipts('WHERE content_hash = ?', (content_hash,))
+        return receipts[0] if receipts else None
+
+    def count(self):
+        return self._connect().execute('SELECT COUNT(*) FROM receipts').fetchone()[0]
+
+    def list_summaries(self):
+        rows = self._connect().execute(
+            'SELECT id, store, date, total_cents, currency, uploaded_at, item_count '
+            'FROM receipts ORDER BY uploaded_at DESC, id DESC'
+        )
+        return [self._row_to_summary(row) for row in rows]
+
+    def query_summaries(self, filters=None, limit=None, cursor=None):
+        # Keyset pagination on the (uploaded_at, id) index; filters are pushed
+        # into SQL so date ranges can use the date index
+        filters = filters or {}
+        clauses = []
+        params = []
+        if cursor is not None:
+            clauses.append('(uploaded_at, id) < (?, ?)')
+            params.extend(cursor)
+        if filters.get('store') is not None:
+            clauses.append('store = ? COLLATE NOCASE')
+            params.append(filters['store'])
+        if filters.get('currency') is not None:
+            clauses.append('currency = ?')
+            params.append(filters['currency'])
+        if filters.get('date_from') is not None:
+            clauses.append('date >= ?')
+            params.append(filters['date_from'])
+        if filters.get('date_to') is not None:
+            clauses.append('date <= ?')
+            params.append(filters['date_to'])
+        if filters.get('min_total') is not None:
+            clauses.append('total_cents >= ?')
+            params.append(filters['min_total'])
+        if filters.get('max_total') is not None:
+            clauses.append('total_cents <= ?')
+            params.append(filters['max_total'])
+
+        where = ('WHERE ' + ' AND '.join(clauses)) if clauses else ''
+        sql = (
+            'SELECT id, store, date, total_cents, currency, uploaded_at, item_count '
+            f'FROM receipts {where} ORDER BY uploaded_at DESC, id DESC'
+        )
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit + 1)
+
+        page = [self._row_to_summary(row) for row in self._connect().execute(sql, params)]
+        if limit is not None and len(page) > limit:
+            page = page[:limit]
+            return page, (page[-1]['uploaded_at'], page[-1]['id'])
+        return page, None
+
+    def month_rows(self, year, month):
+        return self._month_rows('month', year, month)
+
+    def converted_month_rows(self, year, month):
+        return self._month_rows('month_converted', year, month)
+
+    def _month_rows(self, table, year, month):
+        conn = self._connect()
+        totals = conn.execute(
+            f'SELECT currency, receipt_count, total_cents FROM {table}_totals '
+            'WHERE year = ? AND month = ? AND receipt_count != 0',
+            (year, month)
+        ).fetchall()
+        categories = conn.execute(
+            f'SELECT currency, category, amount_cents FROM {table}_categories WHERE year = ? AND month = ?',
+            (year, month)
+        ).fetchall()
+        return [tuple(r) for r in totals], [tuple(r) for r in categories]
+
+    def rebuild_aggregates(self):
+        conn = self._connect()
+        with conn:
+            for table in ('month_totals', 'month_categories',
+                          'month_converted_totals', 'month_converted_categories'):
+                conn.execute(f'DELETE FROM {table}')
+            self._apply_aggregates(conn, MonthlyAggregates(self._fetch_receipts()))
+
+    def receipts_with_ocr_text(self):
+        return self._fetch_receipts('WHERE ocr_text IS NOT NULL')
+
+    def reclaim_space(self):
+        self._connect().execute('VACUUM')
+
+    def load_all(self):
+        return self._fetch_receipts()
+
+    def replace_all(self, receipts):
+        conn = self._connect()
+        with conn:
+            conn.execute('DELETE FROM items')
+            conn.execute('DELETE FROM receipts')
+            for table in ('month_totals', 'month_categories',
+                          'month_converted_totals', 'month_converted_categories'):
+                conn.execute(f'DELETE FROM {table}')
+            self._insert_many(conn, receipts)
+
+
+def create_storage(backend, json_path, db_path, log_path=None, indent=False):
+    """
+    Create a storage backend by name.
+
+    Args:
+        backend: 'json', 'jsonl' or 'sqlite'
+        json_path: Path of the receipts.json document (snapshot for 'jsonl')
+        db_path: Path of the SQLite database file
+        log_path: Path of the JSON-Lines append log (defaults next to json_path)
+        indent: Indent receipts.json ('json' and 'jsonl')
+
+    Returns:
+        ReceiptStorage instance
+    """
+    if backend == 'json':
+        return JSONFileStorage(json_path, indent=indent)
+    if backend == 'jsonl':
+        return JSONLogStorage(json_path, log_path or os.path.splitext(json_path)[0] + '.jsonl',
+                              indent=indent)
+    if backend == 'sqlite':
+        return SQLiteStorage(db_path, migrate_from=json_path)
+    raise ValueError(f"Unknown storage backend: {backend}")
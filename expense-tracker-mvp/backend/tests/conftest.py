@@ -0,0 +1,29 @@
+"""
+Shared fixtures.
+
+app.py creates its services at import time with paths relative to the
+working directory (data/, uploads/), so the app is imported once per test
+session from a scratch directory.
+"""
+
+import os
+
+import pytest
+
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    """The app module, with all data files in a temporary directory."""
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp('app'))
+    try:
+        import app
+        yield app
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.fixture
+def client(app_module):
+    """Flask test client of the app."""
+    return app_module.app.test_client()
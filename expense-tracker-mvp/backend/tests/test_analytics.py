@@ -0,0 +1,36 @@
+from services.analytics import AnalyticsSnapshot
+from services.storage import SQLiteStorage
+
+
+def make_receipt(number, date='2024-03-05', store='Fresh Mart'):
+    return {'id': f'r{number}', 'uploaded_at': f'2024-03-05T10:00:{number:02d}', 'store': store,
+            'date': date, 'currency': 'USD', 'total_cents': 100 * number,
+            'items': [{'name': 'Milk', 'price_cents': 100 * number, 'category': 'groceries'}]}
+
+
+def test_snapshot_missing_receipts_is_rebuilt(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / 'receipts.db'))
+    analytics = AnalyticsSnapshot(str(tmp_path / 'analytics'))
+    assert not analytics.is_current(storage.count())
+
+    storage.add_receipts([make_receipt(1), make_receipt(2)])
+    analytics.rebuild(storage.load_all())
+    assert analytics.is_current(storage.count())
+
+    # Crash after the storage write, before the analytics append
+    storage.add_receipts([make_receipt(3)])
+    reopened = AnalyticsSnapshot(str(tmp_path / 'analytics'))
+    assert not reopened.is_current(storage.count())
+
+    reopened.rebuild(storage.load_all())
+    assert reopened.is_current(storage.count())
+    assert reopened.spend_by_store(currency='USD') == [
+        {'store': 'Fresh Mart', 'total': 6.0, 'receipt_count': 3}]
+
+
+def test_receipts_with_invalid_dates_count_as_ingested(tmp_path):
+    analytics = AnalyticsSnapshot(str(tmp_path / 'analytics'))
+    analytics.rebuild([make_receipt(1)])
+    analytics.append([make_receipt(2, date='not a date')])
+    assert analytics.stats()['receipts'] == 1
+    assert analytics.is_current(2)
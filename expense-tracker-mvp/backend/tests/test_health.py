@@ -0,0 +1,4 @@
+def test_health_reports_jobs_per_status(app_module, client):
+    before = client.get('/health').get_json()['jobs'].get('queued', 0)
+    app_module.job_queue.enqueue('upload', {})
+    assert client.get('/health').get_json()['jobs']['queued'] == before + 1
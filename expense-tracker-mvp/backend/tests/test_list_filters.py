@@ -0,0 +1,29 @@
+import pytest
+
+
+@pytest.mark.parametrize('query', [
+    'min_total=inf',
+    'max_total=nan',
+    'min_total=abc',
+    'min_total=1e999999999',
+    'min_total=1e30',
+    'max_total=-1e25',
+])
+def test_invalid_amount_filters_are_rejected(client, query):
+    response = client.get(f'/receipts?{query}')
+    assert response.status_code == 400
+    assert 'must be a finite number' in response.get_json()['error']
+
+
+def test_largest_amount_filter_is_accepted(client):
+    response = client.get('/receipts?limit=10&min_total=92233720368547758.07&max_total=-92233720368547758.07')
+    assert response.status_code == 200
+    assert response.get_json()['receipts'] == []
+
+
+def test_parse_list_filters_uses_cents(app_module):
+    filters = app_module.parse_list_filters({'min_total': '4.99', 'max_total': '10'})
+    assert filters == {'min_total': 499, 'max_total': 1000}
+
+    with pytest.raises(ValueError):
+        app_module.parse_list_filters({'min_total': '1e30'})
@@ -0,0 +1,65 @@
+import pytest
+
+from services.ai_parser import AIParser
+from services.llm_parser import LLMParser, to_parsed_receipt
+from services.mock_llm import MockLLMServer
+
+
+OCR_TEXT = """FRESH MART
+Date: 2024-03-05
+Milk 2.49
+Bread 3.10
+TOTAL 5.59
+"""
+
+
+def receipt_data(**overrides):
+    data = {'store': 'Fresh Mart', 'date': '2024-03-05', 'currency': 'USD', 'total': '5.59',
+            'items': [{'name': 'Milk', 'price': '2.49', 'category': 'groceries'}]}
+    data.update(overrides)
+    return data
+
+
+def test_to_parsed_receipt():
+    parsed = to_parsed_receipt(receipt_data())
+    assert parsed.total_cents == 559
+    assert parsed.items[0].price_cents == 249
+
+
+@pytest.mark.parametrize('total', ['NaN', 'Infinity', 'abc', '1e999999999'])
+def test_to_parsed_receipt_rejects_bad_total(total):
+    with pytest.raises(ValueError):
+        to_parsed_receipt(receipt_data(total=total))
+
+
+def test_to_parsed_receipt_rejects_bad_price():
+    with pytest.raises(ValueError):
+        to_parsed_receipt(receipt_data(items=[{'name': 'Milk', 'price': 'NaN'}]))
+
+
+class BadTotalServer(MockLLMServer):
+    """Mock API whose receipts carry a given malformed total."""
+
+    def __init__(self, total):
+        super().__init__(latency=0, per_receipt_latency=0)
+        self.total = total
+
+    def _receipt_json(self, parsed):
+        return {**super()._receipt_json(parsed), 'total': self.total}
+
+
+@pytest.mark.parametrize('total', ['NaN', 'abc'])
+def test_malformed_amount_falls_back_to_rules(total):
+    server = BadTotalServer(total)
+    url = server.start()
+    rules = AIParser()
+    parser = LLMParser(url, 'test-model', rules, timeout=5, batch_wait=0)
+    try:
+        parsed, version = parser.parse_receipt_versioned(OCR_TEXT)
+    finally:
+        server.stop()
+
+    assert version == rules.version
+    assert parsed == rules.parse_receipt(OCR_TEXT)
+    assert parsed.total_cents == 559
+    assert parser.stats()['fallback'] == 1
@@ -0,0 +1,26 @@
+import pytest
+
+from services.models import MAX_CENTS, parse_cents, to_cents
+
+
+@pytest.mark.parametrize('value, cents', [
+    ('4.99', 499),
+    ('4,99', 499),
+    (12, 1200),
+    ('-0.5', -50),
+    ('92233720368547758.07', MAX_CENTS),
+])
+def test_parse_cents(value, cents):
+    assert parse_cents(value) == cents
+    assert to_cents(value) == cents
+
+
+@pytest.mark.parametrize('value', [
+    'abc', '', None, 'NaN', 'sNaN', 'Infinity', '-inf',
+    '1e999999999',  # decimal.Overflow when scaled to cents
+    '1e30', '-1e25', '92233720368547758.08',  # Beyond 64-bit cents
+])
+def test_invalid_amounts(value):
+    with pytest.raises(ValueError):
+        parse_cents(value)
+    assert to_cents(value) == 0
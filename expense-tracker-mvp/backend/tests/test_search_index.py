@@ -0,0 +1,53 @@
+from services.search_index import SearchIndex, upload_doc_id
+
+
+def make_receipt(number, uploaded_at):
+    return {'id': f'r{number}', 'uploaded_at': uploaded_at, 'store': 'Fresh Mart',
+            'date': '2024-03-05', 'currency': 'USD', 'total_cents': 100,
+            'items': [{'name': 'Organic Milk', 'price_cents': 100, 'category': 'groceries'}]}
+
+
+def test_upload_doc_id_follows_upload_time():
+    assert upload_doc_id('2024-03-05T10:00:01') < upload_doc_id('2024-03-05T10:00:01.000001')
+    assert upload_doc_id('2024-03-05T10:00:01.000001') < upload_doc_id('2024-03-05T10:00:02')
+    assert upload_doc_id('not a timestamp') is None
+
+
+def test_hits_come_newest_upload_first(tmp_path):
+    index = SearchIndex(str(tmp_path / 'search.db'))
+    # Indexed out of upload order, as when a slow background job finishes late
+    index.add([make_receipt(1, '2024-03-05T10:00:03')], [])
+    index.add([make_receipt(2, '2024-03-05T10:00:01')], [])
+    index.add([make_receipt(3, '2024-03-05T10:00:02')], [])
+    index.add([make_receipt(4, '2024-03-05T10:00:02')], [])  # Same microsecond as r3
+
+    hits, cursor = index.search('milk', limit=2)
+    assert [hit['id'] for hit in hits] == ['r1', 'r4']
+
+    hits, cursor = index.search('milk', limit=2, cursor=cursor)
+    assert [hit['id'] for hit in hits] == ['r3', 'r2']
+    assert cursor is None
+
+
+def test_rebuild_keeps_upload_order(tmp_path):
+    index = SearchIndex(str(tmp_path / 'search.db'))
+    index.rebuild([make_receipt(1, '2024-03-05T10:00:03'), make_receipt(2, '2024-03-05T10:00:01'),
+                   make_receipt(3, '2024-03-05T10:00:02')], lambda receipt_ids: {})
+    index.add([make_receipt(4, '2024-03-05T10:00:02.5')], [])
+
+    hits, _ = index.search('milk')
+    assert [hit['id'] for hit in hits] == ['r1', 'r4', 'r3', 'r2']
+
+
+def test_index_missing_receipts_is_not_current(tmp_path):
+    index = SearchIndex(str(tmp_path / 'search.db'))
+    assert index.is_current(0)
+
+    index.add([make_receipt(1, '2024-03-05T10:00:01')], [])
+    assert index.is_current(1)
+    # Crash after the storage write, before indexing
+    assert not index.is_current(2)
+
+    index.rebuild([make_receipt(1, '2024-03-05T10:00:01'), make_receipt(2, '2024-03-05T10:00:02')],
+                  lambda receipt_ids: {})
+    assert index.is_current(2)
@@ -0,0 +1,18 @@
+def make_receipt(receipt_id, content_hash):
+    return {'id': receipt_id, 'uploaded_at': '2024-03-05T10:00:00', 'content_hash': content_hash,
+            'store': 'Fresh Mart', 'date': '2024-03-05', 'currency': 'USD', 'total_cents': 250,
+            'items': [{'name': 'Milk', 'price_cents': 250, 'category': 'groceries'}]}
+
+
+def test_skipped_duplicates_leave_no_ocr_text(app_module):
+    first = make_receipt('dup-first', 'hash-dup')
+    assert app_module.store_receipts([first], [('dup-first', 'MILK 2.50')]) == [first]
+
+    # Same image uploaded again under a new id: skipped, text dropped
+    assert app_module.store_receipts([make_receipt('dup-second', 'hash-dup')],
+                                     [('dup-second', 'MILK 2.50')]) == []
+    assert app_module.ocr_store.get('dup-second') is None
+
+    # Re-running the job of a stored receipt keeps its text
+    assert app_module.store_receipts([first], [('dup-first', 'MILK 2.50')]) == []
+    assert app_module.ocr_store.get('dup-first') == 'MILK 2.50'
@@ -0,0 +1,10 @@
+"""
+WSGI entry point for production servers.
+
+    gunicorn -c gunicorn.conf.py wsgi:app          (Linux/macOS)
+    waitress-serve --listen=0.0.0.0:5001 wsgi:app  (Windows)
+"""
+
+from app import app
+
+__all__ = ['app']
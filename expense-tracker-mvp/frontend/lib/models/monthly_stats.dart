@@ -3,6 +3,7 @@ class MonthlyStats {
   final int month;
   final int year;
   final double totalSpent;
+  final String currency;
   final int receiptCount;
   final List<CategorySpending> categories;
 
@@ -10,6 +11,7 @@ class MonthlyStats {
     required this.month,
     required this.year,
     required this.totalSpent,
+    this.currency = 'USD',
     required this.receiptCount,
     required this.categories,
   });
@@ -24,11 +26,15 @@ class MonthlyStats {
       month: json['month'] as int,
       year: json['year'] as int,
       totalSpent: (json['total_spent'] as num).toDouble(),
+      currency: json['currency'] as String? ?? 'USD',
       receiptCount: json['receipt_count'] as int,
       categories: categories,
     );
   }
 
+  /// Prefix for amounts ("\$" for USD, otherwise the currency code)
+  String get currencyPrefix => currency == 'USD' ? '\$' : '$currency ';
+
   /// Get month name (e.g., "January")
   String get monthName {
     const months = [
@@ -214,7 +214,7 @@ class _MonthlySummaryPageState extends State<MonthlySummaryPage> {
             ),
             const SizedBox(height: 8),
             Text(
-              '\$${_stats!.totalSpent.toStringAsFixed(2)}',
+              '${_stats!.currencyPrefix}${_stats!.totalSpent.toStringAsFixed(2)}',
               style: TextStyle(
                 fontSize: 36,
                 fontWeight: FontWeight.bold,
@@ -290,7 +290,7 @@ class _MonthlySummaryPageState extends State<MonthlySummaryPage> {
                           ],
                         ),
                         Text(
-                          '\$${category.amount.toStringAsFixed(2)}',
+                          '${_stats!.currencyPrefix}${category.amount.toStringAsFixed(2)}',
                           style: const TextStyle(
                             fontSize: 16,
                             fontWeight: FontWeight.bold,
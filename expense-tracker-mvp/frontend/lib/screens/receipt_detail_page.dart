@@ -153,6 +153,11 @@ class _ReceiptDetailPageState extends State<ReceiptDetailPage> {
 
           // Total card
           _buildTotalCard(),
+
+          const SizedBox(height: 16),
+
+          // Receipt image
+          _buildImageCard(),
         ],
       ),
     );
@@ -204,6 +209,40 @@ class _ReceiptDetailPageState extends State<ReceiptDetailPage> {
     );
   }
 
+  Widget _buildImageCard() {
+    return Card(
+      clipBehavior: Clip.antiAlias,
+      child: InkWell(
+        onTap: _showFullImage,
+        child: Image.network(
+          _apiService.receiptImageUrl(widget.receiptId, size: 'thumb'),
+          height: 200,
+          width: double.infinity,
+          fit: BoxFit.cover,
+          errorBuilder: (context, error, stackTrace) => const SizedBox.shrink(),
+        ),
+      ),
+    );
+  }
+
+  /// Show the full-size receipt image in a zoomable dialog
+  void _showFullImage() {
+    showDialog(
+      context: context,
+      builder: (context) => Dialog(
+        child: InteractiveViewer(
+          child: Image.network(
+            _apiService.receiptImageUrl(widget.receiptId),
+            errorBuilder: (context, error, stackTrace) => const Padding(
+              padding: EdgeInsets.all(24.0),
+              child: Text('Image not available'),
+            ),
+          ),
+        ),
+      ),
+    );
+  }
+
   Widget _buildItemsList() {
     final items = _receipt!.items ?? [];
 
@@ -10,9 +10,19 @@ class ApiService {
   // Change this to your backend server address
   static const String baseUrl = 'http://localhost:5001';
 
+  // Receipts synced so far and the change sequence they are current to.
+  // Shared by all screens, so a refresh only fetches what changed
+  static final Map<String, Receipt> _syncedReceipts = {};
+  static int _syncedSeq = 0;
+
+  // Last monthly stats and their ETag, reused while the server answers 304
+  static MonthlyStats? _cachedStats;
+  static String? _statsEtag;
+
   /// Upload a receipt image file
   ///
-  /// Returns the newly created Receipt with parsed data
+  /// Returns the newly created Receipt with parsed data (or the existing
+  /// Receipt if the same image was uploaded before)
   Future<Receipt> uploadReceipt(String filename, Uint8List fileBytes) async {
     try {
       final uri = Uri.parse('$baseUrl/receipt/upload');
@@ -33,7 +43,7 @@ class ApiService {
       final streamedResponse = await request.send();
       final response = await http.Response.fromStream(streamedResponse);
 
-      if (response.statusCode == 201) {
+      if (response.statusCode == 201 || response.statusCode == 200) {
         final json = jsonDecode(response.body) as Map<String, dynamic>;
         return Receipt.fromDetailJson(json);
       } else {
@@ -45,24 +55,92 @@ class ApiService {
     }
   }
 
-  /// Get list of all receipts
+  /// Upload several receipt image files in one request
   ///
-  /// Returns simplified receipt data (without full item lists)
-  Future<List<Receipt>> getReceipts() async {
+  /// Returns the Receipts that were processed successfully (including
+  /// existing receipts for duplicate images); files that failed are skipped (the backend reports them per file)
+  Future<List<Receipt>> uploadReceiptBatch(Map<String, Uint8List> files) async {
     try {
-      final response = await http.get(
-        Uri.parse('$baseUrl/receipts'),
-      );
+      final uri = Uri.parse('$baseUrl/receipts/batch');
+
+      // Create multipart request with one 'files' part per image
+      final request = http.MultipartRequest('POST', uri);
+      files.forEach((filename, fileBytes) {
+        request.files.add(
+          http.MultipartFile.fromBytes(
+            'files',
+            fileBytes,
+            filename: filename,
+          ),
+        );
+      });
+
+      // Send request
+      final streamedResponse = await request.send();
+      final response = await http.Response.fromStream(streamedResponse);
 
       if (response.statusCode == 200) {
-        final List<dynamic> jsonList = jsonDecode(response.body) as List;
-        return jsonList
-            .map((json) => Receipt.fromJson(json as Map<String, dynamic>))
+        final json = jsonDecode(response.body) as Map<String, dynamic>;
+        final results = json['results'] as List<dynamic>;
+        return results
+            .map((result) => result as Map<String, dynamic>)
+            .where((result) => result['status'] == 201 || result['status'] == 200)
+            .map((result) =>
+                Receipt.fromDetailJson(result['receipt'] as Map<String, dynamic>))
             .toList();
       } else {
         final error = jsonDecode(response.body);
-        throw Exception(error['error'] ?? 'Failed to load receipts');
+        throw Exception(error['error'] ?? 'Batch upload failed');
+      }
+    } catch (e) {
+      throw Exception('Failed to upload receipts: $e');
+    }
+  }
+
+  /// Get list of all receipts
+  ///
+  /// Returns simplified receipt data (without full item lists), newest
+  /// first. The first call downloads every receipt; later calls only fetch
+  /// receipts created, updated or deleted since the previous call.
+  Future<List<Receipt>> getReceipts() async {
+    try {
+      var hasMore = true;
+      while (hasMore) {
+        final response = await http.get(
+          Uri.parse('$baseUrl/receipts/changes?since=$_syncedSeq'),
+        );
+
+        if (response.statusCode == 410) {
+          // The server's data was reset: sync again from the start
+          _syncedReceipts.clear();
+          _syncedSeq = 0;
+          continue;
+        } else if (response.statusCode != 200) {
+          final error = jsonDecode(response.body);
+          throw Exception(error['error'] ?? 'Failed to load receipts');
+        }
+
+        final json = jsonDecode(response.body) as Map<String, dynamic>;
+        for (final change in json['changes'] as List<dynamic>) {
+          final changeJson = change as Map<String, dynamic>;
+          if (changeJson['op'] == 'deleted') {
+            _syncedReceipts.remove(changeJson['id']);
+          } else {
+            final receipt =
+                Receipt.fromJson(changeJson['receipt'] as Map<String, dynamic>);
+            _syncedReceipts[receipt.id] = receipt;
+          }
+        }
+        _syncedSeq = json['next_since'] as int;
+        hasMore = json['has_more'] as bool;
       }
+
+      // Same order as GET /receipts: newest upload first
+      return _syncedReceipts.values.toList()
+        ..sort((a, b) {
+          final byUpload = b.uploadedAt.compareTo(a.uploadedAt);
+          return byUpload != 0 ? byUpload : b.id.compareTo(a.id);
+        });
     } catch (e) {
       throw Exception('Failed to load receipts: $e');
     }
@@ -91,18 +169,33 @@ class ApiService {
     }
   }
 
+  /// URL of a receipt's stored image
+  ///
+  /// [size] is 'thumb' for the small list thumbnail or 'full' for the
+  /// working copy. Responses are cacheable, so image widgets can load them
+  /// repeatedly at no cost.
+  String receiptImageUrl(String receiptId, {String size = 'full'}) {
+    return '$baseUrl/receipts/$receiptId/image?size=$size';
+  }
+
   /// Get monthly spending statistics
   ///
-  /// Returns statistics for the current month
+  /// Returns statistics for the current month. The previous response is
+  /// revalidated with its ETag and reused if nothing changed (304).
   Future<MonthlyStats> getMonthlyStats() async {
     try {
       final response = await http.get(
         Uri.parse('$baseUrl/stats/month'),
+        headers: {if (_statsEtag != null) 'If-None-Match': _statsEtag!},
       );
 
-      if (response.statusCode == 200) {
+      if (response.statusCode == 304 && _cachedStats != null) {
+        return _cachedStats!;
+      } else if (response.statusCode == 200) {
         final json = jsonDecode(response.body) as Map<String, dynamic>;
-        return MonthlyStats.fromJson(json);
+        _cachedStats = MonthlyStats.fromJson(json);
+        _statsEtag = response.headers['etag'];
+        return _cachedStats!;
       } else {
         final error = jsonDecode(response.body);
         throw Exception(error['error'] ?? 'Failed to load stats');